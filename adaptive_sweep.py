@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Adaptive thickness x energy sweeps.
+
+Instead of a dense uniform grid, the sweep starts from a Latin hypercube
+over (thickness, log10 energy) and then spends its remaining run budget
+where the observables change fastest or are least certain:
+
+    hits_per_e     total hits per primary electron
+    width          RMS distance of hits from the beam axis (cells)
+    central        fraction of hits in the central cell
+
+Each candidate point is scored by how much these observables vary across
+its nearest measured neighbours, times its distance to the closest measured
+point (so batches do not pile up), plus the neighbours' statistical error.
+The best points go to the queue as one batch (through sim_service, so a
+running shared service is used), and this repeats until the budget is spent.
+Stored runs inside the range are reused as free samples.
+
+    python3 adaptive_sweep.py --thickness 0.1 10 --energy 0.1 100 --budget 60 -o sweep.csv
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+
+import sim_runner
+import sim_service
+from hitmap import HitMap
+from visualize_results import collect_files
+
+OBSERVABLES = ("hits_per_e", "width", "central")
+N_CANDIDATES = 2000
+K_NEIGHBOURS = 5
+EXPLORE = 0.05          # keeps filling empty space where observables look flat
+UNCERTAINTY_WEIGHT = 1.0
+
+
+def observables(hitmap, electrons):
+    """Observable values and their 1-sigma statistical errors for one run."""
+    total = hitmap.sum()
+    if total == 0:
+        return np.zeros(3), np.full(3, np.inf)
+    x, y, h = hitmap.x(), hitmap.y(), hitmap.hits
+    r2 = (x ** 2 + y ** 2) * h
+    width = math.sqrt(r2.sum() / total)
+    central = float(h[(x == 0) & (y == 0)].sum()) / total
+    values = np.array([total / electrons, width, central])
+    errors = np.array([
+        math.sqrt(total) / electrons,
+        width / math.sqrt(2 * total),
+        math.sqrt(max(central * (1 - central), 1.0 / total) / total),
+    ])
+    return values, errors
+
+
+def latin_hypercube(n, dims, rng):
+    """n points in [0, 1)^dims with exactly one point per 1/n slice of every axis."""
+    u = (rng.random((n, dims)) + np.arange(n)[:, None]) / n
+    for d in range(dims):
+        u[:, d] = rng.permutation(u[:, d])
+    return u
+
+
+class AdaptiveSweep:
+    def __init__(self, thickness_range, energy_range, electrons, seed=None):
+        self.t_lo, self.t_hi = thickness_range
+        self.le_lo, self.le_hi = (math.log10(e) for e in energy_range)
+        self.electrons = int(electrons)
+        self.rng = np.random.default_rng(seed)
+        self.points = []        # unit-square coordinates of measured runs
+        self.values = []
+        self.errors = []
+        self.rows = []          # output table
+
+    # --- coordinates ---------------------------------------------------
+    def to_params(self, u):
+        thickness = self.t_lo + u[0] * (self.t_hi - self.t_lo)
+        energy = 10 ** (self.le_lo + u[1] * (self.le_hi - self.le_lo))
+        return thickness, energy
+
+    def to_unit(self, thickness, energy):
+        def scale(v, lo, hi):
+            return (v - lo) / (hi - lo) if hi > lo else 0.5
+        return np.array([scale(thickness, self.t_lo, self.t_hi),
+                         scale(math.log10(energy), self.le_lo, self.le_hi)])
+
+    # --- samples -------------------------------------------------------
+    def add(self, csv_file, thickness, energy, electrons, source):
+        hitmap = HitMap.from_csv(csv_file)
+        values, errors = observables(hitmap, electrons)
+        self.points.append(self.to_unit(thickness, energy))
+        self.values.append(values)
+        self.errors.append(errors)
+        row = {"file": csv_file, "source": source, "thickness_cm": thickness,
+               "energy_gev": energy, "electrons": electrons}
+        row.update(zip(OBSERVABLES, values))
+        row.update({f"{k}_err": e for k, e in zip(OBSERVABLES, errors)})
+        self.rows.append(row)
+
+    def reuse(self, patterns):
+        """Take stored runs that fall inside the sweep range as free samples."""
+        used = 0
+        for csv_file in collect_files(patterns, archived=True):
+            meta = sim_runner.read_metadata(csv_file)
+            if not meta:
+                continue
+            try:
+                thickness = sim_runner.parse_quantity(meta["thickness"], sim_runner.LENGTH_UNITS)
+                energy = sim_runner.parse_quantity(meta["energy"], sim_runner.ENERGY_UNITS)
+                u = self.to_unit(thickness, energy)
+                if np.all((u >= 0) & (u <= 1)):
+                    self.add(csv_file, thickness, energy, int(meta["electrons"]), "stored")
+                    used += 1
+            except (ValueError, KeyError, OSError):
+                continue
+        return used
+
+    # --- design ----------------------------------------------------------
+    def next_batch(self, n):
+        """Unit-square points for the next batch, most informative first."""
+        pts = np.array(self.points)
+        vals = np.array(self.values)
+        errs = np.array(self.errors)
+        # Observables live on different scales; compare them in units of their spread
+        spread = vals.max(axis=0) - vals.min(axis=0)
+        spread[spread == 0] = 1.0
+        vals, errs = vals / spread, np.minimum(errs / spread, 1.0)
+
+        cand = self.rng.random((N_CANDIDATES, 2))
+        d = np.linalg.norm(cand[:, None, :] - pts[None, :, :], axis=2)     # (C, N)
+        k = min(K_NEIGHBOURS, len(pts))
+        nb = np.argsort(d, axis=1)[:, :k]
+        variation = (vals[nb].max(axis=1) - vals[nb].min(axis=1)).max(axis=1)
+        uncertainty = errs[nb].mean(axis=(1, 2))
+
+        # Greedy: each pick counts as measured for the distance term of the next
+        d_min = d.min(axis=1)
+        chosen = []
+        for _ in range(n):
+            score = d_min * (variation + EXPLORE + UNCERTAINTY_WEIGHT * uncertainty)
+            best = int(np.argmax(score))
+            chosen.append(cand[best])
+            d_min = np.minimum(d_min, np.linalg.norm(cand - cand[best], axis=1))
+        return chosen
+
+    # --- running -----------------------------------------------------------
+    def run_batch(self, units, source, log):
+        tasks = []
+        for u in units:
+            thickness, energy = self.to_params(u)
+            tasks.append({
+                "id": len(self.rows) + len(tasks) + 1,
+                "thickness": f"{thickness:.4g} cm",
+                "energy": f"{energy:.4g} GeV",
+                "electrons": str(self.electrons),
+                "svg": False,
+            })
+        sim_service.run_tasks(tasks, progress=lambda i, state: None, log=log)
+
+        done = 0
+        for task in tasks:
+            if not task.get("csv"):
+                continue
+            thickness = sim_runner.parse_quantity(task["thickness"], sim_runner.LENGTH_UNITS)
+            energy = sim_runner.parse_quantity(task["energy"], sim_runner.ENERGY_UNITS)
+            self.add(task["csv"][-1], thickness, energy, self.electrons, source)
+            done += 1
+        return len(tasks), done
+
+    def run(self, budget, initial, batch, log=print):
+        """Spend `budget` new runs: a Latin hypercube of `initial`, then adaptive batches."""
+        start = time.time()
+        spent = 0
+        if len(self.points) < initial:
+            n = min(budget, initial - len(self.points))
+            log(f"🧭 Initial Latin hypercube: {n} points")
+            submitted, _ = self.run_batch(latin_hypercube(n, 2, self.rng), "lhs", log)
+            spent += submitted
+
+        round_no = 1
+        while spent < budget and len(self.points) >= 2:
+            n = min(batch, budget - spent)
+            log(f"🧭 Adaptive batch {round_no}: {n} points ({spent}/{budget} runs used)")
+            submitted, done = self.run_batch(self.next_batch(n), f"adaptive{round_no}", log)
+            spent += submitted
+            round_no += 1
+            if done == 0:
+                log("⚠️  No run in this batch produced a result, stopping")
+                break
+
+        log(f"🏁 Sweep finished: {spent} new runs, {len(self.points)} samples, {time.time() - start:.0f} s")
+        return spent
+
+    def write_csv(self, output):
+        fields = ["thickness_cm", "energy_gev", "electrons", *OBSERVABLES,
+                  *(f"{k}_err" for k in OBSERVABLES), "source", "file"]
+        rows = sorted(self.rows, key=lambda r: (r["energy_gev"], r["thickness_cm"]))
+        with open(output, "w") as f:
+            f.write(",".join(fields) + "\n")
+            for row in rows:
+                f.write(",".join(f"{row[k]:.6g}" if isinstance(row[k], float) else str(row[k])
+                                 for k in fields) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Adaptive thickness x energy sweep')
+    parser.add_argument('--thickness', nargs=2, type=float, required=True, metavar=('MIN', 'MAX'),
+                        help='Thickness range in cm')
+    parser.add_argument('--energy', nargs=2, type=float, required=True, metavar=('MIN', 'MAX'),
+                        help='Energy range in GeV (sampled in log scale)')
+    parser.add_argument('--electrons', type=int, default=1000, help='Electrons per run')
+    parser.add_argument('--budget', type=int, default=40, help='Most new runs to spend')
+    parser.add_argument('--initial', type=int, default=10, help='Latin hypercube size')
+    parser.add_argument('--batch', type=int, default=6, help='Points per adaptive batch')
+    parser.add_argument('--reuse', nargs='*', default=['.'],
+                        help='Results to reuse as samples (default: .; pass nothing to disable)')
+    parser.add_argument('--seed', type=int, help='Random seed of the design')
+    parser.add_argument('-o', '--output', default='sweep.csv', help='Table of all samples')
+
+    args = parser.parse_args()
+
+    sweep = AdaptiveSweep(args.thickness, args.energy, args.electrons, args.seed)
+    if args.reuse:
+        print(f"♻️  Reusing {sweep.reuse(args.reuse)} stored run(s) inside the range")
+    sweep.run(args.budget, args.initial, args.batch)
+    sweep.write_csv(args.output)
+    print(f"✅ Sweep table saved to: {args.output} ({len(sweep.rows)} samples)")
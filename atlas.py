@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Multi-run atlas: many result files laid out as small multiples on ONE shared
+log colour scale, so a whole sweep can be compared at a glance.
+
+    python3 atlas.py results_*.csv -o sweep.pdf      # multi-page PDF
+    python3 atlas.py results_*.csv -o sweep.png      # one tiled PNG
+
+All grids are packed into a single shared-memory block. Pages are rasterised
+by a process pool that attaches to that block by name (no pickled copies of
+the grids) and draws straight into a second shared block holding the page
+pixels, which the parent then writes out.
+"""
+import argparse
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from visualize_results import collect_files, load_grid
+
+GRID_SIZE = 21
+TILE_INCHES = 1.6
+DPI = 100
+
+# Worker-side handles, filled once per process by _init_worker
+_grids = None
+_pages = None
+_shm_handles = []
+
+
+def page_shape(rows, cols):
+    """Pixel size (height, width) of one rendered page."""
+    width_in, height_in = _page_inches(rows, cols)
+    return int(round(height_in * DPI)), int(round(width_in * DPI))
+
+
+def _page_inches(rows, cols):
+    # Extra column-width on the right holds the shared colour bar
+    return cols * TILE_INCHES + 1.0, rows * TILE_INCHES + 0.6
+
+
+def _init_worker(grid_name, grid_shape, page_name, page_shape_):
+    global _grids, _pages
+    import matplotlib
+    matplotlib.use("Agg")
+
+    grid_shm = shared_memory.SharedMemory(name=grid_name)
+    page_shm = shared_memory.SharedMemory(name=page_name)
+    _shm_handles.extend([grid_shm, page_shm])  # keep mappings alive
+
+    _grids = np.ndarray(grid_shape, dtype=np.float64, buffer=grid_shm.buf)
+    _pages = np.ndarray(page_shape_, dtype=np.uint8, buffer=page_shm.buf)
+
+
+def _render_page(page_idx, first, labels, rows, cols, vmin, vmax, title):
+    """Draw one page of tiles into its slot of the shared page buffer."""
+    import matplotlib.pyplot as plt
+    from matplotlib.colors import LogNorm
+
+    norm = LogNorm(vmin=vmin, vmax=vmax)
+    fig, axes = plt.subplots(rows, cols, figsize=_page_inches(rows, cols), dpi=DPI,
+                             squeeze=False, gridspec_kw={"right": 1 - 1.0 / (cols * TILE_INCHES + 1.0)})
+    image = None
+
+    for k, ax in enumerate(axes.flat):
+        ax.set_xticks([])
+        ax.set_yticks([])
+        idx = first + k
+        if k >= len(labels):
+            ax.axis("off")
+            continue
+
+        grid = _grids[idx]
+        image = ax.imshow(np.ma.masked_equal(grid, 0), cmap="OrRd", norm=norm,
+                          interpolation="nearest")
+        ax.set_facecolor("white")
+        ax.set_title(labels[k], fontsize=6, color="#444444", pad=2)
+
+    if image is not None:
+        cax = fig.add_axes([1 - 0.8 / (cols * TILE_INCHES + 1.0), 0.1, 0.02, 0.8])
+        fig.colorbar(image, cax=cax, label="Hits (Log Scale)")
+
+    fig.suptitle(title, fontsize=9, color="#222222")
+    fig.canvas.draw()
+    rgba = np.asarray(fig.canvas.buffer_rgba())
+    plt.close(fig)
+
+    h, w = _pages.shape[1:3]
+    _pages[page_idx] = rgba[:h, :w]
+    return page_idx
+
+
+def load_grids(files):
+    """Load every file into a (N, 21, 21) block and per-file labels."""
+    grids = np.zeros((len(files), GRID_SIZE, GRID_SIZE))
+    labels = []
+    for i, filename in enumerate(files):
+        grid, total = load_grid(filename)
+        if grid.shape != grids.shape[1:]:
+            raise ValueError(f"{filename}: {grid.shape[1]}x{grid.shape[0]} grid, atlas expects {GRID_SIZE}x{GRID_SIZE}")
+        grids[i] = grid
+        stem = os.path.splitext(os.path.basename(filename))[0]
+        labels.append(f"{stem}\nΣ={total}")
+    return grids, labels
+
+
+def render_atlas(files, output, rows=6, cols=6, workers=None, title=None):
+    start = time.time()
+    if not files:
+        raise ValueError("No result files to render")
+
+    grids, labels = load_grids(files)
+    positive = grids[grids > 0]
+    vmin = float(positive.min()) if positive.size else 1.0
+    vmax = float(positive.max()) if positive.size else 10.0
+    if vmax <= vmin:
+        vmax = vmin * 10
+
+    per_page = rows * cols
+    n_pages = math.ceil(len(files) / per_page)
+    h, w = page_shape(rows, cols)
+    pages_shape = (n_pages, h, w, 4)
+    title = title or f"Shower Atlas • {len(files)} runs • shared log scale [{vmin:g}, {vmax:g}]"
+
+    grid_shm = shared_memory.SharedMemory(create=True, size=grids.nbytes)
+    page_shm = shared_memory.SharedMemory(create=True, size=int(np.prod(pages_shape)))
+    try:
+        np.ndarray(grids.shape, dtype=grids.dtype, buffer=grid_shm.buf)[:] = grids
+        pages = np.ndarray(pages_shape, dtype=np.uint8, buffer=page_shm.buf)
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(grid_shm.name, grids.shape, page_shm.name, pages_shape)) as pool:
+            futures = []
+            for p in range(n_pages):
+                first = p * per_page
+                page_title = f"{title} • page {p + 1}/{n_pages}"
+                futures.append(pool.submit(_render_page, p, first, labels[first:first + per_page],
+                                           rows, cols, vmin, vmax, page_title))
+            for fut in futures:
+                fut.result()
+
+        _write_output(pages, output)
+        del pages
+    finally:
+        grid_shm.close()
+        grid_shm.unlink()
+        page_shm.close()
+        page_shm.unlink()
+
+    elapsed = time.time() - start
+    print(f"✅ Atlas saved to: {output} ({len(files)} runs, {n_pages} page(s), {elapsed:.1f} s)")
+    return output
+
+
+def _write_output(pages, output):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    if output.lower().endswith(".pdf"):
+        from matplotlib.backends.backend_pdf import PdfPages
+        h, w = pages.shape[1:3]
+        with PdfPages(output) as pdf:
+            for page in pages:
+                fig = plt.figure(figsize=(w / DPI, h / DPI), dpi=DPI)
+                fig.figimage(page, resize=False)
+                pdf.savefig(fig, dpi=DPI)
+                plt.close(fig)
+    else:
+        # Tiled PNG: pages stacked top to bottom
+        plt.imsave(output, np.concatenate(list(pages), axis=0))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Render many results as an atlas on a common colour scale')
+    parser.add_argument('files', nargs='+', help='CSV files, globs or directories')
+    parser.add_argument('-o', '--output', default='atlas.pdf', help='Output .pdf (multi-page) or .png (tiled)')
+    parser.add_argument('--rows', type=int, default=6, help='Tile rows per page')
+    parser.add_argument('--cols', type=int, default=6, help='Tile columns per page')
+    parser.add_argument('--workers', type=int, default=None, help='Render processes (default: all cores)')
+    parser.add_argument('--title', help='Page title')
+
+    args = parser.parse_args()
+
+    render_atlas(collect_files(args.files, archived=True), args.output, args.rows, args.cols, args.workers, args.title)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Auto-tuner for processes-per-node vs. Geant4 threads-per-process.
+
+A few (processes x threads) splits of the host's cores are probed with a short
+calibration run; the split with the best events/sec whose combined resident
+memory still fits in the machine is kept. The choice is cached per host in
+~/.cache/bl4s-g4/autotune.json and re-tuned when the GeantSim binary changes.
+
+    python3 autotune.py            # show (and tune if needed)
+    python3 autotune.py --force    # re-tune now
+"""
+import argparse
+import hashlib
+import json
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import sim_runner
+
+CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "bl4s-g4", "autotune.json")
+CALIBRATION_TASK = {"id": "calib", "thickness": "1 cm", "energy": "1 GeV"}
+EVENTS_PER_THREAD = 200
+MEMORY_FRACTION = 0.8  # never plan to use more than this share of physical RAM
+
+
+def binary_fingerprint(binary):
+    """Content hash of the binary, so a rebuild invalidates the cached tuning."""
+    h = hashlib.sha256()
+    with open(binary, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+def total_memory_mb():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def candidate_splits(cores):
+    """
+    (processes, threads) pairs that fill the cores exactly, one per divisor
+    of the core count (6 cores -> 6 x 1, 3 x 2, 2 x 3, 1 x 6), so no
+    candidate leaves cores idle or oversubscribes them.
+    """
+    return sorted((cores // t, t) for t in range(1, cores + 1) if cores % t == 0)
+
+
+def probe(binary, processes, threads, events_per_thread=EVENTS_PER_THREAD):
+    """Run `processes` concurrent calibration jobs with `threads` threads each."""
+    task = dict(CALIBRATION_TASK, electrons=str(events_per_thread * threads))
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=processes) as pool:
+        results = list(pool.map(
+            lambda _: sim_runner.run_task(task, binary=binary, threads=threads, keep_output=False),
+            range(processes)))
+    wall = time.time() - start
+
+    if not all(r["ok"] for r in results):
+        return None
+
+    return {
+        "processes": processes,
+        "threads": threads,
+        "events_per_sec": processes * events_per_thread * threads / wall,
+        "rss_mb": sum(r["rss_mb"] for r in results),
+    }
+
+
+def load_cache():
+    try:
+        with open(CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache):
+    os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+    tmp = CACHE_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp, CACHE_FILE)
+
+
+def tune(binary=None, log=print, events_per_thread=EVENTS_PER_THREAD):
+    binary = binary or sim_runner.GEANTSIM
+    cores = os.cpu_count() or 1
+    mem_limit = (total_memory_mb() or float("inf")) * MEMORY_FRACTION
+
+    probes = []
+    for processes, threads in candidate_splits(cores):
+        log(f"⏱️  Probing {processes} process(es) x {threads} thread(s)...")
+        p = probe(binary, processes, threads, events_per_thread)
+        if p is None:
+            log("   ↳ calibration run failed, skipped")
+            continue
+        log(f"   ↳ {p['events_per_sec']:.1f} events/s, {p['rss_mb']:.0f} MB")
+        probes.append(p)
+
+    fitting = [p for p in probes if p["rss_mb"] <= mem_limit] or probes
+    if not fitting:
+        raise RuntimeError("No calibration run succeeded")
+    best = max(fitting, key=lambda p: p["events_per_sec"])
+
+    return {
+        "binary": os.path.abspath(binary),
+        "fingerprint": binary_fingerprint(binary),
+        "cores": cores,
+        "processes": best["processes"],
+        "threads": best["threads"],
+        "events_per_sec": best["events_per_sec"],
+        "rss_mb": best["rss_mb"],
+        "probes": probes,
+        "tuned_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def get_config(binary=None, force=False, log=print):
+    """
+    Return the cached tuning for this host and binary, re-tuning if the
+    binary changed, the core count changed, or force is set.
+    """
+    binary = binary or sim_runner.GEANTSIM
+    host = socket.gethostname()
+    cache = load_cache()
+    entry = cache.get(host)
+
+    if (not force and entry
+            and entry.get("fingerprint") == binary_fingerprint(binary)
+            and entry.get("cores") == os.cpu_count()):
+        return entry
+
+    log("🔧 Auto-tuning processes x threads for this host...")
+    entry = tune(binary, log=log)
+    cache[host] = entry
+    save_cache(cache)
+    log(f"🔧 Selected {entry['processes']} process(es) x {entry['threads']} thread(s)")
+    return entry
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Tune GeantSim processes vs. threads for this host')
+    parser.add_argument('--binary', default=sim_runner.GEANTSIM, help='Path to GeantSim')
+    parser.add_argument('--force', action='store_true', help='Re-tune even if a cached result exists')
+
+    args = parser.parse_args()
+
+    cfg = get_config(args.binary, force=args.force)
+    print(json.dumps({k: cfg[k] for k in ("processes", "threads", "events_per_sec", "rss_mb", "tuned_at")}, indent=2))
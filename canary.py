@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Upgrade canary for GeantSim.
+
+After a rebuild (new Geant4, PhysicsList change, different compile flags),
+the canary runs a small reference sweep over thickness and energy with the
+old and the new binary side by side. Both binaries get the same
+/random/setSeeds and run at the same time, so they share the machine's
+load. For every point it reports events/s (from the event loop time the
+run prints itself), initialisation time (a `/run/beamOn 0` run) and peak
+RSS, and it tests whether the hit maps differ
+by more than their statistical noise:
+
+    chi2 = sum over cells of (old - new)^2 / (var_old + var_new)
+
+and whether the total hits moved, by z = (new - old) / sqrt(V_old + V_new).
+Shower counts are over-dispersed, so the variances are not the counts: the
+reference points run with the per-event stream and take each cell's and the
+total's variance from the spread between events. A binary without the
+stream borrows the other side's variance, and Poisson is the last resort.
+Either test beyond ALPHA / points is flagged as drift. Throughput drops past
+SLOWDOWN and RSS growth past RSS_GROWTH are flagged too. Event loops shorter
+than MIN_LOOP_S are too noisy to time and show no events/s.
+
+compile_sim.sh keeps the previous binary as build/GeantSim.prev. When there
+is none, the new binary is compared with the baseline stored by the last
+canary on this host (~/.cache/bl4s-g4/canary.json). Each canary stores its
+new results as the next baseline.
+
+    python3 canary.py                        # build/GeantSim.prev vs build/GeantSim
+    python3 canary.py --old /opt/GeantSim-11.1 --new build/GeantSim
+    python3 canary.py --baseline             # new binary vs the stored baseline
+"""
+import argparse
+import json
+import math
+import os
+import re
+import socket
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import autotune
+import sim_runner
+from event_stream import EventStream, stream_path
+from hitmap import HitMap
+
+BASELINE_FILE = os.path.join(os.path.dirname(autotune.CACHE_FILE), "canary.json")
+PREVIOUS_BINARY = sim_runner.GEANTSIM + ".prev"
+THICKNESSES = ("0.5 cm", "2 cm", "5 cm")
+ENERGIES = ("0.5 GeV", "2 GeV")
+EVENTS = 2000
+THREADS = 1
+SEEDS = (12345, 67890)      # point k uses (SEEDS[0] + k, SEEDS[1] + k)
+ALPHA = 0.001               # false-alarm rate of the drift test over the whole sweep
+SLOWDOWN = 0.10             # flag a throughput drop beyond this fraction
+RSS_GROWTH = 0.20           # flag peak memory growth beyond this fraction
+MIN_LOOP_S = 1.0            # shorter event loops get no events/s
+
+LOOP_RE = re.compile(r"Event loop time:\s*([0-9.eE+-]+)\s*s")
+
+
+def reference_sweep(events=EVENTS):
+    points = []
+    for t in THICKNESSES:
+        for e in ENERGIES:
+            k = len(points)
+            points.append({"thickness": t, "energy": e, "electrons": events,
+                           "seeds": [SEEDS[0] + k, SEEDS[1] + k]})
+    return points
+
+
+def measure(binary, point, threads=THREADS):
+    """
+    Init time, events/s, peak RSS and the hit map of one reference point, as
+    [x, y, hits, variance] per cell plus the total's variance (None for a
+    binary that cannot write the per-event stream).
+    """
+    task = {"id": "canary", "thickness": point["thickness"], "energy": point["energy"],
+            "electrons": str(point["electrons"]), "event_stream": True}
+    seeds = point["seeds"]
+    tag = f"canary-{os.path.basename(binary)}"
+
+    init = sim_runner.run_macro(sim_runner.build_group_macro([dict(task, electrons="0")], threads, seeds),
+                                tag=tag, binary=binary, keep_output=False)
+    os.makedirs(sim_runner.SCRATCH_DIR, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix="canary_", dir=sim_runner.SCRATCH_DIR) as out:
+        full = sim_runner.run_macro(sim_runner.build_group_macro([task], threads, seeds),
+                                    tag=tag, binary=binary, results_dir=out)
+        if init["ok"] and not (full["ok"] and full["csv"]):
+            # Binaries older than /BFS/output/eventStream stop at the unknown command
+            full = sim_runner.run_macro(sim_runner.build_group_macro([dict(task, event_stream=False)],
+                                                                     threads, seeds),
+                                        tag=tag, binary=binary, results_dir=out)
+        if not (init["ok"] and full["ok"] and full["csv"]):
+            failed = full if init["ok"] else init
+            return {"ok": False, "error": (failed["stderr_tail"] or failed["stdout_tail"]).strip()[-300:]}
+        hm = HitMap.from_csv(full["csv"][0], sim_runner.GRID)
+        stream = stream_path(full["csv"][0])
+        if os.path.exists(stream):
+            es = EventStream(stream)
+            cell_var, total_var = es.sum_variance()
+            var = [float(cell_var[y - es.y0, x - es.x0]) for x, y in zip(hm.x(), hm.y())]
+        else:
+            var, total_var = [None] * len(hm.hits), None
+
+    rate, timing = events_per_sec(point["electrons"], full, init)
+    return {
+        "ok": True,
+        "init_s": init["elapsed"],
+        "events_per_sec": rate,
+        "timing": timing,
+        "rss_mb": max(full["rss_mb"] or 0, init["rss_mb"] or 0) or None,
+        "hits": [[int(x), int(y), int(h), v] for x, y, h, v in zip(hm.x(), hm.y(), hm.hits, var)],
+        "total_var": total_var,
+    }
+
+
+def events_per_sec(events, full, init):
+    """
+    (events/s, how it was timed) for the event loop; events/s is None if it
+    cannot be timed reliably. Binaries that do not print their event loop
+    time fall back to the difference of the two runs' wall times ("wall"),
+    if it clearly exceeds start-up.
+    """
+    loop = [float(m) for line in full["kept"] for m in LOOP_RE.findall(line)]
+    if loop:
+        run_s, timing = loop[-1], "loop"
+    else:
+        run_s, timing = full["elapsed"] - init["elapsed"], "wall"
+        if run_s < init["elapsed"]:
+            return None, timing
+    return (events / run_s if run_s >= MIN_LOOP_S else None), timing
+
+
+# ==================================================
+# Comparison
+# ==================================================
+def chi2_sf(chi2, ndf):
+    """Upper-tail chi-square probability (Wilson-Hilferty normal approximation)."""
+    if ndf <= 0:
+        return 1.0
+    z = ((chi2 / ndf) ** (1.0 / 3.0) - (1 - 2.0 / (9 * ndf))) / math.sqrt(2.0 / (9 * ndf))
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def two_sided_z(alpha):
+    """|z| with a two-sided normal tail probability of alpha (bisection on erfc)."""
+    lo, hi = 0.0, 40.0
+    for _ in range(100):
+        mid = (lo + hi) / 2
+        if math.erfc(mid / math.sqrt(2)) > alpha:
+            lo = mid
+        else:
+            hi = mid
+    return hi
+
+
+def pooled_variance(n_a, n_b, var_a, var_b):
+    """
+    Variance of n_a - n_b. A side without a measured variance borrows the
+    other's (equal exposure, same under the null); Poisson if neither has one.
+    """
+    if var_a is None and var_b is None:
+        return n_a + n_b
+    if var_a is None or var_b is None:
+        return 2 * (var_b if var_a is None else var_a)
+    return var_a + var_b
+
+
+def map_drift(old, new):
+    """chi2, ndf, p-value and the total-hits z-score between two results of equal exposure."""
+    # Baselines from before the variances were stored have [x, y, hits]
+    a = {(h[0], h[1]): (h[2], h[3] if len(h) > 3 else None) for h in old["hits"]}
+    b = {(h[0], h[1]): (h[2], h[3] if len(h) > 3 else None) for h in new["hits"]}
+    # An unhit cell has no spread between events
+    empty_a = 0.0 if old.get("total_var") is not None else None
+    empty_b = 0.0 if new.get("total_var") is not None else None
+    chi2, ndf = 0.0, 0
+    for cell in a.keys() | b.keys():
+        n_a, var_a = a.get(cell, (0, empty_a))
+        n_b, var_b = b.get(cell, (0, empty_b))
+        var = pooled_variance(n_a, n_b, var_a, var_b)
+        if var > 0:
+            chi2 += (n_a - n_b) ** 2 / var
+            ndf += 1
+    t_a = sum(n for n, _ in a.values())
+    t_b = sum(n for n, _ in b.values())
+    var = pooled_variance(t_a, t_b, old.get("total_var"), new.get("total_var"))
+    z = (t_b - t_a) / math.sqrt(var) if var > 0 else 0.0
+    return {"chi2": chi2, "ndf": ndf, "p": chi2_sf(chi2, ndf), "total_z": z,
+            "identical": {k: n for k, (n, _) in a.items()} == {k: n for k, (n, _) in b.items()}}
+
+
+def throughput_comparable(o, n):
+    """Both sides timed, and the same way (loop time vs wall-time difference)."""
+    return bool(o["events_per_sec"] and n["events_per_sec"]) and o.get("timing") == n.get("timing")
+
+
+def compare(points, old, new):
+    """Flags per point: list of (point, old, new, drift, flags)."""
+    alpha = ALPHA / max(len(points), 1)
+    z_crit = two_sided_z(alpha)
+    rows = []
+    for point, o, n in zip(points, old, new):
+        flags, drift = [], None
+        if not o["ok"] or not n["ok"]:
+            flags.append("FAILED")
+        else:
+            drift = map_drift(o, n)
+            if drift["p"] < alpha or abs(drift["total_z"]) > z_crit:
+                flags.append("DRIFT")
+            if not throughput_comparable(o, n):
+                # Shown as "–" in the report
+                o, n = dict(o, events_per_sec=None), dict(n, events_per_sec=None)
+            elif n["events_per_sec"] < (1 - SLOWDOWN) * o["events_per_sec"]:
+                flags.append("SLOWER")
+            if o["rss_mb"] and n["rss_mb"] and n["rss_mb"] > (1 + RSS_GROWTH) * o["rss_mb"]:
+                flags.append("RSS")
+        rows.append((point, o, n, drift, flags))
+    return rows
+
+
+def print_report(rows, old_label, new_label):
+    print(f"\nold: {old_label}\nnew: {new_label}\n")
+    print(f"{'point':>16} {'events/s old → new':>26} {'init s old → new':>20} "
+          f"{'RSS MB old → new':>20} {'chi2/ndf':>9} {'p':>8} {'total z':>8}  verdict")
+
+    def pair(o, n, fmt):
+        if o is None or n is None:
+            return "–"
+        change = f" ({100 * (n - o) / o:+.0f}%)" if o else ""
+        return f"{fmt.format(o)} → {fmt.format(n)}{change}"
+
+    for point, o, n, drift, flags in rows:
+        label = f"{point['thickness']}, {point['energy']}"
+        if "FAILED" in flags:
+            why = o.get("error") if not o["ok"] else n.get("error")
+            print(f"{label:>16}  FAILED: {why}")
+            continue
+        verdict = ", ".join(flags) or ("identical" if drift["identical"] else "ok")
+        print(f"{label:>16} {pair(o['events_per_sec'], n['events_per_sec'], '{:.0f}'):>26} "
+              f"{pair(o['init_s'], n['init_s'], '{:.2f}'):>20} "
+              f"{pair(o['rss_mb'], n['rss_mb'], '{:.0f}'):>20} "
+              f"{drift['chi2'] / max(drift['ndf'], 1):9.2f} {drift['p']:8.2g} {drift['total_z']:+8.2f}  {verdict}")
+
+
+# ==================================================
+# Baseline
+# ==================================================
+def load_baseline():
+    try:
+        with open(BASELINE_FILE) as f:
+            return json.load(f).get(socket.gethostname())
+    except (OSError, ValueError):
+        return None
+
+
+def save_baseline(binary, points, results, threads):
+    try:
+        with open(BASELINE_FILE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    cache[socket.gethostname()] = {
+        "binary": os.path.abspath(binary),
+        "fingerprint": autotune.binary_fingerprint(binary),
+        "cores": os.cpu_count(),
+        "threads": threads,
+        "saved_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "points": [dict(p, **r) for p, r in zip(points, results)],
+    }
+    os.makedirs(os.path.dirname(BASELINE_FILE), exist_ok=True)
+    tmp = BASELINE_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(cache, f, indent=1)
+    os.replace(tmp, BASELINE_FILE)
+
+
+def run_canary(new, old=None, baseline=None, events=EVENTS, threads=THREADS, log=print):
+    """
+    Measure the reference sweep with `new`, and with `old` at the same time
+    if given; otherwise compare against `baseline` (a stored entry, whose
+    sweep and seeds are reused). Returns (points, old results, new results).
+    """
+    if baseline:
+        # Same sweep, seeds and threads as the stored runs, or the maps cannot be compared
+        points = [{k: p[k] for k in ("thickness", "energy", "electrons", "seeds")}
+                  for p in baseline["points"]]
+    else:
+        points = reference_sweep(events)
+
+    binaries = [new] + ([old] if old else [])
+    old_results, new_results = [], []
+    with ThreadPoolExecutor(max_workers=len(binaries)) as pool:
+        for k, point in enumerate(points):
+            log(f"🐤 Point {k + 1}/{len(points)}: {point['thickness']}, {point['energy']}, "
+                f"{point['electrons']} events")
+            futures = [pool.submit(measure, b, point, threads) for b in binaries]
+            new_results.append(futures[0].result())
+            if old:
+                old_results.append(futures[1].result())
+
+    if not old:
+        old_results = [{k: p.get(k) for k in ("ok", "init_s", "events_per_sec", "timing", "rss_mb", "hits",
+                                              "total_var", "error")}
+                       for p in baseline["points"]] if baseline else []
+    return points, old_results, new_results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare a rebuilt GeantSim with the previous one')
+    parser.add_argument('--new', default=sim_runner.GEANTSIM, help='Binary under test (default: build/GeantSim)')
+    parser.add_argument('--old', help='Reference binary (default: build/GeantSim.prev if present)')
+    parser.add_argument('--baseline', action='store_true', help='Compare with the stored baseline, not a binary')
+    parser.add_argument('--events', type=int, default=EVENTS, help='Events per reference point')
+    parser.add_argument('--threads', type=int, default=THREADS, help='Threads per GeantSim process')
+    parser.add_argument('--no-save', action='store_true', help='Do not store the results as the new baseline')
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.new):
+        parser.exit(1, f"{args.new}: no such binary\n")
+    old = None if args.baseline else args.old or (PREVIOUS_BINARY if os.path.exists(PREVIOUS_BINARY) else None)
+    baseline = None if old else load_baseline()
+    if args.baseline and not baseline:
+        parser.exit(1, f"No canary baseline for this host in {BASELINE_FILE}\n")
+    threads = baseline.get("threads", args.threads) if baseline else args.threads
+
+    points, old_results, new_results = run_canary(args.new, old, baseline, args.events, threads)
+
+    flagged = False
+    if old_results:
+        rows = compare(points, old_results, new_results)
+        old_label = old or f"baseline of {baseline['saved_at']} ({baseline['binary']})"
+        print_report(rows, old_label, args.new)
+        flagged = any(flags for *_, flags in rows)
+    else:
+        print("\nNo old binary or stored baseline to compare with; recording a baseline only.")
+
+    if not args.no_save and all(r["ok"] for r in new_results):
+        save_baseline(args.new, points, new_results, threads)
+        print(f"\n💾 Baseline saved to: {BASELINE_FILE}")
+
+    if flagged:
+        print("\n🚩 The new binary differs from the old one (see verdicts above)")
+        sys.exit(1)
+    if old_results:
+        print("\n✅ No significant change")
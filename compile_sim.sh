@@ -10,8 +10,16 @@ export CMAKE_PREFIX_PATH=/Users/maksu/symulacjaa/geant4_install/
 mkdir -p build
 cd build
 
+# Keep the previous binary so canary.py can compare it with the new one
+if [ -f GeantSim ]; then
+    cp -p GeantSim GeantSim.prev
+fi
+
 cmake ..
 CORES=$(sysctl -n hw.ncpu)
 make -j$CORES
 
 echo "Simulation compiled successfully! Run with: ./GeantSim run.mac"
+if [ -f GeantSim.prev ]; then
+    echo "To check the new build against the previous one: python3 canary.py"
+fi
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Per-event hit streams.
+
+With `/BFS/output/eventStream true`, GeantSim writes `results_<thick>_<n>.events`
+next to the CSV: a 24-byte header followed by one 8-byte record per
+(event, cell) that saw electrons. Everything is little-endian.
+
+    header   magic "BFSEVT01", uint64 events, uint16 nx, ny, int16 x0, y0
+    record   uint32 event, uint16 cell (= j * nx + i), uint16 count
+
+The records of one event are contiguous (each worker thread writes whole
+events), but events are not sorted across threads, and events without hits
+have no records at all. The header's event count covers them.
+
+The reader memory-maps the file and walks it in chunks cut at event
+boundaries, so histograms and correlations over 10^7 events never hold more
+than one chunk (plus a small dense batch) in memory:
+
+    python3 event_stream.py info results_2cm_1.events
+    python3 event_stream.py stats results_2cm_1.events --cells 0,0 1,0 0,1 -o mult.csv
+    python3 event_stream.py synth test.events --events 10000000 --mean 5
+"""
+import argparse
+import os
+
+import numpy as np
+
+MAGIC = b"BFSEVT01"
+HEADER = np.dtype([("magic", "S8"), ("events", "<u8"), ("nx", "<u2"), ("ny", "<u2"),
+                   ("x0", "<i2"), ("y0", "<i2")])
+RECORD = np.dtype([("event", "<u4"), ("cell", "<u2"), ("count", "<u2")])
+CHUNK_RECORDS = 1 << 20             # 8 MB of records per chunk
+DENSE_BATCH_BYTES = 32 * 1024 * 1024
+MAX_CORRELATION_CELLS = 2048        # beyond this, pick the cells to correlate
+
+
+def stream_path(csv_file):
+    """The .events file that belongs to a result CSV."""
+    return os.path.splitext(csv_file)[0] + ".events"
+
+
+def write_header(f, events, nx=21, ny=21, x0=-10, y0=-10):
+    header = np.zeros(1, HEADER)
+    header[0] = (MAGIC, events, nx, ny, x0, y0)
+    f.write(header.tobytes())
+
+
+def event_groups(chunk):
+    """Start index of every event's run of records in `chunk`, and the run lengths."""
+    if len(chunk) == 0:
+        return np.zeros(0, np.intp), np.zeros(0, np.intp)
+    starts = np.flatnonzero(np.diff(chunk["event"]) != 0) + 1
+    starts = np.concatenate(([0], starts))
+    return starts, np.diff(np.append(starts, len(chunk)))
+
+
+class EventStream:
+    def __init__(self, path):
+        self.path = path
+        header = np.fromfile(path, HEADER, count=1)
+        if len(header) == 0 or header[0]["magic"] != MAGIC:
+            raise ValueError(f"{path} is not an event stream")
+        header = header[0]
+        self.events = int(header["events"])
+        self.nx, self.ny = int(header["nx"]), int(header["ny"])
+        self.x0, self.y0 = int(header["x0"]), int(header["y0"])
+
+        body = os.path.getsize(path) - HEADER.itemsize
+        if body % RECORD.itemsize:
+            raise ValueError(f"{path} is truncated")
+        self.n_records = body // RECORD.itemsize
+
+    def __len__(self):
+        return self.n_records
+
+    def _map(self, start, stop):
+        """Records [start, stop) as a memory map of just that window."""
+        if stop <= start:
+            return np.zeros(0, RECORD)
+        return np.memmap(self.path, RECORD, mode="r", shape=(stop - start,),
+                         offset=HEADER.itemsize + start * RECORD.itemsize)
+
+    @property
+    def cells(self):
+        return self.nx * self.ny
+
+    def cell_index(self, x, y):
+        """Cell number of detector coordinates (x, y), as in the CSV."""
+        i, j = x - self.x0, y - self.y0
+        if not (0 <= i < self.nx and 0 <= j < self.ny):
+            raise ValueError(f"cell ({x}, {y}) is outside the {self.nx}x{self.ny} grid")
+        return j * self.nx + i
+
+    def chunks(self, size=CHUNK_RECORDS):
+        """
+        Yield record arrays of about `size` records, never splitting an event.
+        Each chunk is its own memory map, so pages are released as soon as
+        the caller drops it and resident memory stays at about one chunk.
+        """
+        n = self.n_records
+        start = 0
+        while start < n:
+            stop = min(start + size, n)
+            if stop < n:
+                events = self._map(start, stop)["event"]
+                last = events[-1]
+                other = np.flatnonzero(events != last)
+                if len(other):
+                    stop = start + other[-1] + 1
+                else:
+                    # One event larger than the chunk: extend to its end
+                    while stop < n:
+                        other = np.flatnonzero(self._map(stop, min(stop + size, n))["event"] != last)
+                        if len(other):
+                            stop += other[0]
+                            break
+                        stop = min(stop + size, n)
+                del events
+            yield self._map(start, stop)
+            start = stop
+
+    # --- statistics -----------------------------------------------------
+    def totals(self):
+        """Hits per cell summed over all events, as a (ny, nx) grid (the CSV's content)."""
+        grid = np.zeros(self.cells, np.int64)
+        for chunk in self.chunks():
+            grid += np.bincount(chunk["cell"], weights=chunk["count"],
+                                minlength=self.cells).astype(np.int64)
+        return grid.reshape(self.ny, self.nx)
+
+    def sum_variance(self):
+        """
+        Variance of each cell's summed hits, as a (ny, nx) grid, and of the
+        total hits, both estimated from the spread between events
+        (events × per-event variance). Showers are over-dispersed, so this
+        is wider than the Poisson variance of the sums.
+        """
+        s1 = np.zeros(self.cells)
+        s2 = np.zeros(self.cells)
+        t1 = t2 = 0.0
+        for chunk in self.chunks():
+            if len(chunk) == 0:
+                continue
+            key = chunk["event"].astype(np.int64) * self.cells + chunk["cell"]
+            key, inverse = np.unique(key, return_inverse=True)
+            counts = np.bincount(inverse, weights=chunk["count"])
+            cell = key % self.cells
+            s1 += np.bincount(cell, weights=counts, minlength=self.cells)
+            s2 += np.bincount(cell, weights=counts ** 2, minlength=self.cells)
+            starts, _ = event_groups(chunk)
+            per_event = np.add.reduceat(chunk["count"].astype(np.float64), starts)
+            t1 += per_event.sum()
+            t2 += (per_event ** 2).sum()
+
+        n = max(self.events, 1)
+        cells = np.clip(s2 - s1 ** 2 / n, 0, None)
+        return cells.reshape(self.ny, self.nx), max(t2 - t1 ** 2 / n, 0.0)
+
+    def multiplicity(self, cells_hit=False):
+        """
+        Histogram of hits per event (or of cells hit per event): entry m is
+        the number of events with multiplicity m. Events without records
+        count towards m = 0.
+        """
+        hist = np.zeros(1, np.int64)
+        seen = 0
+        for chunk in self.chunks():
+            starts, lengths = event_groups(chunk)
+            if len(starts) == 0:
+                continue
+            per_event = lengths if cells_hit else \
+                np.add.reduceat(chunk["count"].astype(np.int64), starts)
+            counts = np.bincount(per_event)
+            if len(counts) > len(hist):
+                hist = np.pad(hist, (0, len(counts) - len(hist)))
+            hist[:len(counts)] += counts
+            seen += len(starts)
+        hist[0] += max(self.events - seen, 0)
+        return hist
+
+    def correlation(self, cells=None):
+        """
+        Mean, standard deviation and Pearson correlation matrix of the
+        per-event hit counts in `cells` (cell numbers; all cells by default).
+        Events are unpacked into dense batches of at most DENSE_BATCH_BYTES.
+        """
+        cells = np.arange(self.cells) if cells is None else np.asarray(cells, np.intp)
+        k = len(cells)
+        if k > MAX_CORRELATION_CELLS:
+            raise ValueError(f"{k} cells is too many to correlate; pass a subset")
+        column = np.full(self.cells, -1, np.intp)
+        column[cells] = np.arange(k)
+        rows = max(1, DENSE_BATCH_BYTES // (8 * k))
+
+        s1 = np.zeros(k)
+        s2 = np.zeros((k, k))
+        for chunk in self.chunks():
+            chunk = chunk[column[chunk["cell"]] >= 0]
+            if len(chunk) == 0:
+                continue
+            starts, lengths = event_groups(chunk)
+            row = np.repeat(np.arange(len(starts)), lengths)
+            col = column[chunk["cell"]]
+            values = chunk["count"].astype(np.float64)
+            for first in range(0, len(starts), rows):
+                last = min(first + rows, len(starts))
+                sel = slice(starts[first], starts[last] if last < len(starts) else len(chunk))
+                dense = np.zeros((last - first, k))
+                np.add.at(dense, (row[sel] - first, col[sel]), values[sel])
+                s1 += dense.sum(axis=0)
+                s2 += dense.T @ dense
+
+        # Events without hits in these cells add zeros, so only the count matters
+        n = max(self.events, 1)
+        mean = s1 / n
+        cov = s2 / n - np.outer(mean, mean)
+        std = np.sqrt(np.clip(np.diag(cov), 0, None))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            corr = cov / np.outer(std, std)
+        return mean, std, corr
+
+
+# ==================================================
+# Writing
+# ==================================================
+def synth(path, events, mean=5.0, sigma=2.0, shape=2.0, nx=21, ny=21, seed=None,
+          chunk_events=1 << 18):
+    """
+    Write a synthetic stream: per-event multiplicities are Poisson around a
+    gamma-distributed mean (so cells are positively correlated), and hit
+    positions are Gaussian around the centre. Written in chunks, so 10^7
+    events need no more memory than 10^5.
+    """
+    rng = np.random.default_rng(seed)
+    with open(path, "wb") as f:
+        write_header(f, events, nx, ny, -(nx // 2), -(ny // 2))
+        for first in range(0, events, chunk_events):
+            n = min(chunk_events, events - first)
+            hits = rng.poisson(mean * rng.gamma(shape, 1.0 / shape, n))
+            event = np.repeat(np.arange(first, first + n, dtype=np.int64), hits)
+            i = np.rint(rng.normal(0, sigma, len(event))).astype(np.int64) + nx // 2
+            j = np.rint(rng.normal(0, sigma, len(event))).astype(np.int64) + ny // 2
+            inside = (i >= 0) & (i < nx) & (j >= 0) & (j < ny)
+            keys, counts = np.unique(event[inside] * (nx * ny) + j[inside] * nx + i[inside],
+                                     return_counts=True)
+            write_records(f, keys // (nx * ny), keys % (nx * ny), counts)
+
+
+def write_records(f, event, cell, count):
+    records = np.empty(len(event), RECORD)
+    records["event"] = event
+    records["cell"] = cell
+    records["count"] = np.minimum(count, np.iinfo(np.uint16).max)
+    f.write(records.tobytes())
+
+
+def concatenate(paths, dest):
+    """Join streams of independent runs (e.g. shards) into one, renumbering events."""
+    streams = [EventStream(p) for p in paths]
+    first = streams[0]
+    for s in streams[1:]:
+        if (s.nx, s.ny, s.x0, s.y0) != (first.nx, first.ny, first.x0, first.y0):
+            raise ValueError(f"{s.path} has a different grid than {first.path}")
+
+    offset = 0
+    with open(dest, "wb") as f:
+        write_header(f, sum(s.events for s in streams), first.nx, first.ny, first.x0, first.y0)
+        for s in streams:
+            for chunk in s.chunks():
+                chunk = np.array(chunk)
+                chunk["event"] += offset
+                f.write(chunk.tobytes())
+            offset += s.events
+    return dest
+
+
+def parse_cell(text):
+    x, _, y = text.partition(",")
+    return int(x), int(y)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Read and summarise per-event hit streams')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+
+    p_info = sub.add_parser('info', help='Header, record count and totals')
+    p_info.add_argument('path')
+
+    p_stats = sub.add_parser('stats', help='Multiplicity histogram and cell correlations')
+    p_stats.add_argument('path')
+    p_stats.add_argument('--cells', nargs='+', type=parse_cell, default=[(0, 0), (1, 0), (0, 1), (-1, 0), (0, -1)],
+                         metavar='X,Y', help='Cells to correlate (default: centre and its neighbours)')
+    p_stats.add_argument('-o', '--output', help='Write the multiplicity histogram to this CSV')
+
+    p_synth = sub.add_parser('synth', help='Write a synthetic stream')
+    p_synth.add_argument('path')
+    p_synth.add_argument('--events', type=int, default=1000000)
+    p_synth.add_argument('--mean', type=float, default=5.0, help='Mean hits per event')
+    p_synth.add_argument('--seed', type=int)
+
+    args = parser.parse_args()
+
+    if args.cmd == 'synth':
+        synth(args.path, args.events, args.mean, seed=args.seed)
+        print(f"✅ Wrote {args.events} synthetic events to: {args.path}")
+        parser.exit()
+
+    try:
+        stream = EventStream(args.path)
+    except (OSError, ValueError) as e:
+        parser.exit(1, f"{e}\n")
+
+    if args.cmd == 'info':
+        totals = stream.totals()
+        print(f"{args.path}: {stream.events} events, {len(stream)} records, "
+              f"{stream.nx}x{stream.ny} cells, {int(totals.sum())} hits")
+    else:
+        hist = stream.multiplicity()
+        m = np.arange(len(hist))
+        n = max(hist.sum(), 1)
+        avg = (m * hist).sum() / n
+        rms = np.sqrt(((m - avg) ** 2 * hist).sum() / n)
+        print(f"Hits per event: mean {avg:.3f}, rms {rms:.3f}, max {len(hist) - 1}, "
+              f"empty events {hist[0]}")
+
+        cells = [stream.cell_index(x, y) for x, y in args.cells]
+        mean, std, corr = stream.correlation(cells)
+        labels = [f"({x},{y})" for x, y in args.cells]
+        print(f"{'cell':>9} {'mean':>9} {'std':>9}  " + " ".join(f"{lbl:>8}" for lbl in labels))
+        for a, lbl in enumerate(labels):
+            print(f"{lbl:>9} {mean[a]:9.4f} {std[a]:9.4f}  " + " ".join(f"{c:8.4f}" for c in corr[a]))
+
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write("hits,events\n")
+                for k, v in enumerate(hist):
+                    f.write(f"{k},{v}\n")
+            print(f"✅ Multiplicity histogram saved to: {os.path.abspath(args.output)}")
@@ -3,6 +3,8 @@ import subprocess
 import os
 import re
 import threading
+
+import sim_service
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QLabel, QLineEdit, QPushButton, QCheckBox, QTableWidget, 
                              QTableWidgetItem, QHeaderView, QTextEdit, QMessageBox, QFrame,
@@ -15,6 +17,14 @@ class SimulationWorker(QThread):
     log_signal = pyqtSignal(str)
     finished_signal = pyqtSignal()
 
+    STATUS = {
+        "running": "Running...",
+        "done": "Completed",
+        "failed": "Error",
+        "unknown": "Unknown",
+        "error": "Failed",
+    }
+
     def __init__(self, queue):
         super().__init__()
         self.queue = queue
@@ -22,65 +32,21 @@ class SimulationWorker(QThread):
 
     def run(self):
         self.log_signal.emit("Batch execution started.")
-        
-        for i, task in enumerate(self.queue):
-            if not self.is_running: break
-            if task["status"] == "Completed": continue
-            
-            self.progress_signal.emit(i, "Running...")
-            self.log_signal.emit(f"Processing Task #{task['id']} (E={task['energy']}, Th={task['thickness']})")
-            
-            # 1. Create temporary macro
-            mac_content = f"""
-/det/setLeadThickness {task['thickness']}
-/run/initialize
-/gun/particle e-
-/gun/energy {task['energy']}
-/run/beamOn {task['electrons']}
-"""
-            mac_filename = "temp_queue_run.mac"
-            with open(mac_filename, "w") as f:
-                f.write(mac_content)
-                
-            # 2. Run Simulation
-            try:
-                result = subprocess.run(["./build/GeantSim", mac_filename], capture_output=True, text=True)
-                
-                if result.returncode != 0:
-                    self.log_signal.emit(f"Error in task #{task['id']}: {result.stderr}")
-                    self.progress_signal.emit(i, "Error")
-                    continue
-                
-                # Parse output
-                match = re.search(r"Results written to '(.*\.csv)'", result.stdout)
-                if match:
-                    csv_file = match.group(1)
-                    self.log_signal.emit(f"  -> Generated: {csv_file}")
-                    
-                    if task["svg"]:
-                        cmd = [
-                            "python3", "visualize_results.py", 
-                            csv_file,
-                            "--energy", task["energy"],
-                            "--electrons", task["electrons"],
-                            "--thickness", task["thickness"]
-                        ]
-                        subprocess.run(cmd, check=True)
-                        self.log_signal.emit(f"  -> Visualization created.")
-                    
-                    self.progress_signal.emit(i, "Completed")
-                    task["status"] = "Completed"
-                else:
-                    self.log_signal.emit("  -> Warning: Output filename not detected.")
-                    self.progress_signal.emit(i, "Unknown")
-                    
-            except Exception as e:
-                self.log_signal.emit(f"Exception in task #{task['id']}: {e}")
-                self.progress_signal.emit(i, "Failed")
-        
-        if os.path.exists("temp_queue_run.mac"):
-            os.remove("temp_queue_run.mac")
-            
+
+        def progress(i, state):
+            if state == "done":
+                self.queue[i]["status"] = "Completed"
+            self.progress_signal.emit(i, self.STATUS[state])
+
+        sim_service.run_tasks(
+            self.queue,
+            progress=progress,
+            log=self.log_signal.emit,
+            should_stop=lambda: not self.is_running,
+            skip_done=True,
+            shard=True,
+        )
+
         self.log_signal.emit("Batch processing finished.")
         self.finished_signal.emit()
 
@@ -305,6 +271,9 @@ class MainWindow(QMainWindow):
         self.chk_svg.setChecked(True)
         config_layout.addWidget(self.chk_svg)
 
+        self.chk_events = QCheckBox("Per-event Hit Stream (.events)")
+        config_layout.addWidget(self.chk_events)
+
         top_layout.addWidget(config_grid, 3) # Ratio 3 (Wider)
         
         main_layout.addLayout(top_layout)
@@ -393,6 +362,7 @@ class MainWindow(QMainWindow):
             "energy": en,
             "thickness": th,
             "svg": self.chk_svg.isChecked(),
+            "event_stream": self.chk_events.isChecked(),
             "status": "Pending"
         }
         self.queue.append(task)
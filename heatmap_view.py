@@ -0,0 +1,187 @@
+"""
+Native heatmap preview for the dashboard.
+
+Hit maps are turned into a QImage straight from NumPy (a log-scaled lookup
+into an OrRd colour table, one pixel per cell) and scaled up by Qt with
+nearest-neighbour sampling, so showing a run takes a few milliseconds and no
+matplotlib. Decoded grids are kept in a small LRU cache keyed by file and
+mtime (live or archived, via result_store); neighbouring rows of the queue
+table are decoded ahead of time on idle timer ticks so that stepping through
+a long run list stays instant.
+"""
+from collections import OrderedDict, deque
+
+import numpy as np
+from PyQt5.QtCore import Qt, QObject, QRect, QTimer
+from PyQt5.QtGui import QColor, QFont, QImage, QLinearGradient, QPainter
+from PyQt5.QtWidgets import QSizePolicy, QWidget
+
+import result_store
+from hitmap import HitMap
+
+CACHE_SIZE = 256
+PREFETCH_ROWS = 8
+DISPLAY_BINS = 400      # larger detectors are downsampled to about this many bins per axis
+
+# ColorBrewer OrRd, the colormap visualize_results uses
+ORRD = ["#fff7ec", "#fee8c8", "#fdd49e", "#fdbb84", "#fc8d59",
+        "#ef6548", "#d7301f", "#b30000", "#7f0000"]
+EMPTY_RGBA = (15, 23, 42, 255)      # cells without hits: dashboard slate
+
+
+def _build_lut(stops, size=256):
+    rgb = np.array([[int(c[k:k + 2], 16) for k in (1, 3, 5)] for c in stops], dtype=np.float64)
+    pos = np.linspace(0.0, 1.0, len(stops))
+    x = np.linspace(0.0, 1.0, size)
+    lut = np.empty((size, 4), dtype=np.uint8)
+    for ch in range(3):
+        lut[:, ch] = np.rint(np.interp(x, pos, rgb[:, ch]))
+    lut[:, 3] = 255
+    return lut
+
+
+LUT = _build_lut(ORRD)
+
+
+def grid_to_rgba(grid, vmin=None, vmax=None, threshold=0.5):
+    """(ny, nx, 4) uint8 image of `grid` on a log colour scale; cells below threshold are empty."""
+    grid = np.asarray(grid, dtype=np.float64)
+    filled = grid >= threshold
+    rgba = np.empty(grid.shape + (4,), dtype=np.uint8)
+    rgba[:] = EMPTY_RGBA
+    if not filled.any():
+        return rgba, None, None
+
+    values = grid[filled]
+    vmin = float(values.min()) if vmin is None else vmin
+    vmax = float(values.max()) if vmax is None else vmax
+    lo, hi = np.log(vmin), np.log(vmax)
+    scale = (len(LUT) - 1) / (hi - lo) if hi > lo else 0.0
+    idx = np.clip((np.log(values) - lo) * scale, 0, len(LUT) - 1).astype(np.intp)
+    rgba[filled] = LUT[idx]
+    return rgba, vmin, vmax
+
+
+def rgba_to_qimage(rgba):
+    h, w = rgba.shape[:2]
+    data = np.ascontiguousarray(rgba)
+    # copy() detaches the image from the NumPy buffer
+    return QImage(data.data, w, h, 4 * w, QImage.Format_RGBA8888).copy()
+
+
+# ==================================================
+# Decoded-grid cache with idle prefetch
+# ==================================================
+class GridCache(QObject):
+    """LRU of (dense grid, total hits) per result CSV."""
+
+    def __init__(self, size=CACHE_SIZE, parent=None):
+        super().__init__(parent)
+        self.size = size
+        self._entries = OrderedDict()       # (path, mtime) -> (grid, total)
+        self._pending = deque()
+        self._timer = QTimer(self)
+        self._timer.setInterval(0)
+        self._timer.timeout.connect(self._prefetch_one)
+
+    @staticmethod
+    def _key(path):
+        # Archived runs have no file on disk; the store knows their mtime
+        try:
+            return path, result_store.getmtime(path)
+        except (OSError, ValueError):
+            return None
+
+    def get(self, path):
+        """Grid and total for `path`, decoding it on a miss; None if it cannot be read."""
+        key = self._key(path)
+        if key is None:
+            return None
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        try:
+            hitmap = HitMap.from_csv(path).for_display(DISPLAY_BINS)
+        except (OSError, ValueError, KeyError):
+            return None
+        entry = (hitmap.to_dense(), hitmap.sum())
+        self._entries[key] = entry
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+        return entry
+
+    def prefetch(self, paths):
+        """Decode `paths` one per event-loop turn, replacing any earlier prefetch request."""
+        self._pending = deque(p for p in paths if self._key(p) not in self._entries)
+        if self._pending:
+            self._timer.start()
+
+    def _prefetch_one(self):
+        if not self._pending:
+            self._timer.stop()
+            return
+        self.get(self._pending.popleft())
+
+
+# ==================================================
+# Widget
+# ==================================================
+class HeatmapView(QWidget):
+    """Paints a hit map as nearest-neighbour-scaled pixels with a log colour bar."""
+
+    BAR_WIDTH = 10
+    TEXT_COLOR = QColor("#94A3B8")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.setMinimumSize(160, 160)
+        self._image = None
+        self._range = None
+        self._message = "Select a finished run"
+
+    def set_grid(self, grid, threshold=0.5):
+        rgba, vmin, vmax = grid_to_rgba(grid, threshold=threshold)
+        self._image = rgba_to_qimage(rgba)
+        self._range = (vmin, vmax) if vmin is not None else None
+        self._message = None if self._range else "No hits"
+        self.update()
+
+    def set_message(self, text):
+        self._image = None
+        self._range = None
+        self._message = text
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setFont(QFont("JetBrains Mono", 9))
+        painter.setPen(self.TEXT_COLOR)
+
+        if self._image is None:
+            painter.drawText(self.rect(), Qt.AlignCenter, self._message or "")
+            return
+
+        # Map area: square-ish, aspect of the grid, leaving room for the colour bar
+        label_w = painter.fontMetrics().horizontalAdvance("000000") if self._range else 0
+        avail_w = self.width() - self.BAR_WIDTH - label_w - 12
+        avail_h = self.height()
+        img_w, img_h = self._image.width(), self._image.height()
+        scale = min(avail_w / img_w, avail_h / img_h)
+        w, h = max(1, int(img_w * scale)), max(1, int(img_h * scale))
+        target = QRect((avail_w - w) // 2, (avail_h - h) // 2, w, h)
+
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, False)
+        painter.drawImage(target, self._image)
+
+        if self._range:
+            bar = QRect(target.right() + 8, target.top(), self.BAR_WIDTH, h)
+            gradient = QLinearGradient(bar.bottomLeft(), bar.topLeft())
+            for k, color in enumerate(ORRD):
+                gradient.setColorAt(k / (len(ORRD) - 1), QColor(color))
+            painter.fillRect(bar, gradient)
+            vmin, vmax = self._range
+            fm = painter.fontMetrics()
+            painter.drawText(bar.right() + 4, bar.top() + fm.ascent(), f"{vmax:.3g}")
+            painter.drawText(bar.right() + 4, bar.bottom(), f"{vmin:.3g}")
@@ -0,0 +1,159 @@
+"""
+Sparse, geometry-agnostic hit maps.
+
+Result CSVs only list cells with hits, and large segmented calorimeters
+(500x500 and up) are mostly empty, so a HitMap keeps the hits in COO form:
+column index i, row index j (counted from the bottom, i.e. from y0) and the
+count, on an nx x ny grid whose layout comes from the run's metadata sidecar
+(sim_runner.write_metadata) instead of being hard-coded to 21x21.
+
+Cell (i, j) covers detector coordinates x0 + i*bx .. x0 + (i+1)*bx - 1 (same
+for y), where (bx, by) is the bin size: 1 for raw maps, larger after
+downsample().
+"""
+import numpy as np
+import pandas as pd
+
+import result_store
+import sim_runner
+
+
+class HitMap:
+    def __init__(self, i, j, hits, nx, ny, x0=0, y0=0, bin_size=(1, 1)):
+        self.nx, self.ny = int(nx), int(ny)
+        self.x0, self.y0 = int(x0), int(y0)
+        self.bin_size = (int(bin_size[0]), int(bin_size[1]))
+
+        i = np.asarray(i, dtype=np.int64)
+        j = np.asarray(j, dtype=np.int64)
+        hits = np.asarray(hits, dtype=np.int64)
+        inside = (i >= 0) & (i < self.nx) & (j >= 0) & (j < self.ny) & (hits != 0)
+        self.i, self.j, self.hits = self._coalesce(i[inside], j[inside], hits[inside])
+
+    def _coalesce(self, i, j, hits):
+        """Sum duplicate cells and sort row-major (by j, then i)."""
+        lin = j * self.nx + i
+        uniq, inv = np.unique(lin, return_inverse=True)
+        summed = np.bincount(inv, weights=hits, minlength=len(uniq)).astype(np.int64)
+        return uniq % self.nx, uniq // self.nx, summed
+
+    # --- construction ---------------------------------------------------
+    @classmethod
+    def from_csv(cls, filename, grid=None):
+        """
+        Read an `X,Y,Hits` result CSV. The grid layout is taken from `grid`,
+        else from the metadata sidecar, else the 21x21 detector of
+        DetectorConstruction.
+        """
+        if grid is None:
+            meta = sim_runner.read_metadata(filename) or {}
+            grid = meta.get("grid", sim_runner.GRID)
+        nx, ny = grid["nx"], grid["ny"]
+        x0 = grid.get("x0", -(nx // 2))
+        y0 = grid.get("y0", -(ny // 2))
+
+        with result_store.open_file(filename) as f:   # archived runs are read transparently
+            df = pd.read_csv(f, dtype={"X": np.int64, "Y": np.int64, "Hits": np.int64})
+        return cls(df["X"].to_numpy() - x0, df["Y"].to_numpy() - y0, df["Hits"].to_numpy(),
+                   nx, ny, x0, y0)
+
+    @classmethod
+    def from_dense(cls, grid, x0=0, y0=0):
+        """Inverse of to_dense(): row 0 of `grid` is the top (highest y)."""
+        grid = np.asarray(grid)
+        ny, nx = grid.shape
+        r, c = np.nonzero(grid)
+        return cls(c, ny - 1 - r, grid[r, c], nx, ny, x0, y0)
+
+    def _like(self, i, j, hits, nx=None, ny=None, x0=None, y0=None, bin_size=None):
+        return HitMap(i, j, hits,
+                      self.nx if nx is None else nx, self.ny if ny is None else ny,
+                      self.x0 if x0 is None else x0, self.y0 if y0 is None else y0,
+                      self.bin_size if bin_size is None else bin_size)
+
+    # --- queries ----------------------------------------------------------
+    @property
+    def shape(self):
+        return self.ny, self.nx
+
+    @property
+    def nnz(self):
+        return len(self.hits)
+
+    def sum(self):
+        return int(self.hits.sum())
+
+    def x(self):
+        """Detector X coordinate of each stored cell (left edge of its bin)."""
+        return self.x0 + self.i * self.bin_size[0]
+
+    def y(self):
+        return self.y0 + self.j * self.bin_size[1]
+
+    def csr(self):
+        """(indptr, indices, data) with rows ordered top (highest y) to bottom, like to_dense()."""
+        rows = self.ny - 1 - self.j
+        order = np.lexsort((self.i, rows))
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=self.ny))])
+        return indptr, self.i[order], self.hits[order]
+
+    def to_dense(self, dtype=np.float64):
+        """(ny, nx) array, row 0 = top (highest y), as drawn by visualize_results."""
+        grid = np.zeros((self.ny, self.nx), dtype=dtype)
+        grid[self.ny - 1 - self.j, self.i] = self.hits
+        return grid
+
+    # --- operations --------------------------------------------------------
+    def _check_compatible(self, other):
+        if (self.nx, self.ny, self.x0, self.y0, self.bin_size) != \
+                (other.nx, other.ny, other.x0, other.y0, other.bin_size):
+            raise ValueError("Hit maps have different grid layouts")
+
+    def merge(self, *others):
+        """Cell-wise sum of this map and others on the same grid."""
+        for o in others:
+            self._check_compatible(o)
+        maps = (self,) + others
+        return self._like(np.concatenate([m.i for m in maps]),
+                          np.concatenate([m.j for m in maps]),
+                          np.concatenate([m.hits for m in maps]))
+
+    __add__ = merge
+
+    def slice(self, xmin=None, xmax=None, ymin=None, ymax=None):
+        """Sub-map of the bins whose detector coordinates lie in [xmin, xmax] x [ymin, ymax]."""
+        bx, by = self.bin_size
+        i_lo = 0 if xmin is None else max(0, -(-(xmin - self.x0) // bx))
+        i_hi = self.nx - 1 if xmax is None else min(self.nx - 1, (xmax - self.x0) // bx)
+        j_lo = 0 if ymin is None else max(0, -(-(ymin - self.y0) // by))
+        j_hi = self.ny - 1 if ymax is None else min(self.ny - 1, (ymax - self.y0) // by)
+
+        keep = (self.i >= i_lo) & (self.i <= i_hi) & (self.j >= j_lo) & (self.j <= j_hi)
+        return self._like(self.i[keep] - i_lo, self.j[keep] - j_lo, self.hits[keep],
+                          nx=max(0, i_hi - i_lo + 1), ny=max(0, j_hi - j_lo + 1),
+                          x0=self.x0 + i_lo * bx, y0=self.y0 + j_lo * by)
+
+    def downsample(self, fx, fy=None):
+        """Sum fx x fy blocks of bins into one."""
+        fy = fx if fy is None else fy
+        return self._like(self.i // fx, self.j // fy, self.hits,
+                          nx=-(-self.nx // fx), ny=-(-self.ny // fy),
+                          bin_size=(self.bin_size[0] * fx, self.bin_size[1] * fy))
+
+    def for_display(self, max_bins=400):
+        """Downsampled so neither axis exceeds max_bins (about one bin per screen pixel)."""
+        f = max(1, -(-max(self.nx, self.ny) // max_bins))
+        return self if f == 1 else self.downsample(f)
+
+    def to_csv(self, filename):
+        """Write an `X,Y,Hits` CSV like RunAction's (cells in copy-number order). Raw maps only."""
+        with open(filename, "w") as f:
+            f.write("X,Y,Hits\n")
+            for x, y, h in zip(self.x(), self.y(), self.hits):
+                f.write(f"{x},{y},{h}\n")
+
+    def extent(self):
+        """matplotlib imshow extent (left, right, bottom, top) in detector coordinates."""
+        bx, by = self.bin_size
+        return (self.x0 - 0.5, self.x0 + self.nx * bx - 0.5,
+                self.y0 - 0.5, self.y0 + self.ny * by - 0.5)
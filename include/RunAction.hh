@@ -5,9 +5,12 @@
 #include "globals.hh"
 
 #include "G4Accumulable.hh"
+#include "G4Timer.hh"
+#include <fstream>
 #include <map>
 
 class G4Run;
+class G4GenericMessenger;
 
 class RunAction : public G4UserRunAction {
 public:
@@ -19,8 +22,19 @@ public:
 
   void AddHits(G4int id, G4int hits);
 
+  // Per-event output (/BFS/output/eventStream true)
+  G4bool EventStreamEnabled() const { return fEventStream; }
+  void RecordEvent(G4int eventID, const std::map<G4int, G4int> &hits);
+
 private:
+  void WriteEventStream(const std::string &csvName, G4int nofEvents);
+
   std::map<G4int, G4Accumulable<G4int> *> fAccumulableHits;
+
+  G4GenericMessenger *fMessenger;
+  G4bool fEventStream;
+  std::ofstream fEventPart; // this thread's records, merged by the master
+  G4Timer fTimer;           // master: wall time of the event loop
 };
 
 #endif
@@ -1,14 +1,17 @@
 import sys
-import subprocess
 import os
-import re
+
+import resource_monitor
+import sim_service
+from heatmap_view import GridCache, HeatmapView, PREFETCH_ROWS
+from surrogate import Surrogate
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget,
     QVBoxLayout, QHBoxLayout, QLabel,
     QLineEdit, QPushButton, QCheckBox,
     QTableWidget, QTableWidgetItem,
     QHeaderView, QTextEdit, QFrame,
-    QGraphicsDropShadowEffect
+    QGraphicsDropShadowEffect, QDialog
 )
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QSize
 from PyQt5.QtGui import QColor, QFont, QPalette, QIcon
@@ -21,6 +24,14 @@ class SimulationWorker(QThread):
     log = pyqtSignal(str)
     finished = pyqtSignal()
 
+    STATUS = {
+        "running": "Running...",
+        "done": "Done",
+        "failed": "Failed",
+        "unknown": "Unknown",
+        "error": "Error",
+    }
+
     def __init__(self, queue):
         super().__init__()
         self.queue = queue
@@ -28,72 +39,14 @@ class SimulationWorker(QThread):
 
     def run(self):
         self.log.emit("🚀 Batch Sequence Started")
-        
-        for i, task in enumerate(self.queue):
-            if not self.is_running: break
-            
-            self.progress.emit(i, "Running...")
-            
-            task_id = task['id']
-            # Prepare macro
-            mac = f"""
-/det/setLeadThickness {task['thickness']}
-/run/initialize
-/gun/particle e-
-/gun/energy {task['energy']}
-/run/beamOn {task['electrons']}
-"""
-            mac_file = f"temp_task_{task_id}.mac"
-            with open(mac_file, "w") as f:
-                f.write(mac)
-
-            try:
-                # Run Simulation
-                result = subprocess.run(
-                    ["./build/GeantSim", mac_file],
-                    capture_output=True, text=True
-                )
-
-                if result.returncode != 0:
-                    self.progress.emit(i, "Failed")
-                    self.log.emit(f"❌ Task #{task_id} Error:\n{result.stderr}")
-                    continue
-
-                # Parse filename - flexible regex
-                # Look for "Results written to 'filename'" NOT constrained by start of line
-                stdout = result.stdout
-                # Debug: print first 50 chars of stdout to see if it's there
-                # self.log.emit(f"Debug output: {stdout[:100]}...") 
-                
-                match = re.search(r"Results written to\s+['\"](.*?)['\"]", stdout)
-                
-                if match:
-                    csv_filename = match.group(1)
-                    self.log.emit(f"✅ Generated: {csv_filename}")
-                    
-                    if task["svg"]:
-                        cmd = [
-                            "python3", "visualize_results.py", 
-                            csv_filename,
-                            "--energy", task["energy"],
-                            "--electrons", task["electrons"],
-                            "--thickness", task["thickness"]
-                        ]
-                        subprocess.run(cmd, check=True)
-                        self.log.emit("   ↳ Viz Rendered")
-                    
-                    self.progress.emit(i, "Done")
-                else:
-                    self.log.emit(f"⚠️  Parsing Failed. Raw output snippet:\n{stdout[-100:]}")
-                    self.progress.emit(i, "Unknown")
-
-            except Exception as e:
-                self.progress.emit(i, "Error")
-                self.log.emit(f"💥 Exception: {str(e)}")
-                
-            finally:
-                if os.path.exists(mac_file):
-                    os.remove(mac_file)
+
+        sim_service.run_tasks(
+            self.queue,
+            progress=lambda i, state: self.progress.emit(i, self.STATUS[state]),
+            log=self.log.emit,
+            should_stop=lambda: not self.is_running,
+            shard=True,
+        )
 
         self.log.emit("🏁 Sequence Complete")
         self.finished.emit()
@@ -101,6 +54,73 @@ class SimulationWorker(QThread):
     def stop(self):
         self.is_running = False
 
+
+class ResourceWorker(QThread):
+    # Polls the monitor, or the shared service's, off the GUI thread
+    updated = pyqtSignal(dict)
+
+    def __init__(self, interval_ms=1000):
+        super().__init__()
+        self.interval_ms = interval_ms
+        self.monitor = resource_monitor.get_monitor()
+
+    def run(self):
+        while not self.isInterruptionRequested():
+            snap = self.monitor.snapshot
+            if sim_service.service_available():
+                try:
+                    snap = sim_service.request({"op": "status"}).get("resources", snap)
+                except (OSError, ValueError):
+                    pass
+            self.updated.emit(snap)
+            self.msleep(self.interval_ms)
+
+# ==================================================
+# Instant Preview
+# ==================================================
+class PreviewDialog(QDialog):
+    """Shows a surrogate-predicted hit map; accepting it queues the real run."""
+
+    def __init__(self, prediction, params, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Instant Preview (Surrogate)")
+        self.resize(560, 640)
+        self.setStyleSheet("background-color: #0B1120;")
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(24, 24, 24, 24)
+        layout.setSpacing(16)
+
+        lbl = QLabel("PREDICTED HIT MAP")
+        lbl.setProperty("class", "section-header")
+        layout.addWidget(lbl)
+
+        view = HeatmapView()
+        view.set_grid(prediction["grid"])
+        layout.addWidget(view, 1)
+
+        rel = prediction["total_err"] / max(prediction["total"], 1.0)
+        info = QLabel(
+            f"{params['energy']} • {params['thickness']} • {params['electrons']} e-\n"
+            f"Total hits ≈ {prediction['total']:.0f} ± {prediction['total_err']:.0f} ({rel:.0%})\n"
+            f"Interpolated from {len(prediction['neighbours'])} stored runs, "
+            f"nearest distance {prediction['distance']:.2f}"
+        )
+        info.setStyleSheet("color: #94A3B8; font-family: 'JetBrains Mono', 'Consolas', monospace; font-size: 12px;")
+        layout.addWidget(info)
+
+        buttons = QHBoxLayout()
+        btn_close = QPushButton("CLOSE")
+        btn_close.clicked.connect(self.reject)
+        btn_queue = QPushButton("QUEUE REAL SIMULATION")
+        btn_queue.setProperty("class", "primary")
+        btn_queue.setCursor(Qt.PointingHandCursor)
+        btn_queue.clicked.connect(self.accept)
+        buttons.addWidget(btn_close)
+        buttons.addStretch()
+        buttons.addWidget(btn_queue)
+        layout.addLayout(buttons)
+
 # ==================================================
 # Main Window
 # ==================================================
@@ -109,6 +129,8 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.queue = []
         self.worker = None
+        self.surrogate = None
+        self.grid_cache = GridCache(parent=self)
 
         self.setWindowTitle("Simulation Dashboard Pro")
         self.resize(1150, 800)
@@ -369,8 +391,16 @@ class MainWindow(QMainWindow):
         self.chk_svg.setChecked(True)
         layout.addWidget(self.chk_svg)
 
+        self.chk_events = QCheckBox("Per-event Hit Stream (.events)")
+        layout.addWidget(self.chk_events)
+
         layout.addStretch()
 
+        btn_preview = QPushButton("INSTANT PREVIEW")
+        btn_preview.setCursor(Qt.PointingHandCursor)
+        btn_preview.clicked.connect(self.show_preview)
+        layout.addWidget(btn_preview)
+
         btn_add = QPushButton("ADD TO QUEUE")
         btn_add.setCursor(Qt.PointingHandCursor)
         btn_add.clicked.connect(self.add_to_queue)
@@ -399,7 +429,10 @@ class MainWindow(QMainWindow):
         h.addWidget(self.btn_run)
         layout.addLayout(h)
 
-        # Table Card
+        # Table Card + Result Preview
+        row = QHBoxLayout()
+        row.setSpacing(16)
+
         card = QFrame()
         card.setProperty("class", "card")
         card_layout = QVBoxLayout(card)
@@ -410,16 +443,134 @@ class MainWindow(QMainWindow):
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.table.verticalHeader().hide()
         self.table.setShowGrid(False)
-        self.table.setFocusPolicy(Qt.NoFocus)
         self.table.setFrameShape(QFrame.NoFrame)
         self.table.setStyleSheet("padding: 10px; alternate-background-color: #1a2333;")
         self.table.setAlternatingRowColors(True)
+        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.table.setSelectionMode(QTableWidget.SingleSelection)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.currentCellChanged.connect(lambda r, *_: self.show_result(r))
         
         card_layout.addWidget(self.table)
-        layout.addWidget(card)
+        row.addWidget(card, 1)
+        row.addWidget(self.build_result_card())
+        layout.addLayout(row, 3)
+
+        layout.addWidget(self.build_resource_card(), 2)
         
         return layout
 
+    # ==================================================
+    def build_result_card(self):
+        card = QFrame()
+        card.setProperty("class", "card")
+        card.setFixedWidth(320)
+        card_layout = QVBoxLayout(card)
+        card_layout.setContentsMargins(16, 12, 16, 12)
+        card_layout.setSpacing(8)
+
+        lbl = QLabel("RESULT PREVIEW")
+        lbl.setProperty("class", "section-header")
+        card_layout.addWidget(lbl)
+
+        self.result_view = HeatmapView()
+        card_layout.addWidget(self.result_view, 1)
+
+        self.result_label = QLabel("")
+        self.result_label.setWordWrap(True)
+        self.result_label.setStyleSheet("color: #94A3B8; font-family: 'JetBrains Mono', 'Consolas', monospace; font-size: 11px;")
+        card_layout.addWidget(self.result_label)
+
+        return card
+
+    def show_result(self, row):
+        if not 0 <= row < len(self.queue):
+            return
+        task = self.queue[row]
+        outputs = task.get("csv") or []
+        if not outputs:
+            self.result_view.set_message(f"Task #{task['id']}: {self.table.item(row, 4).text()}")
+            self.result_label.setText("")
+            return
+
+        path = outputs[-1]
+        entry = self.grid_cache.get(path)
+        if entry is None:
+            self.result_view.set_message(f"Cannot read {os.path.basename(path)}")
+            self.result_label.setText("")
+        else:
+            grid, total = entry
+            self.result_view.set_grid(grid)
+            self.result_label.setText(f"{os.path.basename(path)}\n"
+                                      f"{task['energy']} • {task['thickness']} • Σ={total} hits")
+
+        # Decode the neighbours on idle ticks, nearest first
+        near = sorted(range(max(0, row - PREFETCH_ROWS), min(len(self.queue), row + PREFETCH_ROWS + 1)),
+                      key=lambda r: abs(r - row))
+        self.grid_cache.prefetch([self.queue[r]["csv"][-1] for r in near
+                                  if r != row and self.queue[r].get("csv")])
+
+    # ==================================================
+    def build_resource_card(self):
+        card = QFrame()
+        card.setProperty("class", "card")
+        card_layout = QVBoxLayout(card)
+        card_layout.setContentsMargins(16, 12, 16, 12)
+        card_layout.setSpacing(8)
+
+        lbl = QLabel("RESOURCES")
+        lbl.setProperty("class", "section-header")
+        card_layout.addWidget(lbl)
+
+        self.host_label = QLabel("Host: sampling...")
+        self.host_label.setStyleSheet("color: #94A3B8; font-family: 'JetBrains Mono', 'Consolas', monospace; font-size: 12px;")
+        card_layout.addWidget(self.host_label)
+
+        self.proc_table = QTableWidget(0, 6)
+        self.proc_table.setHorizontalHeaderLabels(["PID", "TASK", "CPU %", "RSS", "I/O R/W", "RUNTIME"])
+        self.proc_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.proc_table.verticalHeader().hide()
+        self.proc_table.setShowGrid(False)
+        self.proc_table.setFocusPolicy(Qt.NoFocus)
+        self.proc_table.setFrameShape(QFrame.NoFrame)
+        card_layout.addWidget(self.proc_table)
+
+        # Polling (and the socket round trip to the service) runs in its own thread; this only repaints
+        self.resource_worker = ResourceWorker()
+        self.resource_worker.updated.connect(self.refresh_resources)
+        self.resource_worker.start()
+
+        return card
+
+    def refresh_resources(self, snap):
+        host = snap.get("host", {})
+        parts = []
+        if host.get("load"):
+            parts.append("Load " + " ".join(f"{l:.2f}" for l in host["load"]))
+        if host.get("MemTotal"):
+            parts.append(f"Mem avail {host['MemAvailable'] / 1024:.1f}/{host['MemTotal'] / 1024:.1f} GB")
+        if host.get("SwapTotal"):
+            parts.append(f"Swap used {(host['SwapTotal'] - host['SwapFree']) / 1024:.1f} GB")
+        waits = snap.get("waits", {})
+        if waits.get("count"):
+            parts.append(f"Queue wait avg {waits['mean']:.0f}s / max {waits['max']:.0f}s")
+        text = " • ".join(parts) or "Host metrics unavailable"
+        if snap.get("hold"):
+            text += "\n⏸ New launches held: memory pressure"
+        self.host_label.setText(text)
+
+        def fmt(value, pattern):
+            return "–" if value is None else pattern.format(value)
+
+        procs = snap.get("processes", [])
+        self.proc_table.setRowCount(len(procs))
+        for row, p in enumerate(procs):
+            io = "–" if p["read_mb"] is None else f"{p['read_mb']:.0f}/{p['write_mb']:.0f} MB"
+            cells = [str(p["pid"]), p["tag"], fmt(p["cpu"], "{:.0f}"), fmt(p["rss_mb"], "{:.0f} MB"),
+                     io, f"{p['runtime']:.0f}s"]
+            for col, text in enumerate(cells):
+                self.proc_table.setItem(row, col, QTableWidgetItem(text))
+
     # ==================================================
     def add_to_queue(self):
         e = self.input_electrons.text()
@@ -434,6 +585,7 @@ class MainWindow(QMainWindow):
             "energy": en,
             "thickness": th,
             "svg": self.chk_svg.isChecked(),
+            "event_stream": self.chk_events.isChecked(),
             "status": "Waiting"
         }
         self.queue.append(task)
@@ -453,6 +605,28 @@ class MainWindow(QMainWindow):
 
         self.log.append(f"➕ [QUEUE] Task #{task['id']} added")
 
+    # ==================================================
+    def show_preview(self):
+        params = {
+            "electrons": self.input_electrons.text(),
+            "energy": self.input_energy.text(),
+            "thickness": self.input_thickness.text(),
+        }
+        try:
+            if self.surrogate is None:
+                self.surrogate = Surrogate(".")
+            else:
+                self.surrogate.refresh()
+            prediction = self.surrogate.predict(params["thickness"], params["energy"], params["electrons"])
+        except ValueError as e:
+            self.log.append(f"🔮 [PREVIEW] Unavailable: {e}")
+            return
+
+        self.log.append(f"🔮 [PREVIEW] {params['energy']}, {params['thickness']}: "
+                        f"≈{prediction['total']:.0f} ± {prediction['total_err']:.0f} hits")
+        if PreviewDialog(prediction, params, self).exec_() == QDialog.Accepted:
+            self.add_to_queue()
+
     # ==================================================
     def run_queue(self):
         if not self.queue:
@@ -485,11 +659,19 @@ class MainWindow(QMainWindow):
              font.setBold(True)
              item.setFont(font)
 
+        if row == self.table.currentRow():
+            self.show_result(row)
+
     def finish(self):
         self.btn_run.setEnabled(True)
         self.btn_run.setText("INITIATE SEQUENCE")
         self.log.append("--- SEQUENCE COMPLETED ---")
 
+    def closeEvent(self, event):
+        self.resource_worker.requestInterruption()
+        self.resource_worker.wait()
+        super().closeEvent(event)
+
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Memory-bounded capture of GeantSim stdout/stderr.
+
+Instead of buffering (and decoding) a whole run's output, each line is
+streamed as raw bytes into a gzip log file on disk. Only a rolling tail per
+stream and the few lines the runner parses (KEEP_RE) stay in memory, so a run
+with tracking verbosity turned up costs disk, not RAM. prune_logs keeps the
+log directory to the newest MAX_LOGS files and MAX_LOG_BYTES in total.
+
+    python3 output_capture.py tail logs/task_3_ab12.log.gz -n 40
+    python3 output_capture.py search "G4Exception" logs/*.log.gz
+"""
+import argparse
+import glob
+import gzip
+import os
+import re
+import threading
+from collections import deque
+
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+
+TAIL_LINES = 200
+MAX_KEPT = 100000
+MAX_LOGS = 1000
+MAX_LOG_BYTES = 1024 * 1024 * 1024
+# Lines the runner needs: output file names, run summaries and errors
+KEEP_RE = re.compile(rb"Results written to|Run ended!|Event loop time|Total Electrons Detected|"
+                     rb"G4Exception|Batch is interrupted|command .* not found")
+STDERR_PREFIX = b"[stderr] "
+
+
+class OutputCapture:
+    """Drains a child's stdout/stderr pipes into a gzip log plus small in-memory views."""
+
+    def __init__(self, log_path, tail_lines=TAIL_LINES, keep_re=KEEP_RE):
+        os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+        self.log_path = log_path
+        self.keep_re = keep_re
+        self._log = gzip.open(log_path, "wb", compresslevel=1)
+        self._lock = threading.Lock()
+        self._tails = {"stdout": deque(maxlen=tail_lines), "stderr": deque(maxlen=tail_lines)}
+        self._kept = deque(maxlen=MAX_KEPT)
+        self._threads = []
+
+    def attach(self, proc):
+        """Start draining proc.stdout / proc.stderr (opened as binary pipes)."""
+        for name, stream in (("stdout", proc.stdout), ("stderr", proc.stderr)):
+            if stream is None:
+                continue
+            t = threading.Thread(target=self._drain, args=(name, stream), daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _drain(self, name, stream):
+        prefix = STDERR_PREFIX if name == "stderr" else b""
+        tail = self._tails[name]
+        for line in iter(stream.readline, b""):
+            with self._lock:
+                self._log.write(prefix + line)
+                if self.keep_re.search(line):
+                    self._kept.append(line.rstrip(b"\r\n"))
+            tail.append(line.rstrip(b"\r\n"))
+        stream.close()
+
+    def close(self):
+        for t in self._threads:
+            t.join()
+        with self._lock:
+            self._log.close()
+
+    def tail(self, stream="stdout", n=TAIL_LINES):
+        lines = list(self._tails[stream])[-n:]
+        return "\n".join(l.decode(errors="replace") for l in lines)
+
+    def kept(self):
+        return [l.decode(errors="replace") for l in self._kept]
+
+
+def prune_logs(log_dir=LOG_DIR, max_files=MAX_LOGS, max_bytes=MAX_LOG_BYTES):
+    """Delete the oldest logs beyond the newest max_files, or past max_bytes in total."""
+    entries = []
+    for path in glob.glob(os.path.join(log_dir, "*.log.gz")):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue    # pruned by a concurrent run
+        entries.append((st.st_mtime, st.st_size, path))
+    entries.sort(reverse=True)
+
+    total = 0
+    for k, (_, size, path) in enumerate(entries):
+        total += size
+        # The newest log always stays, however large
+        if k >= max_files or (k > 0 and total > max_bytes):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# ==================================================
+# Reading spilled logs
+# ==================================================
+def iter_log(log_path):
+    with gzip.open(log_path, "rb") as f:
+        for line in f:
+            yield line.rstrip(b"\r\n").decode(errors="replace")
+
+
+def tail_log(log_path, n=50):
+    return list(deque(iter_log(log_path), maxlen=n))
+
+
+def search_log(log_path, pattern, max_hits=100):
+    """Yield (line_number, line) for lines matching the regex `pattern`."""
+    rx = re.compile(pattern)
+    hits = 0
+    for lineno, line in enumerate(iter_log(log_path), 1):
+        if rx.search(line):
+            yield lineno, line
+            hits += 1
+            if hits >= max_hits:
+                return
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Inspect spilled GeantSim logs')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+
+    p_tail = sub.add_parser('tail', help='Last lines of a log')
+    p_tail.add_argument('log')
+    p_tail.add_argument('-n', type=int, default=50)
+
+    p_search = sub.add_parser('search', help='Regex search through logs')
+    p_search.add_argument('pattern')
+    p_search.add_argument('logs', nargs='*', help='Log files (default: all in logs/)')
+    p_search.add_argument('--max', type=int, default=100, help='Max hits per file')
+
+    args = parser.parse_args()
+
+    if args.cmd == 'tail':
+        print("\n".join(tail_log(args.log, args.n)))
+    else:
+        for log_path in args.logs or sorted(glob.glob(os.path.join(LOG_DIR, "*.log.gz"))):
+            for lineno, line in search_log(log_path, args.pattern, args.max):
+                print(f"{log_path}:{lineno}: {line}")
@@ -0,0 +1,216 @@
+"""
+Live resource monitoring for the execution engine, straight from /proc (no
+psutil). sim_runner registers every GeantSim child here; one sampler thread
+reads their CPU, RSS and I/O plus host load and memory at a fixed interval,
+so the cost does not grow with how often the GUI repaints.
+
+Sustained memory pressure (little MemAvailable, or PSI memory stalls where the
+kernel reports them) closes the launch gate: sim_runner waits before starting
+new GeantSim processes until the host has headroom again, instead of pushing
+the node into swap. On systems without /proc only run times are reported and
+the gate stays open.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+SAMPLE_INTERVAL = 1.0
+MIN_AVAILABLE_FRACTION = 0.10   # below this share of RAM available counts as pressure
+PSI_SOME_AVG10 = 25.0           # % of time tasks stalled on memory
+SUSTAIN_SAMPLES = 5             # consecutive pressured samples before holding launches
+
+try:
+    CLK_TCK = os.sysconf("SC_CLK_TCK")
+except (ValueError, OSError, AttributeError):
+    CLK_TCK = 100
+
+_lock = threading.Lock()
+_running = {}                   # pid -> {"tag": str, "started": float}
+_waits = deque(maxlen=200)      # recent queue wait times (s)
+
+
+# ==================================================
+# Registry (fed by sim_runner)
+# ==================================================
+def register(pid, tag):
+    with _lock:
+        _running[pid] = {"tag": tag, "started": time.time()}
+
+
+def unregister(pid):
+    with _lock:
+        _running.pop(pid, None)
+
+
+def record_wait(seconds):
+    with _lock:
+        _waits.append(seconds)
+
+
+# ==================================================
+# /proc readers
+# ==================================================
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def read_meminfo():
+    """MemTotal / MemAvailable / SwapTotal / SwapFree in MB, or {} without /proc."""
+    text = _read("/proc/meminfo")
+    if not text:
+        return {}
+    info = {}
+    for line in text.splitlines():
+        key, _, rest = line.partition(":")
+        if key in ("MemTotal", "MemAvailable", "SwapTotal", "SwapFree"):
+            info[key] = int(rest.split()[0]) / 1024
+    return info
+
+
+def read_psi_memory():
+    """'some avg10' from /proc/pressure/memory, or None where PSI is unavailable."""
+    text = _read("/proc/pressure/memory")
+    if not text:
+        return None
+    for line in text.splitlines():
+        if line.startswith("some"):
+            for field in line.split()[1:]:
+                k, _, v = field.partition("=")
+                if k == "avg10":
+                    return float(v)
+    return None
+
+
+def read_proc(pid):
+    """Raw counters for one process: cpu ticks, rss MB, io bytes; None if it is gone."""
+    stat = _read(f"/proc/{pid}/stat")
+    if stat is None:
+        return None
+    # comm may contain spaces; fields after the closing paren are fixed
+    fields = stat.rsplit(")", 1)[1].split()
+    sample = {
+        "ticks": int(fields[11]) + int(fields[12]),   # utime + stime
+        "rss_mb": int(fields[21]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024),
+        "read_mb": None,
+        "write_mb": None,
+    }
+    io = _read(f"/proc/{pid}/io")
+    if io:
+        for line in io.splitlines():
+            k, _, v = line.partition(":")
+            if k == "read_bytes":
+                sample["read_mb"] = int(v) / (1024 * 1024)
+            elif k == "write_bytes":
+                sample["write_mb"] = int(v) / (1024 * 1024)
+    return sample
+
+
+# ==================================================
+# Sampler
+# ==================================================
+class ResourceMonitor:
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.snapshot = {"time": time.time(), "processes": [], "host": {}, "waits": {}, "hold": False}
+        self._prev = {}             # pid -> (time, ticks)
+        self._pressured = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def sample(self):
+        now = time.time()
+        with _lock:
+            running = dict(_running)
+            waits = list(_waits)
+
+        processes = []
+        for pid, info in running.items():
+            entry = {"pid": pid, "tag": info["tag"], "runtime": now - info["started"],
+                     "cpu": None, "rss_mb": None, "read_mb": None, "write_mb": None}
+            raw = read_proc(pid)
+            if raw:
+                prev = self._prev.get(pid)
+                if prev and now > prev[0]:
+                    entry["cpu"] = 100.0 * (raw["ticks"] - prev[1]) / CLK_TCK / (now - prev[0])
+                self._prev[pid] = (now, raw["ticks"])
+                entry.update(rss_mb=raw["rss_mb"], read_mb=raw["read_mb"], write_mb=raw["write_mb"])
+            processes.append(entry)
+        for pid in set(self._prev) - set(running):
+            del self._prev[pid]
+
+        host = read_meminfo()
+        try:
+            host["load"] = os.getloadavg()
+        except OSError:
+            host["load"] = None
+        host["psi_avg10"] = read_psi_memory()
+
+        self._pressured = self._pressured + 1 if self._under_pressure(host) else 0
+        self.snapshot = {
+            "time": now,
+            "processes": sorted(processes, key=lambda p: p["pid"]),
+            "host": host,
+            "waits": {
+                "count": len(waits),
+                "mean": sum(waits) / len(waits) if waits else 0.0,
+                "max": max(waits) if waits else 0.0,
+            },
+            "hold": self.holding(),
+        }
+        return self.snapshot
+
+    @staticmethod
+    def _under_pressure(host):
+        total, avail = host.get("MemTotal"), host.get("MemAvailable")
+        if total and avail is not None and avail / total < MIN_AVAILABLE_FRACTION:
+            return True
+        psi = host.get("psi_avg10")
+        return psi is not None and psi > PSI_SOME_AVG10
+
+    def holding(self):
+        """True while memory pressure has lasted SUSTAIN_SAMPLES samples."""
+        return self._pressured >= SUSTAIN_SAMPLES
+
+    def wait_for_headroom(self, should_stop=lambda: False, log=None):
+        """Block new launches while the host is under sustained memory pressure."""
+        if not self.holding():
+            return
+        if log:
+            log("⏸️  Memory pressure: holding new launches")
+        while self.holding() and not should_stop():
+            if self._thread is None:
+                self.sample()  # nobody else is sampling
+            time.sleep(self.interval)
+        if log and not should_stop():
+            log("▶️  Memory headroom back, resuming launches")
+
+
+_monitor = None
+
+
+def get_monitor():
+    """Process-wide monitor, started on first use."""
+    global _monitor
+    with _lock:
+        if _monitor is None:
+            _monitor = ResourceMonitor().start()
+    return _monitor
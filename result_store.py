@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Tiered storage for old results.
+
+Runs that have not changed for a while are moved out of the results
+directory into append-only archive segments: each file (CSV, metadata JSON,
+SVG) becomes an independent lzma member, located through a compact JSON
+index that maps a run ID (the CSV stem, e.g. `results_2cm_3`) to
+(segment, offset, length). The working directory stays small, so listings
+and the name probing in RunAction stay fast, while readers (HitMap.from_csv,
+sim_runner.read_metadata, visualize_results, atlas, shower_fit, surrogate)
+still open an archived run by its usual name. Recently read files are
+kept decompressed in a small LRU cache.
+
+    python3 result_store.py archive results/ --older-than 30
+    python3 result_store.py list results/
+    python3 result_store.py cat results/results_2cm_3.csv
+    python3 result_store.py restore results/results_2cm_3
+
+The archive also records the next free counter per `results_<thickness>_`
+prefix in `.results_next`, which RunAction and claim_result_name start
+probing from, so new runs never reuse an archived run's name.
+
+Runs with a per-event `.events` stream are not archived at all: the stream
+is memory-mapped in place by event_stream (uncertainty, canary), so it and
+the CSV it belongs to stay live. Delete a stream you no longer need to let
+its run be archived.
+"""
+import argparse
+import fcntl
+import fnmatch
+import glob
+import io
+import json
+import lzma
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+ARCHIVE_DIR = "archive"
+INDEX_FILE = "index.json"
+LOCK_FILE = ".lock"
+HINT_FILE = ".results_next"
+SEGMENT_BYTES = 64 * 1024 * 1024   # roll over to a new segment past this size
+CACHE_BYTES = 32 * 1024 * 1024     # decompressed bytes kept in memory
+EXTENSIONS = (".csv", ".json", ".svg")
+STREAM_EXT = ".events"              # never archived, see the module docstring
+RUN_ID_RE = re.compile(r"^(results_.*_)(\d+)$")
+
+
+def split_ref(path):
+    """'dir/results_2cm_3.csv' -> ('dir', 'results_2cm_3', '.csv'); a bare run ID means its CSV."""
+    directory, name = os.path.split(path)
+    run_id, ext = os.path.splitext(name)
+    if ext not in EXTENSIONS:
+        run_id, ext = name, ".csv"
+    return directory or ".", run_id, ext
+
+
+class ResultStore:
+    def __init__(self, results_dir="."):
+        self.results_dir = results_dir
+        self.archive_dir = os.path.join(results_dir, ARCHIVE_DIR)
+        self.index_path = os.path.join(self.archive_dir, INDEX_FILE)
+        self._index = {"version": 1, "segments": [], "next": {}, "runs": {}}
+        self._index_mtime = None
+        self._cache = OrderedDict()     # (run_id, ext) -> bytes
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+
+    # --- index ---------------------------------------------------------
+    def _load_index(self):
+        """Re-read the index if another process has rewritten it."""
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except OSError:
+            return self._index
+        if mtime != self._index_mtime:
+            with open(self.index_path) as f:
+                self._index = json.load(f)
+            self._index_mtime = mtime
+            with self._lock:
+                self._cache.clear()
+                self._cache_bytes = 0
+        return self._index
+
+    def _save_index(self, index):
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.index_path)
+
+        hint = os.path.join(self.results_dir, HINT_FILE)
+        with open(hint + ".tmp", "w") as f:
+            for prefix, counter in sorted(index["next"].items()):
+                f.write(f"{prefix} {counter}\n")
+        os.replace(hint + ".tmp", hint)
+
+    def archived_ids(self):
+        return sorted(self._load_index()["runs"])
+
+    def is_archived(self, run_id):
+        return run_id in self._load_index()["runs"]
+
+    def next_counter(self, prefix):
+        """First counter after every archived `prefix<n>` run (1 if none)."""
+        return self._load_index()["next"].get(prefix, 1)
+
+    # --- reading ---------------------------------------------------------
+    def _live_path(self, run_id, ext):
+        return os.path.join(self.results_dir, run_id + ext)
+
+    def exists(self, run_id, ext=".csv"):
+        if os.path.exists(self._live_path(run_id, ext)):
+            return True
+        run = self._load_index()["runs"].get(run_id)
+        return bool(run and ext in run["files"])
+
+    def getmtime(self, run_id, ext=".csv"):
+        live = self._live_path(run_id, ext)
+        if os.path.exists(live):
+            return os.path.getmtime(live)
+        run = self._load_index()["runs"].get(run_id)
+        if not run or ext not in run["files"]:
+            raise FileNotFoundError(live)
+        return run["mtime"]
+
+    def read(self, run_id, ext=".csv"):
+        """File contents as bytes; the live copy wins over the archived one."""
+        live = self._live_path(run_id, ext)
+        if os.path.exists(live):
+            with open(live, "rb") as f:
+                return f.read()
+
+        index = self._load_index()
+        run = index["runs"].get(run_id)
+        if not run or ext not in run["files"]:
+            raise FileNotFoundError(live)
+
+        key = (run_id, ext)
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self._cache.move_to_end(key)
+                return data
+
+        seg, offset, length = run["files"][ext]
+        with open(os.path.join(self.archive_dir, index["segments"][seg]), "rb") as f:
+            f.seek(offset)
+            data = lzma.decompress(f.read(length))
+
+        with self._lock:
+            self._cache[key] = data
+            self._cache_bytes += len(data)
+            while self._cache_bytes > CACHE_BYTES and len(self._cache) > 1:
+                _, old = self._cache.popitem(last=False)
+                self._cache_bytes -= len(old)
+        return data
+
+    # --- archiving ---------------------------------------------------------
+    def _locked(self):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        f = open(os.path.join(self.archive_dir, LOCK_FILE), "w")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def archive(self, older_than_days=30, log=print):
+        """Move runs whose files are all older than the cutoff into the archive. Returns the count."""
+        cutoff = time.time() - older_than_days * 86400
+        lock = self._locked()
+        try:
+            self._index_mtime = None
+            index = self._load_index()
+            runs, streamed = [], 0
+            for csv_file in sorted(glob.glob(os.path.join(self.results_dir, "results_*.csv"))):
+                run_id = os.path.splitext(os.path.basename(csv_file))[0]
+                files = [self._live_path(run_id, ext) for ext in EXTENSIONS]
+                files = [p for p in files if os.path.exists(p)]
+                if os.path.exists(self._live_path(run_id, STREAM_EXT)):
+                    streamed += 1
+                    continue
+                if max(os.path.getmtime(p) for p in files) < cutoff:
+                    runs.append((run_id, files))
+            if streamed and log:
+                log(f"🗄️  Keeping {streamed} run(s) with a per-event stream live")
+            if not runs:
+                if log:
+                    log(f"🗄️  Nothing older than {older_than_days:g} day(s) to archive")
+                return 0
+
+            segment = self._open_segment(index)
+            try:
+                for run_id, files in runs:
+                    entry = {"mtime": os.path.getmtime(files[0]), "files": {}}
+                    for path in files:
+                        with open(path, "rb") as f:
+                            blob = lzma.compress(f.read())
+                        if segment.tell() + len(blob) > SEGMENT_BYTES and segment.tell() > 0:
+                            segment.close()
+                            segment = self._open_segment(index, new=True)
+                        entry["files"][os.path.splitext(path)[1]] = \
+                            [len(index["segments"]) - 1, segment.tell(), len(blob)]
+                        segment.write(blob)
+                    index["runs"][run_id] = entry
+
+                    m = RUN_ID_RE.match(run_id)
+                    if m:
+                        prefix, counter = m.group(1), int(m.group(2))
+                        index["next"][prefix] = max(index["next"].get(prefix, 1), counter + 1)
+                segment.flush()
+                os.fsync(segment.fileno())
+            finally:
+                segment.close()
+
+            # Originals go only once the index pointing at their copies is on disk
+            self._save_index(index)
+            for _, files in runs:
+                for path in files:
+                    os.remove(path)
+            if log:
+                log(f"🗄️  Archived {len(runs)} run(s) into {self.archive_dir}")
+            return len(runs)
+        finally:
+            lock.close()
+
+    def _open_segment(self, index, new=False):
+        segments = index["segments"]
+        if segments and not new:
+            path = os.path.join(self.archive_dir, segments[-1])
+            if os.path.getsize(path) < SEGMENT_BYTES:
+                return open(path, "ab")
+        segments.append(f"segment_{len(segments) + 1:04d}.xz")
+        return open(os.path.join(self.archive_dir, segments[-1]), "ab")
+
+    def restore(self, run_id):
+        """Write an archived run's files back into the results directory."""
+        lock = self._locked()
+        try:
+            self._index_mtime = None
+            run = self._load_index()["runs"].get(run_id)
+            if not run:
+                raise FileNotFoundError(f"{run_id} is not archived")
+            restored = []
+            for ext in run["files"]:
+                path = self._live_path(run_id, ext)
+                if not os.path.exists(path):
+                    data = self.read(run_id, ext)
+                    with open(path, "wb") as f:
+                        f.write(data)
+                    os.utime(path, (run["mtime"], run["mtime"]))
+                restored.append(path)
+            index = self._load_index()
+            del index["runs"][run_id]
+            self._save_index(index)
+            return restored
+        finally:
+            lock.close()
+
+
+# ==================================================
+# Path-based helpers for readers
+# ==================================================
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(results_dir="."):
+    """One ResultStore (and cache) per results directory per process."""
+    key = os.path.abspath(results_dir)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = ResultStore(results_dir)
+        return _stores[key]
+
+
+def exists(path):
+    directory, run_id, ext = split_ref(path)
+    return get_store(directory).exists(run_id, ext)
+
+
+def getmtime(path):
+    directory, run_id, ext = split_ref(path)
+    return get_store(directory).getmtime(run_id, ext)
+
+
+def read_bytes(path):
+    directory, run_id, ext = split_ref(path)
+    return get_store(directory).read(run_id, ext)
+
+
+def open_file(path):
+    """Binary file object for a live or archived result file."""
+    if os.path.exists(path):
+        return open(path, "rb")
+    return io.BytesIO(read_bytes(path))
+
+
+def archived_paths(pattern):
+    """Archived run CSVs matching a directory or glob, as 'dir/<run_id>.csv' paths."""
+    if os.path.isdir(pattern):
+        directory, name_glob = pattern, "results_*.csv"
+    else:
+        directory, name_glob = os.path.split(pattern)
+        directory = directory or "."
+    if not os.path.exists(os.path.join(directory, ARCHIVE_DIR, INDEX_FILE)):
+        return []
+    return [os.path.join(directory, run_id + ".csv") for run_id in get_store(directory).archived_ids()
+            if fnmatch.fnmatch(run_id + ".csv", name_glob)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Archive old results into compressed segments')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+
+    p_archive = sub.add_parser('archive', help='Move old runs into the archive')
+    p_archive.add_argument('dir', nargs='?', default='.')
+    p_archive.add_argument('--older-than', type=float, default=30, help='Age in days (default: 30)')
+
+    p_list = sub.add_parser('list', help='List archived runs')
+    p_list.add_argument('dir', nargs='?', default='.')
+
+    p_cat = sub.add_parser('cat', help='Print an archived file (run ID or file name)')
+    p_cat.add_argument('ref')
+
+    p_restore = sub.add_parser('restore', help='Move a run back out of the archive')
+    p_restore.add_argument('ref')
+
+    args = parser.parse_args()
+
+    if args.cmd == 'archive':
+        get_store(args.dir).archive(args.older_than)
+    elif args.cmd == 'list':
+        store = get_store(args.dir)
+        runs = store._load_index()["runs"]
+        for run_id in store.archived_ids():
+            run = runs[run_id]
+            kinds = ",".join(ext[1:] for ext in run["files"])
+            print(f"{run_id}\t{time.strftime('%Y-%m-%d %H:%M', time.localtime(run['mtime']))}\t{kinds}")
+    elif args.cmd == 'cat':
+        try:
+            print(read_bytes(args.ref).decode(errors="replace"), end="")
+        except FileNotFoundError:
+            parser.exit(1, f"{args.ref}: no such live or archived file\n")
+    else:
+        directory, run_id, _ = split_ref(args.ref)
+        for path in get_store(directory).restore(run_id):
+            print(f"↩️  Restored {path}")
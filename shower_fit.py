@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Longitudinal shower-profile fits over thickness sweeps.
+
+Every stored run with a metadata sidecar gives one point: electrons reaching
+the calorimeter per primary, at depth t = thickness / X0 in lead. Runs are
+grouped by beam energy and each group is fitted with the gamma-distribution
+profile
+
+    N(t) = A * t^(a-1) * exp(-b t)
+    ln N = ln A + (a-1) ln t - b t
+
+which is linear in (ln A, a-1, b). Points are weighted by their hit counts,
+since Poisson noise on ln N is 1/sqrt(hits). All energies are solved together
+as one batch of 3x3 normal equations. The shower maximum is
+tmax = (a-1)/b, in radiation lengths.
+
+    python3 shower_fit.py results/ -o fits.csv
+"""
+import argparse
+import math
+import os
+from collections import defaultdict
+
+import numpy as np
+
+import sim_runner
+from hitmap import HitMap
+from visualize_results import collect_files
+
+X0_PB_CM = 0.56         # radiation length of lead
+EC_PB_GEV = 7.4e-3      # critical energy of lead
+N_PARAMS = 3
+FIELDS = ["energy_gev", "points", "ln_A", "ln_A_err", "a", "a_err", "b", "b_err",
+          "tmax_x0", "tmax_x0_err", "tmax_cm", "tmax_cm_err", "tmax_expected_x0", "chi2_ndf"]
+
+
+def collect_sweeps(files):
+    """
+    {energy_gev: (t_x0, hits, electrons)} from runs with metadata. Repeated
+    runs at the same thickness are pooled (hits and electrons summed).
+    """
+    pooled = defaultdict(lambda: [0, 0])    # (energy, thickness_cm) -> [hits, electrons]
+    for csv_file in files:
+        meta = sim_runner.read_metadata(csv_file)
+        if not meta:
+            continue
+        try:
+            energy = sim_runner.parse_quantity(meta["energy"], sim_runner.ENERGY_UNITS)
+            thickness = sim_runner.parse_quantity(meta["thickness"], sim_runner.LENGTH_UNITS)
+            hits = HitMap.from_csv(csv_file, meta.get("grid")).sum()
+        except (ValueError, KeyError, OSError):
+            continue
+        entry = pooled[(round(energy, 9), round(thickness, 9))]
+        entry[0] += hits
+        entry[1] += int(meta["electrons"])
+
+    sweeps = defaultdict(list)
+    for (energy, thickness), (hits, electrons) in pooled.items():
+        sweeps[energy].append((thickness / X0_PB_CM, hits, electrons))
+    return {e: tuple(np.array(col, dtype=np.float64) for col in zip(*sorted(points)))
+            for e, points in sorted(sweeps.items())}
+
+
+def fit_profiles(sweeps):
+    """
+    Fit every sweep at once. Returns one dict per energy (FIELDS); sweeps with
+    fewer than three usable depths get NaN parameters.
+    """
+    energies = list(sweeps)
+    if not energies:
+        return []
+    n_max = max(len(sweeps[e][0]) for e in energies)
+
+    # Padded batch: design matrix X (E, n, 3), response y and weights w (E, n)
+    X = np.zeros((len(energies), n_max, N_PARAMS))
+    y = np.zeros((len(energies), n_max))
+    w = np.zeros((len(energies), n_max))
+    for k, e in enumerate(energies):
+        t, hits, electrons = sweeps[e]
+        usable = (t > 0) & (hits > 0) & (electrons > 0)
+        m = int(usable.sum())
+        t, hits, electrons = t[usable], hits[usable], electrons[usable]
+        X[k, :m] = np.column_stack([np.ones(m), np.log(t), -t])
+        y[k, :m] = np.log(hits / electrons)
+        w[k, :m] = hits
+
+    points = (w > 0).sum(axis=1)
+    ok = points >= N_PARAMS
+    XtW = X.transpose(0, 2, 1) * w[:, None, :]
+    normal = XtW @ X
+    # Keep the batch solvable; underdetermined rows are masked out afterwards
+    normal[~ok] = np.eye(N_PARAMS)
+    cov = np.linalg.pinv(normal)
+    beta = np.einsum("eij,ej->ei", cov, np.einsum("eij,ej->ei", XtW, y))
+
+    resid = y - np.einsum("enp,ep->en", X, beta)
+    chi2 = (w * resid ** 2).sum(axis=1)
+    ndf = points - N_PARAMS
+    chi2_ndf = np.where(ndf > 0, chi2 / np.maximum(ndf, 1), np.nan)
+    # Widen errors when the model does not describe the points within Poisson noise
+    cov = cov * np.where(ndf > 0, np.maximum(chi2_ndf, 1.0), 1.0)[:, None, None]
+    err = np.sqrt(np.clip(np.diagonal(cov, axis1=1, axis2=2), 0, None))
+
+    a1, b = beta[:, 1], beta[:, 2]
+    tmax = a1 / b
+    # d tmax / d(a-1) = 1/b, d tmax / db = -(a-1)/b^2
+    grad = np.stack([np.zeros_like(b), 1.0 / b, -a1 / b ** 2], axis=1)
+    tmax_err = np.sqrt(np.clip(np.einsum("ei,eij,ej->e", grad, cov, grad), 0, None))
+
+    fits = []
+    for k, e in enumerate(energies):
+        valid = ok[k] and b[k] > 0
+        nan = float("nan")
+        pick = (lambda v: float(v)) if valid else (lambda v: nan)
+        fits.append({
+            "energy_gev": e,
+            "points": int(points[k]),
+            "ln_A": pick(beta[k, 0]), "ln_A_err": pick(err[k, 0]),
+            "a": pick(a1[k] + 1.0), "a_err": pick(err[k, 1]),
+            "b": pick(b[k]), "b_err": pick(err[k, 2]),
+            "tmax_x0": pick(tmax[k]), "tmax_x0_err": pick(tmax_err[k]),
+            "tmax_cm": pick(tmax[k] * X0_PB_CM), "tmax_cm_err": pick(tmax_err[k] * X0_PB_CM),
+            # Longo-Sestili expectation for an electron-initiated shower
+            "tmax_expected_x0": math.log(e / EC_PB_GEV) - 0.5,
+            "chi2_ndf": float(chi2_ndf[k]) if valid else nan,
+        })
+    return fits
+
+
+def write_csv(fits, output):
+    with open(output, "w") as f:
+        f.write(",".join(FIELDS) + "\n")
+        for fit in fits:
+            f.write(",".join(f"{fit[k]:.6g}" for k in FIELDS) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fit longitudinal shower profiles to thickness sweeps')
+    parser.add_argument('files', nargs='*', default=['.'], help='CSV files, globs or directories (default: .)')
+    parser.add_argument('-o', '--output', help='Write the fitted parameters to this CSV')
+
+    args = parser.parse_args()
+
+    sweeps = collect_sweeps(collect_files(args.files, archived=True))
+    fits = fit_profiles(sweeps)
+    if not fits:
+        parser.exit(1, "No runs with metadata found\n")
+
+    print(f"{'E [GeV]':>10} {'pts':>4} {'a':>14} {'b':>14} {'tmax [X0]':>16} {'tmax [cm]':>16} {'expect':>7} {'chi2/ndf':>9}")
+    for fit in fits:
+        print(f"{fit['energy_gev']:10.4g} {fit['points']:4d} "
+              f"{fit['a']:7.3f}±{fit['a_err']:<6.3f} {fit['b']:7.3f}±{fit['b_err']:<6.3f} "
+              f"{fit['tmax_x0']:8.3f}±{fit['tmax_x0_err']:<7.3f} {fit['tmax_cm']:8.3f}±{fit['tmax_cm_err']:<7.3f} "
+              f"{fit['tmax_expected_x0']:7.2f} {fit['chi2_ndf']:9.2f}")
+
+    if args.output:
+        write_csv(fits, args.output)
+        print(f"✅ Fits saved to: {os.path.abspath(args.output)} ({len(fits)} energies)")
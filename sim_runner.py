@@ -0,0 +1,678 @@
+"""
+Execution layer shared by the GUIs: turns queue tasks into GeantSim macros,
+runs them (optionally several processes at once) and collects the results.
+
+Every process runs in its own scratch directory so concurrent runs cannot
+race on the `results_<thickness>_<n>.csv` name probing in RunAction; the CSV
+is moved back into the results directory under the next free name.
+
+Runs get a timeout derived from the runtime of earlier runs (events x beam
+energy). A task with `shards` > 1 is split over several processes with their
+own seeds; slow or hung shards are relaunched speculatively and only the
+first copy of each shard to finish goes into the merged hit map.
+"""
+import glob
+import json
+import os
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import event_stream
+import resource_monitor
+import result_store
+from output_capture import LOG_DIR, OutputCapture, prune_logs
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+GEANTSIM = os.environ.get("GEANTSIM", os.path.join(PROJECT_DIR, "build", "GeantSim"))
+SCRATCH_DIR = os.path.join(PROJECT_DIR, ".sim_scratch")
+
+MAX_GROUP = 16  # most /run/beamOn blocks packed into one macro
+
+TIMEOUT_FACTOR = 4.0        # a run is killed after this many times its expected runtime
+MIN_TIMEOUT = 60.0          # s, floor covering initialisation and noisy estimates
+COLD_RATE = 0.2             # s per event x GeV allowed on top of MIN_TIMEOUT before any run is timed
+POLL_INTERVAL = 0.05        # s between checks on a run that can time out or be cancelled
+SPECULATE_AFTER = 0.75      # share of shards finished before stragglers get a second copy
+STRAGGLER_FACTOR = 1.5      # x median finished shard runtime that marks a straggler
+MAX_ATTEMPTS = 3            # launches per shard, counting relaunches and speculative copies
+MIN_SHARD_EVENTS = 1000     # idle-process sharding never makes shards smaller than this
+
+RESULT_RE = re.compile(r"Results written to\s+['\"](.*?)['\"]")
+
+# Detector layout built in DetectorConstruction::DefineVolumes
+GRID = {"nx": 21, "ny": 21, "x0": -10, "y0": -10}
+
+LENGTH_UNITS = {"um": 1e-4, "mm": 0.1, "cm": 1.0, "m": 100.0}  # -> cm
+ENERGY_UNITS = {"eV": 1e-9, "keV": 1e-6, "MeV": 1e-3, "GeV": 1.0, "TeV": 1e3}  # -> GeV
+
+
+def parse_quantity(text, units):
+    """'2 cm' / '500MeV' -> float in the base unit of `units` (cm or GeV)."""
+    m = re.match(r"\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*([A-Za-z]*)\s*$", str(text))
+    if not m:
+        raise ValueError(f"Cannot parse quantity: {text!r}")
+    value, unit = float(m.group(1)), m.group(2)
+    if not unit:
+        return value
+    if unit not in units:
+        raise ValueError(f"Unknown unit {unit!r} in {text!r}")
+    return value * units[unit]
+
+
+def metadata_path(csv_file):
+    return os.path.splitext(csv_file)[0] + ".json"
+
+
+def write_metadata(csv_file, task, **extra):
+    """Sidecar JSON next to a result CSV recording how it was produced."""
+    meta = {
+        "thickness": task["thickness"],
+        "energy": task["energy"],
+        "electrons": int(task["electrons"]),
+        "grid": GRID,
+    }
+    meta.update(extra)
+    with open(metadata_path(csv_file), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def read_metadata(csv_file):
+    """Sidecar metadata for a result CSV (live or archived), or None for runs made outside the runner."""
+    try:
+        with result_store.open_file(metadata_path(csv_file)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build_macro(task, threads=None):
+    """Macro text for one queue task (thickness must be set before /run/initialize)."""
+    return build_group_macro([task], threads)
+
+
+def build_group_macro(tasks, threads=None, seeds=None):
+    """One macro for tasks sharing a geometry: initialise once, then one /run/beamOn block per task."""
+    for task in tasks:
+        if any(ch in str(task[k]) for k in ("thickness", "energy", "electrons") for ch in "\r\n"):
+            raise ValueError(f"Task {task.get('id', '?')}: line break in a macro value")
+    lines = [f"/BFS/geometry/leadThickness {tasks[0]['thickness']}"]
+    if threads:
+        lines.append(f"/run/numberOfThreads {threads}")
+    lines += ["/run/initialize", "/gun/particle e-"]
+    if seeds:
+        lines.append(f"/random/setSeeds {seeds[0]} {seeds[1]}")
+    streams = any(task.get("event_stream") for task in tasks)
+    for task in tasks:
+        lines.append(f"/gun/energy {task['energy']}")
+        if streams:
+            lines.append(f"/BFS/output/eventStream {'true' if task.get('event_stream') else 'false'}")
+        lines.append(f"/run/beamOn {task['electrons']}")
+    return "\n".join(lines) + "\n"
+
+
+def geometry_key(task):
+    """Tasks with equal keys can share one GeantSim process (same /run/initialize)."""
+    try:
+        return round(parse_quantity(task["thickness"], LENGTH_UNITS), 9)
+    except ValueError:
+        return str(task["thickness"]).strip()
+
+
+def can_coalesce(task):
+    """Tasks with no events produce no output file, and sharded tasks span processes, so both run alone."""
+    try:
+        return int(task["electrons"]) > 0 and int(task.get("shards") or 1) <= 1
+    except (TypeError, ValueError, KeyError):
+        return False
+
+
+def plan_groups(tasks, max_group=MAX_GROUP, processes=1):
+    """
+    Split task indices into groups of equal geometry, in order of first
+    appearance. Groups are capped so a batch still spreads over `processes`.
+    """
+    cap = max(1, min(max_group, -(-len(tasks) // max(1, processes))))
+    groups, open_groups = [], {}
+    for i, task in enumerate(tasks):
+        if not can_coalesce(task):
+            groups.append([i])
+            continue
+        key = geometry_key(task)
+        group = open_groups.get(key)
+        if group is None or len(group) >= cap:
+            group = open_groups[key] = []
+            groups.append(group)
+        group.append(i)
+    return groups
+
+
+def claim_result_name(name, results_dir="."):
+    """Reserve `name` in results_dir, bumping the trailing counter if it is taken (or archived)."""
+    base, ext = os.path.splitext(os.path.basename(name))
+    m = re.match(r"(.*_)(\d+)$", base)
+    prefix, counter = (m.group(1), int(m.group(2))) if m else (base + "_", 1)
+    counter = max(counter, result_store.get_store(results_dir).next_counter(prefix))
+
+    while True:
+        candidate = os.path.join(results_dir, f"{prefix}{counter}{ext}")
+        try:
+            fd = os.open(candidate, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.close(fd)
+            return candidate
+        except FileExistsError:
+            counter += 1
+
+
+# ==================================================
+# Expected runtimes and timeouts
+# ==================================================
+_history_lock = threading.Lock()
+_history = deque(maxlen=200)    # seconds per unit of work of recent runs
+_history_dirs = set()
+
+
+def task_work(task):
+    """Events x beam energy in GeV: shower CPU time grows with both."""
+    try:
+        return int(task["electrons"]) * parse_quantity(task["energy"], ENERGY_UNITS)
+    except (KeyError, TypeError, ValueError):
+        return 0.0
+
+
+def record_runtime(tasks, elapsed):
+    work = sum(task_work(t) for t in tasks)
+    if work > 0 and elapsed > 0:
+        with _history_lock:
+            _history.append(elapsed / work)
+
+
+def _seed_history(results_dir):
+    """Learn from the newest sidecars in results_dir, once per directory."""
+    key = os.path.abspath(results_dir)
+    with _history_lock:
+        if key in _history_dirs:
+            return
+        _history_dirs.add(key)
+
+    def mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return 0.0
+
+    sidecars = sorted(glob.glob(os.path.join(results_dir, "results_*.json")), key=mtime)
+    for path in sidecars[-_history.maxlen:]:
+        try:
+            with open(path) as f:
+                meta = json.load(f)
+            # A sharded run's wall time includes its stragglers; use its typical shard
+            elapsed = meta.get("shard_elapsed") or meta["elapsed"] / meta.get("group_size", 1)
+        except (OSError, ValueError, KeyError, TypeError):
+            continue
+        shards = meta.get("shards", 1)
+        record_runtime([dict(meta, electrons=int(meta["electrons"]) // shards)], elapsed)
+
+
+def expected_runtime(tasks, results_dir="."):
+    """Seconds the tasks should take in one process, or None before any run has been timed."""
+    _seed_history(results_dir)
+    with _history_lock:
+        rates = sorted(_history)
+    if not rates:
+        return None
+    return rates[len(rates) // 2] * sum(task_work(t) for t in tasks)
+
+
+def timeout_for(tasks, results_dir="."):
+    """
+    Kill deadline in seconds for one process running `tasks`. Without
+    runtime history it is a deliberately loose MIN_TIMEOUT + COLD_RATE x
+    work, so a hung first run is still killed.
+    """
+    expected = expected_runtime(tasks, results_dir)
+    if expected is None:
+        return MIN_TIMEOUT + COLD_RATE * sum(task_work(t) for t in tasks)
+    return max(MIN_TIMEOUT, TIMEOUT_FACTOR * expected)
+
+
+def max_rss_mb(usage):
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return usage.ru_maxrss / scale
+
+
+def run_process(cmd, cwd=None, log_path=None, tag=None, timeout=None, cancel=None):
+    """
+    Run cmd with its output spilled to a gzip log (see output_capture).
+    Returns (returncode, capture, rusage, stopped) with rusage for that child
+    alone. The child is killed once `timeout` seconds have passed or the
+    `cancel()` callable returns true; stopped is then "timeout" or
+    "cancelled", otherwise None. While it runs, the child is visible to
+    resource_monitor under `tag`.
+    """
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    resource_monitor.register(proc.pid, tag or os.path.basename(cmd[-1]))
+    stopped = None
+    try:
+        capture = OutputCapture(log_path or os.path.join(LOG_DIR, f"pid{proc.pid}.log.gz"))
+        capture.attach(proc)
+
+        # wait4 instead of proc.wait() so we get this child's own resource usage
+        if timeout is None and cancel is None:
+            _, status, usage = os.wait4(proc.pid, 0)
+        else:
+            deadline = None if timeout is None else time.time() + timeout
+            while True:
+                pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+                if pid:
+                    break
+                if stopped is None:
+                    if deadline is not None and time.time() > deadline:
+                        stopped = "timeout"
+                    elif cancel is not None and cancel():
+                        stopped = "cancelled"
+                    if stopped:
+                        proc.kill()
+                time.sleep(POLL_INTERVAL)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        capture.close()
+    finally:
+        resource_monitor.unregister(proc.pid)
+    return proc.returncode, capture, usage, stopped
+
+
+def run_macro(macro, tag="x", binary=None, results_dir=".", keep_output=True, timeout=None, cancel=None):
+    """
+    Run one macro in a private scratch directory. Returns a dict with the
+    outcome: ok, csv (result files in run order), returncode, stdout_tail,
+    stderr_tail, kept (parsed lines), log (full gzip log), elapsed, rss_mb,
+    stopped (see run_process). Without keep_output (autotune probes, canary
+    init runs) a successful run leaves nothing behind, not even its log.
+    """
+    binary = os.path.abspath(binary or GEANTSIM)
+    os.makedirs(SCRATCH_DIR, exist_ok=True)
+    scratch = tempfile.mkdtemp(prefix=f"task_{tag}_", dir=SCRATCH_DIR)
+    mac_file = os.path.join(scratch, "task.mac")
+    with open(mac_file, "w") as f:
+        f.write(macro)
+
+    start = time.time()
+    try:
+        log_path = os.path.join(LOG_DIR, os.path.basename(scratch) + ".log.gz")
+        returncode, capture, usage, stopped = run_process([binary, mac_file], cwd=scratch,
+                                                          log_path=log_path, tag=f"task {tag}",
+                                                          timeout=timeout, cancel=cancel)
+        kept = capture.kept()
+        result = {
+            "ok": returncode == 0 and stopped is None,
+            "csv": [],
+            "returncode": returncode,
+            "stdout_tail": capture.tail("stdout"),
+            "stderr_tail": capture.tail("stderr"),
+            "kept": kept,
+            "log": log_path,
+            "elapsed": time.time() - start,
+            "rss_mb": max_rss_mb(usage),
+            "stopped": stopped,
+        }
+        if keep_output:
+            for name in RESULT_RE.findall("\n".join(kept)):
+                src = os.path.join(scratch, name)
+                if os.path.exists(src):
+                    dest = claim_result_name(name, results_dir)
+                    shutil.move(src, dest)
+                    result["csv"].append(dest)
+                    # The per-event stream follows its CSV's (possibly bumped) name
+                    if os.path.exists(event_stream.stream_path(src)):
+                        shutil.move(event_stream.stream_path(src), event_stream.stream_path(dest))
+        elif result["ok"]:
+            drop_log(result)
+        return result
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+        prune_logs()
+
+
+def drop_log(result):
+    """Delete a run's log when nobody will read it."""
+    if result.get("log"):
+        try:
+            os.remove(result["log"])
+        except OSError:
+            pass
+        result["log"] = None
+
+
+def run_group(tasks, binary=None, threads=None, results_dir=".", keep_output=True, timeout=None):
+    """
+    Run same-geometry tasks in one process. The i-th "Results written to"
+    line belongs to the i-th /run/beamOn block, so result["outputs"][k] holds
+    the files of tasks[k] (empty if the process died before reaching it).
+    """
+    tag = "-".join(str(t.get("id", "x")) for t in tasks[:4])
+    result = run_macro(build_group_macro(tasks, threads), tag=tag, binary=binary,
+                       results_dir=results_dir, keep_output=keep_output, timeout=timeout)
+    if result["ok"]:
+        record_runtime(tasks, result["elapsed"])
+
+    result["outputs"] = [[] for _ in tasks]
+    for k, csv_file in enumerate(result["csv"][:len(tasks)]):
+        result["outputs"][k].append(csv_file)
+        write_metadata(csv_file, tasks[k], threads=threads, elapsed=result["elapsed"],
+                       group_size=len(tasks))
+    return result
+
+
+def run_task(task, binary=None, threads=None, results_dir=".", keep_output=True):
+    """Run one task to completion; see run_macro for the result dict."""
+    return run_group([task], binary=binary, threads=threads,
+                     results_dir=results_dir, keep_output=keep_output)
+
+
+# ==================================================
+# Sharded runs
+# ==================================================
+def split_events(electrons, shards):
+    """Spread `electrons` events over `shards` as evenly as possible."""
+    base, extra = divmod(electrons, shards)
+    return [base + (1 if k < extra else 0) for k in range(shards)]
+
+
+def run_sharded(task, shards, binary=None, threads=None, results_dir=".", log=print):
+    """
+    Run one task as `shards` processes with distinct seeds and merge their
+    hit maps into one result CSV. A shard that fails or passes its timeout is
+    relaunched with a new seed (up to MAX_ATTEMPTS launches). Once
+    SPECULATE_AFTER of the shards are done, any shard running longer than
+    STRAGGLER_FACTOR x their median runtime gets a speculative copy. The first
+    copy of each shard to finish is kept and the others are killed, so no
+    events are counted twice. Without runtime history the first deadline is
+    the loose fallback of timeout_for; once shards finish, copies running
+    past TIMEOUT_FACTOR x their median are killed like timeouts. Returns a run_group-style result dict.
+    """
+    from hitmap import HitMap   # hitmap imports this module
+
+    counts = split_events(int(task["electrons"]), shards)
+    tag = task.get("id", "x")
+    timeout = timeout_for([dict(task, electrons=counts[0])], results_dir)
+    os.makedirs(SCRATCH_DIR, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f"shards_{tag}_", dir=SCRATCH_DIR)
+    rng = random.SystemRandom()
+    monitor = resource_monitor.get_monitor()
+
+    running = {}            # future -> {"shard", "cancel", "started", "seeds"}
+    launches = [0] * shards
+    winners = {}            # shard -> (result, seeds)
+    last_failure = None
+    start = time.time()
+    pool = ThreadPoolExecutor(max_workers=2 * shards)   # room for speculative copies
+
+    def launch(shard):
+        launches[shard] += 1
+        seeds = (rng.randrange(1, 2 ** 31 - 1), rng.randrange(1, 2 ** 31 - 1))
+        cancel = threading.Event()
+        macro = build_group_macro([dict(task, electrons=counts[shard])], threads, seeds)
+        fut = pool.submit(run_macro, macro, tag=f"{tag}.{shard}", binary=binary, results_dir=staging,
+                          timeout=timeout, cancel=cancel.is_set)
+        running[fut] = {"shard": shard, "cancel": cancel, "started": time.time(), "seeds": seeds}
+
+    try:
+        for shard in range(shards):
+            launch(shard)
+
+        while len(winners) < shards and running:
+            done, _ = wait(list(running), timeout=1.0, return_when=FIRST_COMPLETED)
+            for fut in done:
+                attempt = running.pop(fut)
+                shard, result = attempt["shard"], fut.result()
+                if shard in winners:
+                    drop_log(result)    # a duplicate that lost the race
+                    continue
+                if result["ok"] and result["csv"]:
+                    winners[shard] = (result, attempt["seeds"])
+                    record_runtime([dict(task, electrons=counts[shard])], result["elapsed"])
+                    for other in running.values():
+                        if other["shard"] == shard:
+                            other["cancel"].set()
+                    continue
+
+                last_failure = result
+                if any(other["shard"] == shard for other in running.values()):
+                    continue    # another copy is still running
+                if launches[shard] < MAX_ATTEMPTS:
+                    why = "timed out" if result["stopped"] or attempt.get("overdue") else "failed"
+                    log(f"🔁 Task #{tag} shard {shard + 1}/{shards} {why}, relaunching with a new seed")
+                    launch(shard)
+
+            finished = [r["elapsed"] for r, _ in winners.values()]
+            if not finished:
+                continue
+            median = statistics.median(finished)
+            limit = STRAGGLER_FACTOR * median
+            deadline = max(MIN_TIMEOUT, TIMEOUT_FACTOR * median)
+            speculate = len(finished) >= SPECULATE_AFTER * shards and not monitor.holding()
+            copies = Counter(a["shard"] for a in running.values())
+            now = time.time()
+            for attempt in list(running.values()):
+                shard = attempt["shard"]
+                if now - attempt["started"] > deadline and not attempt.get("overdue"):
+                    attempt["overdue"] = True
+                    attempt["cancel"].set()
+                    continue
+                if speculate and copies[shard] == 1 and launches[shard] < MAX_ATTEMPTS \
+                        and now - attempt["started"] > limit:
+                    log(f"🐢 Task #{tag} shard {shard + 1}/{shards} is a straggler "
+                        f"({now - attempt['started']:.0f} s vs {limit:.0f} s), launching a speculative copy")
+                    launch(shard)
+                    copies[shard] += 1
+    finally:
+        for attempt in running.values():
+            attempt["cancel"].set()
+        pool.shutdown(wait=True)
+        # Copies killed here lost their race too
+        for fut in running:
+            if fut.exception() is None:
+                drop_log(fut.result())
+
+    try:
+        if len(winners) < shards:
+            result = dict(last_failure or {}, ok=False, csv=[], outputs=[[]], elapsed=time.time() - start)
+            result.setdefault("stdout_tail", "")
+            result.setdefault("stderr_tail", "")
+            result.setdefault("log", None)
+            result.setdefault("stopped", None)
+            return result
+
+        ordered = [winners[k] for k in range(shards)]
+        maps = [HitMap.from_csv(r["csv"][0], GRID) for r, _ in ordered]
+        # Shards share a staging directory, so their names carry bumped counters
+        name = re.sub(r"_\d+(\.csv)$", r"_1\1", os.path.basename(ordered[0][0]["csv"][0]))
+        dest = claim_result_name(name, results_dir)
+        maps[0].merge(*maps[1:]).to_csv(dest)
+        streams = [event_stream.stream_path(r["csv"][0]) for r, _ in ordered]
+        if task.get("event_stream") and all(os.path.exists(p) for p in streams):
+            # Shard streams follow in shard order; event numbers continue across them
+            event_stream.concatenate(streams, event_stream.stream_path(dest))
+        elapsed = time.time() - start
+        write_metadata(dest, task, threads=threads, elapsed=elapsed, shards=shards,
+                       shard_elapsed=statistics.median(r["elapsed"] for r, _ in ordered),
+                       seeds=[list(seeds) for _, seeds in ordered], launches=sum(launches))
+        return {
+            "ok": True,
+            "csv": [dest],
+            "outputs": [[dest]],
+            "returncode": 0,
+            "stdout_tail": ordered[-1][0]["stdout_tail"],
+            "stderr_tail": ordered[-1][0]["stderr_tail"],
+            "kept": [line for r, _ in ordered for line in r["kept"]],
+            "log": ordered[0][0]["log"],
+            "elapsed": elapsed,
+            "rss_mb": max(r["rss_mb"] for r, _ in ordered),
+            "stopped": None,
+            "launches": sum(launches),
+        }
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def render_svg(csv_file, task):
+    cmd = [
+        sys.executable, os.path.join(PROJECT_DIR, "visualize_results.py"),
+        csv_file,
+        "--energy", task["energy"],
+        "--electrons", task["electrons"],
+        "--thickness", task["thickness"]
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def execute_group(tasks, progress, log, threads=None, binary=None, results_dir=".",
+                  queued_at=None, should_stop=lambda: False):
+    """
+    Run same-geometry queue tasks in one process, including SVG rendering,
+    reporting through callbacks: progress(k, state) for tasks[k] with state
+    in "running", "done", "failed", "unknown", "error"; log(text) with
+    messages. Returns the final states.
+
+    The launch waits while resource_monitor reports sustained memory
+    pressure; the time since queued_at is recorded as queue wait. If
+    should_stop() turns true meanwhile, nothing is launched and every task
+    is returned as "cancelled" without a progress call.
+    """
+    resource_monitor.get_monitor().wait_for_headroom(should_stop, log)
+    if should_stop():
+        return ["cancelled"] * len(tasks)
+    if queued_at is not None:
+        resource_monitor.record_wait(time.time() - queued_at)
+
+    states = ["running"] * len(tasks)
+    for k in range(len(tasks)):
+        progress(k, "running")
+    try:
+        shards = int(tasks[0].get("shards") or 1) if len(tasks) == 1 else 1
+        if shards > 1:
+            log(f"🔀 Task #{tasks[0]['id']} split into {shards} shards")
+            result = run_sharded(tasks[0], shards, binary=binary, threads=threads,
+                                 results_dir=results_dir, log=log)
+        else:
+            if len(tasks) > 1:
+                log(f"🧩 Coalesced tasks {', '.join('#' + str(t['id']) for t in tasks)} "
+                    f"({tasks[0]['thickness']}) into one process")
+            timeout = timeout_for(tasks, results_dir)
+            result = run_group(tasks, binary=binary, threads=threads, results_dir=results_dir,
+                               timeout=timeout)
+
+        for k, task in enumerate(tasks):
+            outputs = result["outputs"][k]
+            if not outputs:
+                if result.get("stopped") == "timeout":
+                    states[k] = "failed"
+                    log(f"⏱️  Task #{task['id']} killed after {result['elapsed']:.0f} s, past its timeout\n"
+                        f"   ↳ Full log: {result['log']}")
+                elif not result["ok"]:
+                    states[k] = "failed"
+                    log(f"❌ Task #{task['id']} Error:\n{result['stderr_tail'][-2000:]}\n   ↳ Full log: {result['log']}")
+                else:
+                    states[k] = "unknown"
+                    log(f"⚠️  Parsing Failed. Raw output snippet:\n{result['stdout_tail'][-100:]}\n   ↳ Full log: {result['log']}")
+                progress(k, states[k])
+                continue
+
+            for csv_file in outputs:
+                log(f"✅ Generated: {csv_file} ({result['elapsed']:.1f} s, {result['rss_mb']:.0f} MB)")
+                if task.get("svg"):
+                    render_svg(csv_file, task)
+                    log("   ↳ Viz Rendered")
+            task["csv"] = outputs
+            task["done"] = True
+            states[k] = "done"
+            progress(k, "done")
+
+    except Exception as e:
+        for k, state in enumerate(states):
+            if state == "running":
+                states[k] = "error"
+                progress(k, "error")
+        log(f"💥 Exception: {str(e)}")
+    return states
+
+
+def execute_task(task, progress, log, threads=None, binary=None, results_dir="."):
+    """Single-task execute_group: progress(state) gets the state only."""
+    return execute_group([task], lambda k, state: progress(state), log,
+                         threads=threads, binary=binary, results_dir=results_dir)[0]
+
+
+def shard_idle(tasks, groups, processes):
+    """
+    Give processes that the batch would leave idle to its largest single-task
+    groups, as shards of at least MIN_SHARD_EVENTS events each. Returns
+    {task index: shards}; the tasks themselves are not touched.
+    """
+    spare = processes - len(groups)
+    singles = sorted((g for g in groups if len(g) == 1 and can_coalesce(tasks[g[0]])),
+                     key=lambda g: -task_work(tasks[g[0]]))
+    plan = {}
+    while spare > 0 and singles:
+        grown = False
+        for g in singles:
+            i = g[0]
+            shards = plan.get(i) or int(tasks[i].get("shards") or 1)
+            if spare > 0 and int(tasks[i]["electrons"]) // (shards + 1) >= MIN_SHARD_EVENTS:
+                plan[i] = shards + 1
+                spare -= 1
+                grown = True
+        if not grown:
+            break
+    return plan
+
+
+def run_tasks(tasks, progress, log, should_stop=lambda: False,
+              processes=1, threads=None, binary=None, results_dir=".", skip_done=False,
+              coalesce=True, shard=False):
+    """
+    Run a list of queue tasks on `processes` concurrent GeantSim processes.
+
+    progress(index, state) is called with the states of execute_group;
+    log(text) with messages. With skip_done, tasks that already finished in
+    an earlier batch are left alone. With coalesce, tasks sharing a geometry
+    are packed into one multi-run macro (see plan_groups). With shard, large
+    tasks are split over processes the batch would leave idle; they run as
+    copies, and only their "csv" and "done" are written back.
+    """
+    todo = [i for i, t in enumerate(tasks) if not (skip_done and t.get("done"))]
+    if coalesce:
+        groups = [[todo[k] for k in g] for g in plan_groups([tasks[i] for i in todo], processes=processes)]
+    else:
+        groups = [[i] for i in todo]
+    shards = shard_idle(tasks, groups, processes) if shard else {}
+
+    queued_at = time.time()
+
+    def work(group):
+        if should_stop():
+            return
+        batch = [dict(tasks[i], shards=shards[i]) if i in shards else tasks[i] for i in group]
+
+        def report(k, state):
+            i = group[k]
+            if batch[k] is not tasks[i]:
+                tasks[i].update({key: batch[k][key] for key in ("csv", "done") if key in batch[k]})
+            progress(i, state)
+
+        execute_group(batch, report, log, threads=threads, binary=binary, results_dir=results_dir,
+                      queued_at=queued_at, should_stop=should_stop)
+
+    with ThreadPoolExecutor(max_workers=max(1, processes)) as pool:
+        for fut in [pool.submit(work, group) for group in groups]:
+            fut.result()
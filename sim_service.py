@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""
+Local job-submission service: one daemon per sim host owns the GeantSim
+worker pool, so several GUIs (and users) share the cores instead of each
+spawning their own processes and oversubscribing the machine.
+
+    python3 sim_service.py                 # slots/threads from autotune
+    python3 sim_service.py --slots 8 --threads 1
+
+Protocol: newline-delimited JSON over a Unix socket (SOCKET_PATH).
+
+    {"op": "submit", "user": "ana", "tasks": [...], "results_dir": "/path", "watch": true}
+        -> {"ok": true, "job": 3}
+        then, with watch, a stream of
+           {"event": "status", "job": 3, "index": 0, "state": "running"}
+           {"event": "log", "job": 3, "text": "..."}
+           {"event": "job_done", "job": 3}
+    {"op": "cancel", "job": 3}   -> {"ok": true}     (own jobs only)
+    {"op": "status"}             -> {"ok": true, "slots": .., "free": .., "users": {...}, "jobs": [...],
+                                     "resources": <resource_monitor snapshot>}
+
+Requests are checked before anything runs: task fields must parse as a
+thickness, an energy and an event count, results_dir must lie inside the
+project tree, and the user is the connecting process's login from
+SO_PEERCRED (the "user" field only counts where the kernel cannot tell).
+
+Scheduling is per-user fair share: whenever a slot frees up, the next task is
+taken from the user with the fewest running tasks, ties broken by the least
+core-seconds consumed so far. Within one user, jobs run first come first served,
+and pending tasks of a job that share a lead thickness go to one GeantSim
+process as a multi-run macro.
+
+GUIs call run_tasks() here; it talks to the daemon when one is listening and
+falls back to running locally otherwise.
+"""
+import argparse
+import asyncio
+import getpass
+import grp
+import json
+import os
+import pwd
+import re
+import socket
+import struct
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import autotune
+import resource_monitor
+import sim_runner
+
+# One path for the whole host, so every user's GUI finds the same daemon
+SOCKET_PATH = os.environ.get("SIM_SERVICE_SOCKET", "/tmp/bl4s-g4/sim_service.sock")
+REQUEST_TIMEOUT = 5.0       # s to wait for a one-shot request's reply
+
+
+TASK_ID_RE = re.compile(r"^[\w.-]{1,32}$")     # ids end up in scratch and log file names
+FLAG_FIELDS = ("svg", "event_stream")
+
+
+def check_task(task):
+    """
+    A clean copy of a submitted task, or ValueError. Everything that reaches
+    the macro is parsed first, so a client cannot smuggle in extra commands.
+    """
+    if not isinstance(task, dict):
+        raise ValueError("task must be an object")
+    clean = {}
+    for field in ("thickness", "energy", "electrons"):
+        value = task.get(field)
+        if not isinstance(value, (str, int, float)) or isinstance(value, bool):
+            raise ValueError(f"task field {field!r} is missing or not a value")
+        if any(ch in str(value) for ch in "\r\n"):
+            raise ValueError(f"task field {field!r} contains a line break")
+        clean[field] = str(value).strip()
+    sim_runner.parse_quantity(clean["thickness"], sim_runner.LENGTH_UNITS)
+    sim_runner.parse_quantity(clean["energy"], sim_runner.ENERGY_UNITS)
+    try:
+        if int(clean["electrons"]) < 0:
+            raise ValueError
+    except ValueError:
+        raise ValueError(f"electrons must be a non-negative integer, got {clean['electrons']!r}") from None
+
+    task_id = task.get("id", "x")
+    if not TASK_ID_RE.match(str(task_id)):
+        raise ValueError(f"invalid task id {task_id!r}")
+    clean["id"] = task_id
+    for field in FLAG_FIELDS:
+        if field in task:
+            clean[field] = bool(task[field])
+    if "shards" in task:
+        clean["shards"] = max(1, int(task["shards"]))
+    return clean
+
+
+def check_results_dir(path):
+    """Resolved results directory; only the project tree may be written to."""
+    real = os.path.realpath(path or sim_runner.PROJECT_DIR)
+    root = os.path.realpath(sim_runner.PROJECT_DIR)
+    if os.path.commonpath([real, root]) != root:
+        raise ValueError(f"results_dir must be inside {root}")
+    if not os.path.isdir(real):
+        raise ValueError(f"results_dir {real} does not exist")
+    return real
+
+
+def peer_user(writer, claimed=None):
+    """Login name of the connected process from SO_PEERCRED (Linux); the claim is only a fallback."""
+    sock = writer.get_extra_info("socket")
+    if hasattr(socket, "SO_PEERCRED") and sock is not None:
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        _, uid, _ = struct.unpack("3i", creds)
+        try:
+            return pwd.getpwuid(uid).pw_name
+        except KeyError:
+            return f"uid{uid}"
+    # No kernel-verified identity on this platform: keep claimed names apart from real ones
+    return f"{claimed or 'anonymous'} (unverified)"
+
+
+class Job:
+    def __init__(self, job_id, user, tasks, results_dir):
+        self.id = job_id
+        self.user = user
+        self.tasks = tasks
+        self.results_dir = results_dir
+        self.states = ["waiting"] * len(tasks)
+        self.pending = deque(range(len(tasks)))
+        self.remaining = len(tasks)
+        self.cancelled = False
+        self.submitted = time.time()
+        self.watchers = []  # asyncio.Queue per streaming client
+
+    def publish(self, event):
+        event["job"] = self.id
+        for q in self.watchers:
+            q.put_nowait(event)
+
+    def summary(self):
+        return {"job": self.id, "user": self.user, "tasks": len(self.tasks),
+                "remaining": self.remaining, "states": self.states}
+
+
+class Scheduler:
+    def __init__(self, slots, threads=None, binary=None):
+        self.slots = slots
+        self.free = slots
+        self.threads = threads
+        self.binary = binary
+        self.jobs = {}
+        self.next_id = 1
+        self.user_jobs = {}          # user -> deque of Jobs with pending tasks
+        self.running = Counter()     # user -> tasks running now
+        self.usage = Counter()       # user -> core-seconds consumed
+        self.wakeup = asyncio.Event()
+        self.executor = ThreadPoolExecutor(max_workers=slots)
+
+    def submit(self, user, tasks, results_dir):
+        job = Job(self.next_id, user, tasks, results_dir)
+        self.next_id += 1
+        self.jobs[job.id] = job
+        if tasks:
+            self.user_jobs.setdefault(user, deque()).append(job)
+        self.wakeup.set()
+        return job
+
+    def cancel(self, job_id, user=None):
+        job = self.jobs.get(job_id)
+        if not job or (user is not None and job.user != user):
+            return False
+        job.cancelled = True
+        while job.pending:
+            i = job.pending.popleft()
+            job.states[i] = "cancelled"
+            job.remaining -= 1
+            job.publish({"event": "status", "index": i, "state": "cancelled"})
+        self._drop_if_idle(job)
+        return True
+
+    def _drop_if_idle(self, job):
+        jobs = self.user_jobs.get(job.user)
+        if jobs and not job.pending and job in jobs:
+            jobs.remove(job)
+            if not jobs:
+                del self.user_jobs[job.user]
+        if job.remaining == 0:
+            self._finish(job)
+
+    def _finish(self, job):
+        job.publish({"event": "job_done"})
+        self.jobs.pop(job.id, None)
+
+    def _next(self):
+        """Pick (job, indices) for the most under-served user, or None.
+
+        Pending tasks of the same job that share the first task's geometry
+        are coalesced into one process (see sim_runner.plan_groups), at most
+        pending / slots of them, so a queue still spreads over all slots.
+        """
+        if not self.user_jobs:
+            return None
+        pending = sum(len(j.pending) for jobs in self.user_jobs.values() for j in jobs)
+        cap = max(1, min(sim_runner.MAX_GROUP, -(-pending // max(1, self.slots))))
+        user = min(self.user_jobs, key=lambda u: (self.running[u], self.usage[u]))
+        job = self.user_jobs[user][0]
+        first = job.pending.popleft()
+        group = [first]
+        key = sim_runner.geometry_key(job.tasks[first])
+        for i in list(job.pending) if sim_runner.can_coalesce(job.tasks[first]) else []:
+            if len(group) >= cap:
+                break
+            if sim_runner.can_coalesce(job.tasks[i]) and sim_runner.geometry_key(job.tasks[i]) == key:
+                job.pending.remove(i)
+                group.append(i)
+        if not job.pending:
+            self._drop_if_idle(job)
+        return job, group
+
+    async def dispatch(self):
+        while True:
+            while self.free > 0:
+                picked = self._next()
+                if picked is None:
+                    break
+                self.free -= 1
+                asyncio.create_task(self._run(*picked))
+            self.wakeup.clear()
+            await self.wakeup.wait()
+
+    async def _run(self, job, indices):
+        loop = asyncio.get_running_loop()
+        tasks = [job.tasks[i] for i in indices]
+        self.running[job.user] += 1
+        start = time.time()
+
+        def progress(k, state):
+            i = indices[k]
+            job.states[i] = state
+            loop.call_soon_threadsafe(job.publish, {"event": "status", "index": i, "state": state,
+                                                    "csv": tasks[k].get("csv", [])})
+
+        def log(text):
+            loop.call_soon_threadsafe(job.publish, {"event": "log", "text": text})
+
+        try:
+            states = await loop.run_in_executor(
+                self.executor, lambda: sim_runner.execute_group(
+                    tasks, progress, log, threads=self.threads, binary=self.binary,
+                    results_dir=job.results_dir, queued_at=job.submitted,
+                    should_stop=lambda: job.cancelled))
+            for k, state in enumerate(states):
+                if state == "cancelled":
+                    # Cancelled while waiting for memory headroom
+                    job.states[indices[k]] = state
+                    job.publish({"event": "status", "index": indices[k], "state": state})
+        finally:
+            self.running[job.user] -= 1
+            self.usage[job.user] += (time.time() - start) * (self.threads or 1)
+            self.free += 1
+            job.remaining -= len(indices)
+            if job.remaining == 0:
+                self._finish(job)
+            self.wakeup.set()
+
+    def status(self):
+        return {
+            "ok": True,
+            "slots": self.slots,
+            "free": self.free,
+            "threads": self.threads,
+            "users": {u: {"running": self.running[u], "usage_s": round(self.usage[u], 1),
+                          "queued": sum(len(j.pending) for j in self.user_jobs.get(u, ()))}
+                      for u in set(self.running) | set(self.user_jobs)},
+            "jobs": [j.summary() for j in self.jobs.values()],
+            "resources": resource_monitor.get_monitor().snapshot,
+        }
+
+
+async def _send(writer, msg):
+    writer.write((json.dumps(msg) + "\n").encode())
+    await writer.drain()
+
+
+async def handle_client(scheduler, reader, writer):
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                req = json.loads(line)
+            except ValueError:
+                await _send(writer, {"ok": False, "error": "invalid JSON"})
+                continue
+            if not isinstance(req, dict):
+                await _send(writer, {"ok": False, "error": "request must be a JSON object"})
+                continue
+            op = req.get("op")
+
+            if op == "status":
+                await _send(writer, scheduler.status())
+
+            elif op == "cancel":
+                await _send(writer, {"ok": scheduler.cancel(req.get("job"), peer_user(writer, req.get("user")))})
+
+            elif op == "submit":
+                try:
+                    tasks = req.get("tasks") or []
+                    if not isinstance(tasks, list):
+                        raise ValueError("tasks must be a list")
+                    tasks = [check_task(t) for t in tasks]
+                    results_dir = check_results_dir(req.get("results_dir"))
+                except (ValueError, TypeError) as e:
+                    await _send(writer, {"ok": False, "error": str(e)})
+                    continue
+                queue = asyncio.Queue()
+                job = scheduler.submit(peer_user(writer, req.get("user")), tasks, results_dir)
+                if req.get("watch"):
+                    job.watchers.append(queue)
+                await _send(writer, {"ok": True, "job": job.id})
+
+                if req.get("watch"):
+                    try:
+                        if job.remaining == 0:
+                            queue.put_nowait({"event": "job_done", "job": job.id})
+                        while True:
+                            event = await queue.get()
+                            await _send(writer, event)
+                            if event["event"] == "job_done":
+                                break
+                    finally:
+                        job.watchers.remove(queue)
+            else:
+                await _send(writer, {"ok": False, "error": f"unknown op {op!r}"})
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+def prepare_socket_dir(socket_path, group=None):
+    """
+    Create the socket's directory owned by us and `group` (default: our
+    primary group), setgid so the socket inherits the group, and closed to
+    everyone else. A directory someone else owns is refused, since they
+    could swap the socket under us.
+    """
+    directory = os.path.dirname(socket_path)
+    gid = grp.getgrnam(group).gr_gid if group else os.getgid()
+    try:
+        os.mkdir(directory, 0o750)
+    except FileExistsError:
+        pass
+    if os.stat(directory).st_uid != os.getuid():
+        raise RuntimeError(f"{directory} belongs to another user; pick another --socket")
+    os.chown(directory, -1, gid)
+    os.chmod(directory, 0o2750)
+    return gid
+
+
+async def serve(slots, threads, binary=None, socket_path=SOCKET_PATH, group=None):
+    gid = prepare_socket_dir(socket_path, group)
+    if os.path.exists(socket_path):
+        if service_available(socket_path):
+            raise RuntimeError(f"A service is already listening on {socket_path}")
+        os.remove(socket_path)  # stale socket from a crashed daemon
+
+    scheduler = Scheduler(slots, threads, binary)
+    server = await asyncio.start_unix_server(
+        lambda r, w: handle_client(scheduler, r, w), path=socket_path)
+    os.chown(socket_path, -1, gid)
+    os.chmod(socket_path, 0o660)  # users in the socket's group may submit
+    print(f"🛰️  Sim service listening on {socket_path} ({slots} slot(s) x {threads or 1} thread(s))")
+
+    try:
+        async with server:
+            await asyncio.gather(server.serve_forever(), scheduler.dispatch())
+    finally:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+# ==================================================
+# Client side
+# ==================================================
+def service_available(socket_path=SOCKET_PATH):
+    if not os.path.exists(socket_path):
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(1.0)
+            s.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+
+def request(msg, socket_path=SOCKET_PATH, timeout=REQUEST_TIMEOUT):
+    """Send one request and return its single-line reply; socket.timeout after `timeout` s."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(socket_path)
+        s.sendall((json.dumps(msg) + "\n").encode())
+        with s.makefile("r") as f:
+            return json.loads(f.readline())
+
+
+def run_tasks_remote(tasks, progress, log, should_stop=lambda: False,
+                     skip_done=False, user=None, socket_path=SOCKET_PATH):
+    """
+    Same contract as sim_runner.run_tasks, executed by the daemon. Returns
+    False if the daemon rejected the queue, so nothing ran.
+    """
+    indices = [i for i, t in enumerate(tasks) if not (skip_done and t.get("done"))]
+    msg = {"op": "submit", "user": user or getpass.getuser(), "watch": True,
+           "results_dir": os.getcwd(), "tasks": [tasks[i] for i in indices]}
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(socket_path)
+        s.sendall((json.dumps(msg) + "\n").encode())
+        s.settimeout(0.5)
+        buf = b""
+        job_id = None
+        cancelled = False
+
+        while True:
+            if should_stop() and job_id is not None and not cancelled:
+                request({"op": "cancel", "job": job_id, "user": msg["user"]}, socket_path)
+                cancelled = True
+            try:
+                chunk = s.recv(65536)
+            except socket.timeout:
+                continue
+            if not chunk:
+                log("⚠️  Sim service closed the connection")
+                return
+            buf += chunk
+            while b"\n" in buf:
+                line, buf = buf.split(b"\n", 1)
+                event = json.loads(line)
+                if "event" not in event:
+                    if not event.get("ok"):
+                        log(f"⚠️  Sim service rejected the queue: {event.get('error')}")
+                        return False
+                    job_id = event.get("job")
+                    log(f"🛰️  Submitted to sim service as job #{job_id}")
+                elif event["event"] == "status":
+                    i = indices[event["index"]]
+                    if event["state"] == "done":
+                        tasks[i]["csv"] = event.get("csv", [])
+                        tasks[i]["done"] = True
+                    if event["state"] != "cancelled":
+                        progress(i, event["state"])
+                elif event["event"] == "log":
+                    log(event["text"])
+                elif event["event"] == "job_done":
+                    return
+
+
+def run_tasks(tasks, progress, log, should_stop=lambda: False, skip_done=False, shard=False):
+    """
+    Entry point for the GUIs: use the shared daemon if it runs, else run
+    locally (sharding large tasks over idle processes if `shard`).
+    """
+    if service_available():
+        if run_tasks_remote(tasks, progress, log, should_stop, skip_done=skip_done) is not False:
+            return
+        # e.g. started outside the project tree, where the daemon may not write
+        log("↪️  Running the queue locally instead")
+
+    processes, threads = 1, None
+    try:
+        cfg = autotune.get_config(log=log)
+        processes, threads = cfg["processes"], cfg["threads"]
+        log(f"⚙️  {processes} process(es) x {threads} thread(s)")
+    except Exception as e:
+        log(f"⚠️  Auto-tune unavailable ({e}), running sequentially")
+
+    sim_runner.run_tasks(tasks, progress, log, should_stop,
+                         processes=processes, threads=threads, skip_done=skip_done, shard=shard)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Shared GeantSim job service for this host')
+    parser.add_argument('--slots', type=int, help='Concurrent GeantSim processes (default: autotune)')
+    parser.add_argument('--threads', type=int, help='Geant4 threads per process (default: autotune)')
+    parser.add_argument('--binary', default=sim_runner.GEANTSIM, help='Path to GeantSim')
+    parser.add_argument('--socket', default=SOCKET_PATH, help='Unix socket path (default: %(default)s)')
+    parser.add_argument('--group', help='Group allowed to submit (default: your primary group)')
+
+    args = parser.parse_args()
+
+    slots, threads = args.slots, args.threads
+    if slots is None or threads is None:
+        cfg = autotune.get_config(args.binary)
+        slots = slots or cfg["processes"]
+        threads = threads or cfg["threads"]
+
+    try:
+        asyncio.run(serve(slots, threads, args.binary, args.socket, args.group))
+    except KeyboardInterrupt:
+        pass
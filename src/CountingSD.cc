@@ -1,4 +1,5 @@
 #include "CountingSD.hh"
+#include "G4Event.hh"
 #include "G4HCofThisEvent.hh"
 #include "G4RunManager.hh"
 #include "G4SDManager.hh"
@@ -39,10 +40,23 @@ G4bool CountingSD::ProcessHits(G4Step *step, G4TouchableHistory *) {
         const_cast<RunAction *>(static_cast<const RunAction *>(userRunAction));
     if (runAction) {
       runAction->AddHits(copyNo, 1);
+      if (runAction->EventStreamEnabled())
+        fHitsMap[copyNo]++; // this event's hits, flushed in EndOfEvent
     }
   }
 
   return true;
 }
 
-void CountingSD::EndOfEvent(G4HCofThisEvent *) {}
+void CountingSD::EndOfEvent(G4HCofThisEvent *) {
+  if (fHitsMap.empty())
+    return;
+
+  auto *runManager = G4RunManager::GetRunManager();
+  auto *runAction = const_cast<RunAction *>(
+      static_cast<const RunAction *>(runManager->GetUserRunAction()));
+  if (runAction && runAction->EventStreamEnabled())
+    runAction->RecordEvent(runManager->GetCurrentEvent()->GetEventID(),
+                           fHitsMap);
+  fHitsMap.clear();
+}
@@ -7,9 +7,41 @@
 #include <fstream>
 
 #include "G4AccumulableManager.hh"
+#include "G4GenericMessenger.hh"
 #include "G4RunManager.hh"
+#include "G4Threading.hh"
+#include <cstdint>
+#include <cstdio>
+
+namespace {
+// Per-event stream: a 24-byte header, then one 8-byte little-endian record
+// per (event, cell) with hits. Read by event_stream.py.
+struct EventStreamHeader {
+  char magic[8];
+  std::uint64_t nEvents;
+  std::uint16_t nx, ny;
+  std::int16_t x0, y0;
+};
+struct EventRecord {
+  std::uint32_t event;
+  std::uint16_t cell;
+  std::uint16_t count;
+};
+static_assert(sizeof(EventStreamHeader) == 24, "event stream header layout");
+static_assert(sizeof(EventRecord) == 8, "event record layout");
+
+std::string EventPartName(G4int threadID) {
+  return ".events_part_" + std::to_string(threadID);
+}
+} // namespace
+
+RunAction::RunAction()
+    : G4UserRunAction(), fMessenger(nullptr), fEventStream(false) {
+  fMessenger = new G4GenericMessenger(this, "/BFS/output/", "Output control");
+  fMessenger->DeclareProperty("eventStream", fEventStream,
+                              "Also write per-event hits to a binary "
+                              ".events file next to the CSV.");
 
-RunAction::RunAction() : G4UserRunAction() {
   // Register accumulables for 21x21 = 441 detectors
   G4int nDetectors = 21 * 21;
   auto accumulableManager = G4AccumulableManager::Instance();
@@ -20,7 +52,7 @@ RunAction::RunAction() : G4UserRunAction() {
   }
 }
 
-RunAction::~RunAction() {}
+RunAction::~RunAction() { delete fMessenger; }
 
 void RunAction::BeginOfRunAction(const G4Run *) {
   // Reset allocators
@@ -28,6 +60,14 @@ void RunAction::BeginOfRunAction(const G4Run *) {
 
   // Inform the runManager to save random number seed
   G4RunManager::GetRunManager()->SetRandomNumberStore(false);
+
+  if (fEventPart.is_open())
+    fEventPart.close();
+  if (fEventStream)
+    std::remove(EventPartName(G4Threading::G4GetThreadId()).c_str());
+
+  if (IsMaster())
+    fTimer.Start();
 }
 
 // Include at top
@@ -36,6 +76,21 @@ void RunAction::BeginOfRunAction(const G4Run *) {
 #include <algorithm> // for remove matches
 // ...
 
+namespace {
+// ".results_next" holds "<prefix> <next counter>" lines for runs moved into
+// the archive by result_store.py, so their names are never reused.
+int FirstFreeCounter(const std::string &prefix) {
+  std::ifstream hint(".results_next");
+  std::string name;
+  int next;
+  while (hint >> name >> next) {
+    if (name == prefix)
+      return next;
+  }
+  return 1;
+}
+} // namespace
+
 void RunAction::EndOfRunAction(const G4Run *run) {
   G4int nofEvents = run->GetNumberOfEvent();
   if (nofEvents == 0)
@@ -45,11 +100,17 @@ void RunAction::EndOfRunAction(const G4Run *run) {
   auto accumulableManager = G4AccumulableManager::Instance();
   accumulableManager->Merge();
 
+  // Workers finish before the master, which then merges their records
+  if (fEventPart.is_open())
+    fEventPart.close();
+
   // Print results only on Master
   if (IsMaster()) {
     G4cout << "------------------------------------------------------------"
            << G4endl;
     G4cout << " Run ended! Number of events: " << nofEvents << G4endl;
+    fTimer.Stop();
+    G4cout << " Event loop time: " << fTimer.GetRealElapsed() << " s" << G4endl;
 
     // --- Dynamic Filename Generation ---
     const DetectorConstruction *detector =
@@ -64,7 +125,7 @@ void RunAction::EndOfRunAction(const G4Run *run) {
                    thickStr.end());
 
     std::string fileName;
-    int counter = 1;
+    int counter = FirstFreeCounter("results_" + thickStr + "_");
     do {
       fileName = "results_" + thickStr + "_" + std::to_string(counter) + ".csv";
       counter++;
@@ -96,11 +157,52 @@ void RunAction::EndOfRunAction(const G4Run *run) {
 
     G4cout << " Total Electrons Detected: " << totalHits << G4endl;
     G4cout << " Results written to '" << fileName << "'" << G4endl;
+    if (fEventStream)
+      WriteEventStream(fileName, nofEvents);
     G4cout << "------------------------------------------------------------"
            << G4endl;
   }
 }
 
+void RunAction::RecordEvent(G4int eventID,
+                            const std::map<G4int, G4int> &hits) {
+  if (!fEventStream)
+    return; // no part files unless /BFS/output/eventStream is on
+  if (!fEventPart.is_open())
+    fEventPart.open(EventPartName(G4Threading::G4GetThreadId()),
+                    std::ios::binary | std::ios::trunc);
+  for (auto const &[copyNo, count] : hits) {
+    EventRecord rec{static_cast<std::uint32_t>(eventID),
+                    static_cast<std::uint16_t>(copyNo),
+                    static_cast<std::uint16_t>(std::min(count, 65535))};
+    fEventPart.write(reinterpret_cast<const char *>(&rec), sizeof(rec));
+  }
+}
+
+void RunAction::WriteEventStream(const std::string &csvName,
+                                 G4int nofEvents) {
+  std::string streamName = csvName.substr(0, csvName.size() - 4) + ".events";
+  std::ofstream out(streamName, std::ios::binary | std::ios::trunc);
+
+  EventStreamHeader header{{'B', 'F', 'S', 'E', 'V', 'T', '0', '1'},
+                           static_cast<std::uint64_t>(nofEvents),
+                           21, 21, -10, -10};
+  out.write(reinterpret_cast<const char *>(&header), sizeof(header));
+
+  // Sequential mode records on the master itself (thread id -1)
+  G4int nThreads = G4RunManager::GetRunManager()->GetNumberOfThreads();
+  for (G4int id = -1; id < std::max(nThreads, 1); ++id) {
+    std::string part = EventPartName(id);
+    std::ifstream in(part, std::ios::binary);
+    if (!in.good())
+      continue;
+    out << in.rdbuf();
+    in.close();
+    std::remove(part.c_str());
+  }
+  G4cout << " Event stream written to '" << streamName << "'" << G4endl;
+}
+
 void RunAction::AddHits(G4int id, G4int hits) {
   if (fAccumulableHits.find(id) != fAccumulableHits.end()) {
     *(fAccumulableHits[id]) += hits;
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Instant-preview surrogate: predicts the 21x21 hit map for an unseen
+(thickness, energy, electrons) point from results already on disk.
+
+Each stored run (result CSV + sidecar JSON written by sim_runner) becomes a
+sample in (thickness [cm], log10 energy [GeV]) space. Maps are interpolated as
+log hits per electron, z = log((hits + 0.5) / electrons), with a Gaussian
+kernel over the nearest runs. The per-cell uncertainty combines the spread of
+the neighbours around the prediction with their Poisson noise, and grows with
+the distance to the nearest stored run.
+
+    python3 surrogate.py --thickness "3 cm" --energy "2 GeV" --electrons 1000
+"""
+import argparse
+import math
+
+import numpy as np
+
+import result_store
+import sim_runner
+from visualize_results import collect_files, load_grid
+
+K_NEIGHBOURS = 6
+EXTRAPOLATION_SCALE = 0.1  # normalised distance at which the uncertainty doubles
+
+
+class Surrogate:
+    def __init__(self, results_dir="."):
+        self.results_dir = results_dir
+        self._cache = {}  # csv path -> (mtime, sample)
+        self.samples = []
+        self.refresh()
+
+    def refresh(self):
+        """Re-scan results_dir; unchanged files are not re-read."""
+        samples = []
+        for csv_file in collect_files([self.results_dir], archived=True):
+            meta = sim_runner.read_metadata(csv_file)
+            if not meta:
+                continue
+            mtime = result_store.getmtime(csv_file)
+            cached = self._cache.get(csv_file)
+            if cached and cached[0] == mtime:
+                samples.append(cached[1])
+                continue
+            try:
+                sample = self._make_sample(csv_file, meta)
+            except (ValueError, KeyError, OSError):
+                continue
+            self._cache[csv_file] = (mtime, sample)
+            samples.append(sample)
+        self.samples = samples
+        return len(samples)
+
+    @staticmethod
+    def _make_sample(csv_file, meta):
+        grid, _ = load_grid(csv_file)
+        electrons = max(1, int(meta["electrons"]))
+        return {
+            "file": csv_file,
+            "thickness": sim_runner.parse_quantity(meta["thickness"], sim_runner.LENGTH_UNITS),
+            "log_energy": math.log10(sim_runner.parse_quantity(meta["energy"], sim_runner.ENERGY_UNITS)),
+            "electrons": electrons,
+            "z": np.log((grid + 0.5) / electrons),
+            "var_z": 1.0 / (grid + 0.5),  # Poisson noise of log counts
+        }
+
+    def predict(self, thickness, energy, electrons):
+        """
+        Returns a dict with grid (expected hits), sigma_log (per-cell 1-sigma
+        uncertainty in log space), total, total_err, neighbours, distance.
+        """
+        if not self.samples:
+            raise ValueError("No stored runs with metadata to interpolate from")
+
+        t = sim_runner.parse_quantity(thickness, sim_runner.LENGTH_UNITS)
+        le = math.log10(sim_runner.parse_quantity(energy, sim_runner.ENERGY_UNITS))
+        electrons = int(electrons)
+
+        pts = np.array([[s["thickness"], s["log_energy"]] for s in self.samples])
+        # Normalise axes by their spread so cm and decades of energy weigh alike
+        scale = pts.max(axis=0) - pts.min(axis=0)
+        scale[scale == 0] = 1.0
+        d = np.hypot(*((pts - [t, le]) / scale).T)
+
+        k = min(K_NEIGHBOURS, len(self.samples))
+        idx = np.argsort(d)[:k]
+        bandwidth = max(d[idx].max(), 1e-3)
+        w = np.exp(-0.5 * (d[idx] / (0.5 * bandwidth)) ** 2) + 1e-12
+        w /= w.sum()
+
+        z = np.stack([self.samples[i]["z"] for i in idx])
+        var_z = np.stack([self.samples[i]["var_z"] for i in idx])
+        z_hat = np.tensordot(w, z, axes=1)
+
+        spread = np.tensordot(w, (z - z_hat) ** 2, axes=1)
+        noise = np.tensordot(w ** 2, var_z, axes=1)
+        # Extrapolating away from the nearest run is penalised
+        sigma_log = np.sqrt(spread + noise) * (1.0 + d[idx].min() / EXTRAPOLATION_SCALE)
+
+        n_ref = np.average([self.samples[i]["electrons"] for i in idx], weights=w)
+        grid = np.clip((np.exp(z_hat) - 0.5 / n_ref) * electrons, 0, None)
+        total = float(grid.sum())
+
+        # Cells are strongly correlated, so the total gets its own spread
+        # estimate from the neighbours' log totals instead of summing cells
+        zt = np.log(np.exp(z).sum(axis=(1, 2)))
+        zt_hat = np.dot(w, zt)
+        sigma_total = math.sqrt(np.dot(w, (zt - zt_hat) ** 2) + 1.0 / max(total, 1.0))
+        total_err = total * sigma_total * (1.0 + d[idx].min() / EXTRAPOLATION_SCALE)
+
+        return {
+            "grid": grid,
+            "sigma_log": sigma_log,
+            "total": total,
+            "total_err": total_err,
+            "neighbours": [self.samples[i]["file"] for i in idx],
+            "distance": float(d[idx].min()),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Predict a hit map from stored results')
+    parser.add_argument('--thickness', required=True, help='Lead Thickness')
+    parser.add_argument('--energy', required=True, help='Beam Energy')
+    parser.add_argument('--electrons', default='1000', help='Number of Electrons')
+    parser.add_argument('--dir', default='.', help='Results directory')
+
+    args = parser.parse_args()
+
+    model = Surrogate(args.dir)
+    p = model.predict(args.thickness, args.energy, args.electrons)
+    print(f"🔮 Predicted total hits: {p['total']:.0f} ± {p['total_err']:.0f}")
+    print(f"   from {len(p['neighbours'])} of {len(model.samples)} stored runs "
+          f"(nearest distance {p['distance']:.2f})")
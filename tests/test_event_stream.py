@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+
+import event_stream
+from event_stream import HEADER, RECORD, EventStream
+
+EVENTS = 3000
+
+
+def dense(path):
+    """(events, cells) array of the stream, built the slow way."""
+    stream = EventStream(path)
+    records = np.fromfile(path, RECORD, offset=HEADER.itemsize)
+    grid = np.zeros((stream.events, stream.cells), np.int64)
+    np.add.at(grid, (records["event"].astype(np.intp), records["cell"].astype(np.intp)), records["count"])
+    return grid
+
+
+@pytest.fixture(scope="module")
+def stream_file(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("stream") / "run.events")
+    # Small chunks so the file has several write blocks
+    event_stream.synth(path, EVENTS, mean=6.0, sigma=2.5, nx=11, ny=9, seed=1, chunk_events=700)
+    return path
+
+
+@pytest.fixture(scope="module")
+def brute(stream_file):
+    return dense(stream_file)
+
+
+def test_header(stream_file):
+    stream = EventStream(stream_file)
+    assert (stream.events, stream.nx, stream.ny, stream.x0, stream.y0) == (EVENTS, 11, 9, -5, -4)
+    assert stream.cell_index(-5, -4) == 0
+    assert stream.cell_index(5, 4) == stream.cells - 1
+    with pytest.raises(ValueError):
+        stream.cell_index(6, 0)
+
+
+@pytest.mark.parametrize("size", [1, 7, 100, event_stream.CHUNK_RECORDS])
+def test_chunks_keep_events_whole(stream_file, size):
+    stream = EventStream(stream_file)
+    records = np.fromfile(stream_file, RECORD, offset=HEADER.itemsize)
+    seen, last = 0, -1
+    # Iterate, do not list(): every chunk holds its own memory map
+    for chunk in stream.chunks(size):
+        assert len(chunk) > 0
+        assert chunk["event"][0] > last
+        last = chunk["event"][-1]
+        np.testing.assert_array_equal(chunk, records[seen:seen + len(chunk)])
+        seen += len(chunk)
+    assert seen == len(stream)
+
+
+def test_totals(stream_file, brute):
+    stream = EventStream(stream_file)
+    np.testing.assert_array_equal(stream.totals(), brute.sum(axis=0).reshape(stream.ny, stream.nx))
+
+
+def test_multiplicity(stream_file, brute):
+    stream = EventStream(stream_file)
+    np.testing.assert_array_equal(stream.multiplicity(), np.bincount(brute.sum(axis=1)))
+    np.testing.assert_array_equal(stream.multiplicity(cells_hit=True), np.bincount((brute > 0).sum(axis=1)))
+    assert stream.multiplicity().sum() == EVENTS
+
+
+def test_correlation(stream_file, brute):
+    stream = EventStream(stream_file)
+    mean, std, corr = stream.correlation()
+    np.testing.assert_allclose(mean, brute.mean(axis=0))
+    np.testing.assert_allclose(std, brute.std(axis=0), atol=1e-9)
+
+    live = np.flatnonzero(brute.std(axis=0) > 0)
+    np.testing.assert_allclose(corr[np.ix_(live, live)], np.corrcoef(brute[:, live], rowvar=False), atol=1e-9)
+
+    cells = live[:5]
+    _, _, sub = stream.correlation(cells)
+    np.testing.assert_allclose(sub, np.corrcoef(brute[:, cells], rowvar=False), atol=1e-9)
+
+
+def test_correlated_multiplicities(stream_file):
+    # Gamma-distributed means make the central cells positively correlated
+    stream = EventStream(stream_file)
+    centre = [stream.cell_index(0, 0), stream.cell_index(1, 0), stream.cell_index(0, 1)]
+    _, _, corr = stream.correlation(centre)
+    assert (corr[np.triu_indices(3, 1)] > 0.05).all()
+
+
+def test_sum_variance(stream_file, brute):
+    stream = EventStream(stream_file)
+    cells, total = stream.sum_variance()
+    np.testing.assert_allclose(cells.ravel(), EVENTS * brute.var(axis=0), atol=1e-6)
+    assert total == pytest.approx(EVENTS * brute.sum(axis=1).var())
+
+
+def test_concatenate(stream_file, brute, tmp_path):
+    joined = event_stream.concatenate([stream_file, stream_file], str(tmp_path / "joined.events"))
+    stream = EventStream(joined)
+    assert stream.events == 2 * EVENTS
+    np.testing.assert_array_equal(stream.multiplicity(), 2 * np.bincount(brute.sum(axis=1)))
+    np.testing.assert_array_equal(dense(joined), np.vstack([brute, brute]))
+
+
+def test_concatenate_rejects_other_grid(stream_file, tmp_path):
+    other = str(tmp_path / "other.events")
+    event_stream.synth(other, 10, nx=5, ny=5, seed=2)
+    with pytest.raises(ValueError):
+        event_stream.concatenate([stream_file, other], str(tmp_path / "joined.events"))
+
+
+def test_empty_stream(tmp_path):
+    path = str(tmp_path / "empty.events")
+    with open(path, "wb") as f:
+        event_stream.write_header(f, 50, 3, 3, -1, -1)
+    stream = EventStream(path)
+    assert len(stream) == 0
+    assert list(stream.chunks()) == []
+    np.testing.assert_array_equal(stream.multiplicity(), [50])
+    assert stream.totals().sum() == 0
+    mean, std, _ = stream.correlation()
+    assert not mean.any() and not std.any()
+
+
+def test_rejects_bad_files(tmp_path):
+    junk = tmp_path / "junk.events"
+    junk.write_bytes(b"not a stream at all, definitely")
+    with pytest.raises(ValueError):
+        EventStream(str(junk))
+
+    truncated = tmp_path / "truncated.events"
+    with open(truncated, "wb") as f:
+        event_stream.write_header(f, 1)
+        f.write(b"\0" * (RECORD.itemsize - 1))
+    with pytest.raises(ValueError):
+        EventStream(str(truncated))
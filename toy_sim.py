@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Toy stand-in for ./build/GeantSim: a NumPy electromagnetic-shower Monte Carlo
+that honours the same macro commands, prints the same stdout lines and writes
+the same `X,Y,Hits` CSV, in microseconds instead of minutes. Meant for load
+testing the queue/service/pipeline on machines without Geant4.
+
+    ./toy_sim.py run.mac
+    GEANTSIM=$PWD/toy_sim.py python3 main.py
+
+The physics is a caricature: the mean number of electrons leaving the lead
+follows a gamma-distribution longitudinal profile in radiation lengths
+(Longo-Sestili, tmax = ln(E0/Ec) - 0.5), and their positions on the
+calorimeter are Gaussian with a width growing with depth.
+
+Tuning / failure injection through environment variables:
+    TOYSIM_INIT_S     seconds spent in /run/initialize      (default 0)
+    TOYSIM_EVENT_US   microseconds per event per thread     (default 0)
+    TOYSIM_FAIL_RATE  probability of exiting with an error  (default 0)
+    TOYSIM_HANG_RATE  probability of hanging forever        (default 0)
+    TOYSIM_SEED       fixed seed (otherwise time-based, like main.cc)
+
+`/BFS/output/eventStream true` writes the per-event `.events` file next to
+the CSV, in the format event_stream.py reads.
+"""
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+import event_stream
+
+X0_PB_CM = 0.56         # radiation length of lead
+EC_PB_GEV = 7.4e-3      # critical energy of lead
+B_PARAM = 0.5
+N_COLS = N_ROWS = 21
+
+LENGTH = {"km": 1e5, "m": 100.0, "cm": 1.0, "mm": 0.1, "um": 1e-4, "nm": 1e-7}
+ENERGY = {"TeV": 1e3, "GeV": 1.0, "MeV": 1e-3, "keV": 1e-6, "eV": 1e-9}
+
+
+def env_float(name, default=0.0):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def best_unit(value_cm):
+    """Mimic G4BestUnit(x, "Length"): largest unit that keeps the value >= 1."""
+    for unit, scale in LENGTH.items():
+        if abs(value_cm) >= scale:
+            return f"{value_cm / scale:g} {unit}"
+    return f"{value_cm / LENGTH['nm']:g} nm"
+
+
+def mean_electrons(thickness_cm, energy_gev):
+    """Mean number of e- per primary reaching the calorimeter."""
+    t = thickness_cm / X0_PB_CM
+    primary = math.exp(-t * 7.0 / 9.0 * 0.5)
+    y = max(energy_gev / EC_PB_GEV, 1.0)
+    tmax = max(math.log(y) - 0.5, 0.1)
+    a = B_PARAM * tmax + 1.0
+    profile = B_PARAM * (B_PARAM * t) ** (a - 1) * math.exp(-B_PARAM * t) / math.gamma(a) if t > 0 else 0.0
+    return primary + 0.3 * y * profile
+
+
+def first_free_counter(prefix):
+    """Next counter after archived runs, from result_store's .results_next hint."""
+    try:
+        with open(".results_next") as f:
+            for line in f:
+                name, _, counter = line.partition(" ")
+                if name == prefix:
+                    return int(counter)
+    except (OSError, ValueError):
+        pass
+    return 1
+
+
+class ToySim:
+    def __init__(self):
+        self.thickness_cm = 1.0
+        self.energy_gev = 1.0
+        self.threads = 1
+        self.print_progress = 0
+        self.initialized = False
+        self.event_stream = False
+        seed = os.environ.get("TOYSIM_SEED")
+        self.rng = np.random.default_rng(int(seed) if seed else time.time_ns() % (2 ** 32))
+
+    # --- macro handling -------------------------------------------------
+    def apply(self, line):
+        parts = line.split()
+        cmd, args = parts[0], parts[1:]
+
+        if cmd == "/BFS/geometry/leadThickness":
+            self.thickness_cm = float(args[0]) * LENGTH[args[1] if len(args) > 1 else "cm"]
+        elif cmd == "/run/numberOfThreads":
+            self.threads = max(1, int(args[0]))
+        elif cmd == "/run/initialize":
+            self.initialize()
+        elif cmd == "/gun/energy":
+            self.energy_gev = float(args[0]) * ENERGY[args[1] if len(args) > 1 else "GeV"]
+        elif cmd == "/run/printProgress":
+            self.print_progress = int(args[0])
+        elif cmd == "/random/setSeeds":
+            self.rng = np.random.default_rng([int(a) for a in args])
+        elif cmd == "/BFS/output/eventStream":
+            self.event_stream = not args or args[0].lower() in ("1", "true")
+        elif cmd == "/run/beamOn":
+            self.beam_on(int(args[0]) if args else 1)
+        elif cmd.startswith(("/control/", "/tracking/", "/vis/", "/gun/", "/run/verbose", "/event/")):
+            pass
+        else:
+            return False
+        return True
+
+    def execute(self, macro):
+        with open(macro) as f:
+            for raw in f:
+                line = raw.split("#", 1)[0].strip()
+                if not line:
+                    continue
+                if not self.apply(line):
+                    # Geant4 batch mode stops the macro on an unknown command
+                    print(f"command <{line}> not found", file=sys.stderr)
+                    print("***** Batch is interrupted!! *****", file=sys.stderr)
+                    return
+
+    # --- "physics" --------------------------------------------------------
+    def initialize(self):
+        print(f"--> Geometry: Building Lead Target with thickness: {best_unit(self.thickness_cm)}")
+        time.sleep(env_float("TOYSIM_INIT_S"))
+        self.initialized = True
+
+    def beam_on(self, n_events):
+        if not self.initialized:
+            self.initialize()
+
+        if self.rng.random() < env_float("TOYSIM_FAIL_RATE"):
+            print("G4Exception: toy failure injected (TOYSIM_FAIL_RATE)", file=sys.stderr)
+            sys.exit(1)
+        if self.rng.random() < env_float("TOYSIM_HANG_RATE"):
+            while True:
+                time.sleep(3600)
+
+        hits = np.zeros(N_ROWS * N_COLS, dtype=np.int64)
+        records = [] if self.event_stream else None
+        mean = mean_electrons(self.thickness_cm, self.energy_gev)
+        sigma = 0.4 + 0.6 * math.sqrt(self.thickness_cm / X0_PB_CM)
+        per_event_s = env_float("TOYSIM_EVENT_US") * 1e-6 / self.threads
+
+        step = self.print_progress if self.print_progress > 0 else max(n_events, 1)
+        start = time.time()
+        for first in range(0, n_events, step):
+            chunk = min(step, n_events - first)
+            if self.print_progress > 0:
+                print(f"--> Event {first} starts.")
+            self._shower(first, chunk, mean, sigma, hits, records)
+            time.sleep(per_event_s * chunk)
+
+        self.end_of_run(n_events, hits, records, time.time() - start)
+
+    def _shower(self, first, n_events, mean, sigma, hits, records=None):
+        n = self.rng.poisson(n_events * mean)
+        if n == 0:
+            return
+        i = np.rint(self.rng.normal(0, sigma, n)).astype(np.int64) + N_COLS // 2
+        j = np.rint(self.rng.normal(0, sigma, n)).astype(np.int64) + N_ROWS // 2
+        inside = (i >= 0) & (i < N_COLS) & (j >= 0) & (j < N_ROWS)
+        cells = j[inside] * N_COLS + i[inside]
+        np.add.at(hits, cells, 1)
+        if records is not None:
+            # Spread the electrons over the chunk's events; one record per (event, cell)
+            event = self.rng.integers(first, first + n_events, len(cells))
+            keys, counts = np.unique(event * (N_ROWS * N_COLS) + cells, return_counts=True)
+            records.append((keys // (N_ROWS * N_COLS), keys % (N_ROWS * N_COLS), counts))
+
+    # --- RunAction::EndOfRunAction ---------------------------------------
+    def end_of_run(self, n_events, hits, records=None, loop_s=0.0):
+        if n_events == 0:
+            return
+        print("------------------------------------------------------------")
+        print(f" Run ended! Number of events: {n_events}")
+        print(f" Event loop time: {loop_s:.6g} s")
+
+        thick_str = best_unit(self.thickness_cm).replace(" ", "")
+        counter = first_free_counter(f"results_{thick_str}_")
+        while os.path.exists(f"results_{thick_str}_{counter}.csv"):
+            counter += 1
+        file_name = f"results_{thick_str}_{counter}.csv"
+
+        with open(file_name, "w") as f:
+            f.write("X,Y,Hits\n")
+            for copy_no in np.flatnonzero(hits):
+                x = copy_no % N_COLS - N_COLS // 2
+                y = copy_no // N_COLS - N_ROWS // 2
+                f.write(f"{x},{y},{hits[copy_no]}\n")
+
+        print(f" Total Electrons Detected: {int(hits.sum())}")
+        print(f" Results written to '{file_name}'")
+        if records is not None:
+            stream_name = event_stream.stream_path(file_name)
+            with open(stream_name, "wb") as f:
+                event_stream.write_header(f, n_events, N_COLS, N_ROWS, -(N_COLS // 2), -(N_ROWS // 2))
+                for event, cell, count in records:
+                    event_stream.write_records(f, event, cell, count)
+            print(f" Event stream written to '{stream_name}'")
+        print("------------------------------------------------------------")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: toy_sim.py <macro>  (interactive mode needs the real GeantSim)", file=sys.stderr)
+        sys.exit(1)
+    ToySim().execute(sys.argv[1])
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Bootstrap uncertainties for hit maps and the numbers quoted from them.
+
+A configuration (beam energy x thickness) is measured by one or more
+sub-runs: repeated runs of the same settings, the batches of consecutive
+events in a run's per-event stream (event_stream.py), or both. A bootstrap
+replicate of the merged map draws sub-runs with replacement, which is the
+same as weighting each sub-run by a multinomial count. So all replicates of
+all configurations come out of one batched product
+
+    replicates (K, R, cells) = weights (K, R, sub-runs) @ maps (K, sub-runs, cells)
+
+done in blocks of about BLOCK_BYTES. The spread over replicates gives
+per-cell error maps and percentile intervals for
+
+    total          hits in the merged map
+    hits_per_e     total hits per primary electron
+    width          RMS distance of hits from the beam axis (cells)
+    central        fraction of hits in the central cell
+
+A configuration with a single sub-run and no stream cannot be resampled. Its
+replicates are Poisson fluctuations of the one map instead (method "poisson").
+
+    python3 uncertainty.py results/ -n 2000 -o uncertainty.csv
+    python3 visualize_results.py results_2cm_1.csv --errors
+"""
+import argparse
+import json
+import os
+from collections import defaultdict
+
+import numpy as np
+
+import event_stream
+import sim_runner
+from hitmap import HitMap
+
+REPLICATES = 1000
+BATCHES = 20            # sub-runs cut from a per-event stream
+CONFIDENCE = 0.95
+BLOCK_BYTES = 64 * 1024 * 1024
+METRICS = ("total", "hits_per_e", "width", "central")
+
+
+# ==================================================
+# Sub-runs
+# ==================================================
+def stream_batches(csv_file, batches=BATCHES):
+    """
+    Hit maps of `batches` blocks of consecutive events from the run's
+    .events stream, and the events in each, or None if there is no stream.
+    """
+    path = event_stream.stream_path(csv_file)
+    if not os.path.exists(path):
+        return None
+    stream = event_stream.EventStream(path)
+    b = max(1, min(batches, stream.events))
+    sums = np.zeros(b * stream.cells, np.int64)
+    for chunk in stream.chunks():
+        batch = np.minimum(chunk["event"].astype(np.int64) * b // max(stream.events, 1), b - 1)
+        sums += np.bincount(batch * stream.cells + chunk["cell"], weights=chunk["count"],
+                            minlength=len(sums)).astype(np.int64)
+
+    maps = []
+    for row in sums.reshape(b, stream.cells):
+        cells = np.flatnonzero(row)
+        maps.append(HitMap(cells % stream.nx, cells // stream.nx, row[cells],
+                           stream.nx, stream.ny, stream.x0, stream.y0))
+    electrons = np.diff(np.arange(b + 1) * stream.events // b)
+    return maps, electrons
+
+
+def sub_runs(csv_files, batches=BATCHES):
+    """(maps, electrons) over runs of one configuration; each run's stream batches if it has one."""
+    maps, electrons = [], []
+    for csv_file in csv_files:
+        split = stream_batches(csv_file, batches)
+        if split:
+            maps.extend(split[0])
+            electrons.extend(split[1])
+            continue
+        meta = sim_runner.read_metadata(csv_file) or {}
+        maps.append(HitMap.from_csv(csv_file, meta.get("grid")))
+        try:
+            electrons.append(int(meta["electrons"]))
+        except (KeyError, TypeError, ValueError):
+            electrons.append(np.nan)
+    return maps, np.array(electrons, dtype=np.float64)
+
+
+def group_configs(files):
+    """{(energy_gev, thickness_cm, grid): [csv, ...]}; runs without metadata stay on their own."""
+    groups = defaultdict(list)
+    for csv_file in files:
+        meta = sim_runner.read_metadata(csv_file)
+        try:
+            key = (round(sim_runner.parse_quantity(meta["energy"], sim_runner.ENERGY_UNITS), 9),
+                   round(sim_runner.parse_quantity(meta["thickness"], sim_runner.LENGTH_UNITS), 9),
+                   json.dumps(meta.get("grid"), sort_keys=True))
+        except (TypeError, KeyError, ValueError):
+            key = (None, None, csv_file)
+        groups[key].append(csv_file)
+    return dict(groups)
+
+
+# ==================================================
+# Bootstrap
+# ==================================================
+def _metrics(maps, electrons, r2, central):
+    """Metric arrays (..., ) from stacked maps (..., cells) and their electrons (...)."""
+    return _metrics_from_sums(maps.sum(axis=-1), np.einsum("...c,...c->...", maps, r2),
+                              np.einsum("...c,...c->...", maps, central), electrons)
+
+
+def _metrics_from_sums(total, r2_sum, central_sum, electrons):
+    """The metrics from the cell sums they need, so maps can be summed in pieces."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "total": total,
+            "hits_per_e": total / electrons,
+            "width": np.sqrt(r2_sum / total),
+            "central": central_sum / total,
+        }
+
+
+def _summary(point, spread, alpha):
+    """{name: (value, err, lo, hi)} from point values and replicate arrays per metric."""
+    metrics = {}
+    for name in METRICS:
+        values = spread[name]
+        values = values[np.isfinite(values)]
+        if len(values) < 2:
+            metrics[name] = (float(point[name]), np.nan, np.nan, np.nan)
+            continue
+        lo, hi = np.percentile(values, [alpha, 100 - alpha])
+        metrics[name] = (float(point[name]), float(values.std(ddof=1)), float(lo), float(hi))
+    return metrics
+
+
+def bootstrap(configs, replicates=REPLICATES, confidence=CONFIDENCE, seed=None, display_bins=None):
+    """
+    Resample every configuration in `configs` (a list of (maps, electrons)
+    pairs as returned by sub_runs). With display_bins, sub-runs are
+    downsampled first, so error maps line up with HitMap.for_display().
+
+    Returns one dict per configuration: merged (HitMap), error (1-sigma per
+    stored cell of merged, in its i/j order), metrics {name: (value, err, lo,
+    hi)}, sub_runs and method.
+    """
+    rng = np.random.default_rng(seed)
+    alpha = 100 * (1 - confidence) / 2
+
+    prepared = []
+    for maps, electrons in configs:
+        if display_bins:
+            maps = [m.for_display(display_bins) for m in maps]
+        merged = maps[0].merge(*maps[1:])
+        lin = merged.j * merged.nx + merged.i       # sorted, as HitMap keeps its cells
+        stack = np.zeros((len(maps), len(lin)))
+        for k, m in enumerate(maps):
+            stack[k, np.searchsorted(lin, m.j * m.nx + m.i)] = m.hits
+        bx, by = merged.bin_size
+        x, y = merged.x(), merged.y()
+        r2 = (x + (bx - 1) / 2) ** 2 + (y + (by - 1) / 2) ** 2
+        central = ((x <= 0) & (x + bx > 0) & (y <= 0) & (y + by > 0)).astype(np.float64)
+        prepared.append((merged, stack, np.asarray(electrons, np.float64), r2, central))
+
+    results = [None] * len(prepared)
+    order = []
+    for k in sorted(range(len(prepared)), key=lambda k: prepared[k][1].shape[1]):
+        if replicates * prepared[k][1].shape[1] * 8 > BLOCK_BYTES:
+            # Too big even alone (large detectors): resample its cells in pieces
+            results[k] = _bootstrap_large(prepared[k], replicates, alpha, rng)
+        else:
+            order.append(k)
+    start = 0
+    while start < len(order):
+        # Grow the block while the replicate array stays under BLOCK_BYTES
+        stop = start + 1
+        while stop < len(order) and \
+                (stop + 1 - start) * replicates * prepared[order[stop]][1].shape[1] * 8 <= BLOCK_BYTES:
+            stop += 1
+        block = [prepared[k] for k in order[start:stop]]
+        for k, result in zip(order[start:stop], _bootstrap_block(block, replicates, alpha, rng)):
+            results[k] = result
+        start = stop
+    return results
+
+
+def _bootstrap_block(block, replicates, alpha, rng):
+    kb = len(block)
+    n = np.array([stack.shape[0] for _, stack, _, _, _ in block])
+    cells = np.array([stack.shape[1] for _, stack, _, _, _ in block])
+    n_max, c_max = int(n.max()), int(cells.max())
+
+    # Zero padding: padded sub-runs get no weight, padded cells hold no hits
+    stacks = np.zeros((kb, n_max, c_max))
+    electrons = np.zeros((kb, n_max))
+    r2 = np.zeros((kb, c_max))
+    central = np.zeros((kb, c_max))
+    for k, (_, stack, e, r, c) in enumerate(block):
+        stacks[k, :n[k], :cells[k]] = stack
+        electrons[k, :n[k]] = e
+        r2[k, :cells[k]] = r
+        central[k, :cells[k]] = c
+
+    pvals = (np.arange(n_max) < n[:, None]) / n[:, None]
+    weights = rng.multinomial(n, pvals, size=(replicates, kb)).transpose(1, 0, 2).astype(np.float64)
+    reps = weights @ stacks                                     # (kb, R, c_max)
+    rep_electrons = np.einsum("krn,kn->kr", weights, electrons)
+
+    single = np.flatnonzero(n == 1)
+    if len(single):
+        reps[single] = rng.poisson(stacks[single, :1, :], size=(len(single), replicates, c_max))
+
+    point = _metrics(stacks.sum(axis=1), electrons.sum(axis=1), r2, central)
+    spread = _metrics(reps, rep_electrons, r2[:, None, :], central[:, None, :])
+    cell_err = reps.std(axis=1, ddof=1)
+
+    for k, (merged, _, _, _, _) in enumerate(block):
+        yield {
+            "merged": merged,
+            "error": cell_err[k, :cells[k]],
+            "metrics": _summary({name: point[name][k] for name in METRICS},
+                                {name: spread[name][k] for name in METRICS}, alpha),
+            "sub_runs": int(n[k]),
+            "method": "poisson" if n[k] == 1 else "bootstrap",
+        }
+
+
+def _bootstrap_large(prepared, replicates, alpha, rng):
+    """
+    One configuration whose replicate maps exceed BLOCK_BYTES: the same
+    weights resample column blocks of its cells, and the metrics are built
+    from per-replicate sums accumulated over the blocks.
+    """
+    merged, stack, electrons, r2, central = prepared
+    n, cells = stack.shape
+    weights = rng.multinomial(n, np.full(n, 1.0 / n), size=replicates).astype(np.float64)
+    step = max(1, BLOCK_BYTES // (8 * replicates))
+
+    total = np.zeros(replicates)
+    r2_sum = np.zeros(replicates)
+    central_sum = np.zeros(replicates)
+    cell_err = np.zeros(cells)
+    for first in range(0, cells, step):
+        cols = slice(first, min(first + step, cells))
+        if n == 1:
+            reps = rng.poisson(stack[0, cols], size=(replicates, cols.stop - cols.start)).astype(np.float64)
+        else:
+            reps = weights @ stack[:, cols]
+        total += reps.sum(axis=1)
+        r2_sum += reps @ r2[cols]
+        central_sum += reps @ central[cols]
+        cell_err[cols] = reps.std(axis=0, ddof=1)
+
+    summed = stack.sum(axis=0)
+    point = _metrics(summed, electrons.sum(), r2, central)
+    spread = _metrics_from_sums(total, r2_sum, central_sum, weights @ electrons)
+    return {
+        "merged": merged,
+        "error": cell_err,
+        "metrics": _summary(point, spread, alpha),
+        "sub_runs": int(n),
+        "method": "poisson" if n == 1 else "bootstrap",
+    }
+
+
+def error_dense(result):
+    """Per-cell errors of a bootstrap result as a grid aligned with merged.to_dense()."""
+    merged = result["merged"]
+    grid = np.zeros(merged.shape)
+    grid[merged.ny - 1 - merged.j, merged.i] = result["error"]
+    return grid
+
+
+def file_uncertainty(csv_file, replicates=REPLICATES, batches=BATCHES, seed=None, display_bins=None):
+    """Bootstrap result for one run, from its event stream batches if it has them."""
+    return bootstrap([sub_runs([csv_file], batches)], replicates, seed=seed, display_bins=display_bins)[0]
+
+
+def sweep_uncertainty(files, replicates=REPLICATES, batches=BATCHES, confidence=CONFIDENCE, seed=None):
+    """One row per configuration: energy_gev, thickness_cm, files, plus the bootstrap result."""
+    groups = group_configs(files)
+    results = bootstrap([sub_runs(csvs, batches) for csvs in groups.values()],
+                        replicates, confidence, seed)
+    rows = []
+    for (energy, thickness, _), csvs, result in zip(groups, groups.values(), results):
+        rows.append(dict(result, energy_gev=energy, thickness_cm=thickness, files=csvs))
+    return sorted(rows, key=lambda r: (r["energy_gev"] is None, r["energy_gev"] or 0,
+                                       r["thickness_cm"] or 0, r["files"][0]))
+
+
+def write_csv(rows, output):
+    fields = ["energy_gev", "thickness_cm", "sub_runs", "method"]
+    for name in METRICS:
+        fields += [name, f"{name}_err", f"{name}_lo", f"{name}_hi"]
+    with open(output, "w") as f:
+        f.write(",".join(fields + ["files"]) + "\n")
+        for row in rows:
+            values = ["" if row["energy_gev"] is None else f"{row['energy_gev']:.6g}",
+                      "" if row["thickness_cm"] is None else f"{row['thickness_cm']:.6g}",
+                      str(row["sub_runs"]), row["method"]]
+            for name in METRICS:
+                values += [f"{v:.6g}" for v in row["metrics"][name]]
+            f.write(",".join(values + [";".join(row["files"])]) + "\n")
+
+
+if __name__ == "__main__":
+    from visualize_results import collect_files   # visualize_results imports this module
+
+    parser = argparse.ArgumentParser(description='Bootstrap uncertainties for hit maps and summary metrics')
+    parser.add_argument('files', nargs='*', default=['.'], help='CSV files, globs or directories (default: .)')
+    parser.add_argument('-n', '--replicates', type=int, default=REPLICATES, help='Bootstrap replicates')
+    parser.add_argument('--batches', type=int, default=BATCHES, help='Sub-runs cut from each event stream')
+    parser.add_argument('--confidence', type=float, default=CONFIDENCE, help='Interval coverage (default: 0.95)')
+    parser.add_argument('--seed', type=int, help='Random seed of the resampling')
+    parser.add_argument('-o', '--output', help='Write the table to this CSV')
+
+    args = parser.parse_args()
+
+    files = collect_files(args.files, archived=True)
+    if not files:
+        parser.exit(1, "No result files found\n")
+    rows = sweep_uncertainty(files, args.replicates, args.batches, args.confidence, args.seed)
+
+    pct = f"{100 * args.confidence:g}%"
+    print(f"{'E [GeV]':>9} {'t [cm]':>7} {'sub':>4} {'total':>20} {'hits/e':>18} {'width':>16} "
+          f"{'central':>16}   ({pct} intervals in {args.replicates} replicates)")
+    for row in rows:
+        m = row["metrics"]
+        label = (f"{row['energy_gev']:9.4g} {row['thickness_cm']:7.3g}" if row["energy_gev"] is not None
+                 else f"{os.path.basename(row['files'][0]):>17}")
+        print(f"{label} {row['sub_runs']:4d} "
+              f"{m['total'][0]:10.0f}±{m['total'][1]:<9.1f} "
+              f"{m['hits_per_e'][0]:9.4g}±{m['hits_per_e'][1]:<8.2g} "
+              f"{m['width'][0]:7.3f}±{m['width'][1]:<8.2g} "
+              f"{m['central'][0]:7.4f}±{m['central'][1]:<8.2g}")
+
+    if args.output:
+        write_csv(rows, args.output)
+        print(f"✅ Uncertainties saved to: {os.path.abspath(args.output)} ({len(rows)} configurations)")
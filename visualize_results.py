@@ -1,5 +1,22 @@
 #!/usr/bin/env python3
 import argparse
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from matplotlib.colors import LogNorm
+
+import result_store
+import sim_runner
+from hitmap import HitMap
 
 # Try importing seaborn for better aesthetics
 try:
@@ -7,49 +24,66 @@ try:
     sns_available = True
 except ImportError:
     sns_available = False
-    print("Tip: Install seaborn for prettier plots (`pip install seaborn`)")
 
-def visualize_file(filename, energy=None, electrons=None, thickness=None):
+ANNOTATE_MAX = 41   # larger grids are drawn without per-cell numbers
+DISPLAY_BINS = 400  # larger grids are aggregated to about screen resolution
+RENDER_VERSION = 1  # bump when the drawing code changes, to invalidate old SVGs
+STAMP_FILE = ".visualize_stamps.json"
+ERROR_VEIL_ALPHA = 0.7  # veil opacity for cells with 100% relative error
+
+def load_grid(filename):
+    """Read a results CSV into a dense grid (row 0 = top) plus its total hits."""
+    hm = HitMap.from_csv(filename)
+    return hm.to_dense(), hm.sum()
+
+def error_veil(data_grid, err_grid):
+    """RGBA overlay that greys out cells in proportion to their relative error (opaque-ish at 100%)."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rel = np.where(data_grid > 0, err_grid / data_grid, 0.0)
+    veil = np.zeros(data_grid.shape + (4,))
+    veil[..., :3] = 0.5
+    veil[..., 3] = np.clip(rel, 0, 1) * ERROR_VEIL_ALPHA
+    return veil
+
+def visualize_file(filename, energy=None, electrons=None, thickness=None, errors=False):
     print(f"Processing {filename}...")
     
-    # 1. Read CSV
+    # 1. Read CSV (grid layout from the run's metadata, 21x21 by default)
     try:
-        df = pd.read_csv(filename)
+        hit_map = HitMap.from_csv(filename)
     except Exception as e:
         print(f"Error reading file: {e}")
-        return
+        return None
 
-    # 2. Prepare Data Grid (21x21)
-    grid_size = 21
-    data_grid = np.zeros((grid_size, grid_size))
-    total_hits = 0
-    
-    # Coordinates -10 to 10 mapped to 0..20
-    for index, row in df.iterrows():
-        x = int(row['X'])
-        y = int(row['Y'])
-        hits = int(row['Hits'])
-        total_hits += hits
-        
-        # Row 0 is Y=10 (Top), Row 20 is Y=-10 (Bottom)
-        row_idx = 10 - y
-        col_idx = x + 10
-        
-        if 0 <= row_idx < grid_size and 0 <= col_idx < grid_size:
-            data_grid[row_idx][col_idx] = hits
+    # 2. Prepare Data Grid, aggregated to screen resolution for big detectors
+    total_hits = hit_map.sum()
+    shown = hit_map.for_display(DISPLAY_BINS)
+    data_grid = shown.to_dense()
+    grid_size = max(shown.nx, shown.ny)
+
+    # Optional bootstrap errors, binned like the displayed grid
+    err_grid, total_text = None, f"{total_hits}"
+    if errors:
+        import uncertainty   # uncertainty imports this module
+        result = uncertainty.file_uncertainty(filename, seed=0, display_bins=DISPLAY_BINS)
+        err_grid = uncertainty.error_dense(result)
+        total_text += f" ± {result['metrics']['total'][1]:.0f} ({result['method']}, {result['sub_runs']} sub-runs)"
 
     # 3. Plotting
     plt.figure(figsize=(10, 10)) # Slightly taller for text
     
     # Minimalist Theme
-    if sns_available:
+    if sns_available and grid_size <= ANNOTATE_MAX:
         sns.set_theme(style="white", font_scale=0.8)
         
         mask = (data_grid == 0)
+        annot = True
+        if err_grid is not None:
+            annot = np.vectorize(lambda v, e: f"{v:g}\n±{e:.2g}")(data_grid, err_grid)
         
         ax = sns.heatmap(data_grid, 
-                         annot=True, 
-                         fmt='g',            
+                         annot=annot, 
+                         fmt='g' if err_grid is None else '',
                          norm=LogNorm(),     
                          cmap='OrRd',        
                          mask=mask,          
@@ -62,16 +96,22 @@ def visualize_file(filename, energy=None, electrons=None, thickness=None):
         
         ax.set_facecolor('white')
         sns.despine(left=True, bottom=True)
+        if err_grid is not None:
+            ax.imshow(error_veil(data_grid, err_grid), extent=(0, shown.nx, shown.ny, 0),
+                      interpolation='nearest', zorder=3)
         
-        major_ticks = np.arange(0, grid_size, 5)
-        if grid_size-1 not in major_ticks:
-            major_ticks = np.append(major_ticks, grid_size-1)
+        x_ticks = np.arange(0, shown.nx, 5)
+        if shown.nx-1 not in x_ticks:
+            x_ticks = np.append(x_ticks, shown.nx-1)
+        y_ticks = np.arange(0, shown.ny, 5)
+        if shown.ny-1 not in y_ticks:
+            y_ticks = np.append(y_ticks, shown.ny-1)
 
-        ax.set_xticks(major_ticks + 0.5)
-        ax.set_xticklabels([str(i-10) for i in major_ticks], fontsize=9)
+        ax.set_xticks(x_ticks + 0.5)
+        ax.set_xticklabels([str(shown.x0 + i) for i in x_ticks], fontsize=9)
         
-        ax.set_yticks(major_ticks + 0.5)
-        ax.set_yticklabels([str(10-i) for i in major_ticks], rotation=0, fontsize=9)
+        ax.set_yticks(y_ticks + 0.5)
+        ax.set_yticklabels([str(shown.y0 + shown.ny - 1 - i) for i in y_ticks], rotation=0, fontsize=9)
         ax.tick_params(length=0)
         
         plt.xlabel("X Position", fontsize=10, labelpad=15, color="#555555")
@@ -79,7 +119,7 @@ def visualize_file(filename, energy=None, electrons=None, thickness=None):
         
         # Build Title/Subtitle
         title_text = "Electro-Magnetic Shower Distribution"
-        subtitle_text = f"File: {filename}\nTotal Hits: {total_hits}"
+        subtitle_text = f"File: {filename}\nTotal Hits: {total_text}"
         
         if energy or electrons or thickness:
             details = []
@@ -92,24 +132,161 @@ def visualize_file(filename, energy=None, electrons=None, thickness=None):
         plt.title(subtitle_text, fontsize=10, color="#666666", pad=10)
         
     else:
-        plt.imshow(data_grid, cmap='OrRd', interpolation='nearest', norm=LogNorm())
+        plt.imshow(np.ma.masked_equal(data_grid, 0), cmap='OrRd', interpolation='nearest',
+                   norm=LogNorm(), extent=shown.extent())
         plt.colorbar(label='Hits (Log Scale)')
-        plt.title(f"Detector Hits: {filename}\nTotal: {total_hits}")
+        if err_grid is not None:
+            plt.imshow(error_veil(data_grid, err_grid), interpolation='nearest', extent=shown.extent())
+        title = f"Detector Hits: {filename}\nTotal: {total_text}"
+        if shown is not hit_map:
+            title += f" | {hit_map.nx}x{hit_map.ny} cells shown in {shown.bin_size[0]}x{shown.bin_size[1]} bins"
+        if err_grid is not None:
+            title += "\nGrey veil: relative bootstrap error"
+        plt.title(title)
 
     # 4. Save
-    output_filename = filename.replace('.csv', '.svg')
+    output_filename = os.path.splitext(filename)[0] + '.svg'
     plt.savefig(output_filename, format='svg', bbox_inches='tight', transparent=False)
     plt.close()
     
     print(f"✅ Visualization saved to: {output_filename}")
+    return output_filename
+
+# ==================================================
+# Batch mode
+# ==================================================
+def collect_files(patterns, archived=False):
+    """
+    Expand files, run IDs, globs and directories into a sorted, de-duplicated
+    CSV list. With archived=True, directories and globs also match runs moved
+    into the result_store archive.
+    """
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            files.extend(glob.glob(os.path.join(pattern, "results_*.csv")))
+        elif any(ch in pattern for ch in "*?["):
+            files.extend(glob.glob(pattern))
+        elif os.path.exists(pattern):
+            files.append(pattern)
+            continue
+        else:
+            # Bare run IDs name their CSV, which may only exist in the archive
+            _, run_id, ext = result_store.split_ref(pattern)
+            files.append(os.path.join(os.path.dirname(pattern), run_id + ext))
+            continue
+        if archived:
+            files.extend(result_store.archived_paths(pattern))
+    return sorted(set(files))
+
+def render_settings(filename, energy=None, electrons=None, thickness=None, errors=False):
+    """Everything besides the CSV itself that changes the picture, hashed."""
+    meta = sim_runner.read_metadata(filename) or {}
+    settings = {
+        "version": RENDER_VERSION,
+        "annotate_max": ANNOTATE_MAX,
+        "display_bins": DISPLAY_BINS,
+        "seaborn": sns_available,
+        "labels": [energy, electrons, thickness],
+        "grid": meta.get("grid"),
+        "errors": errors,
+    }
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+
+def _stamp_path(filename):
+    return os.path.join(os.path.dirname(os.path.abspath(filename)), STAMP_FILE)
+
+def _load_stamps(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_stamps(path, entries):
+    """Merge entries into the stamp file under a lock, so concurrent renderers keep each other's stamps."""
+    with open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        merged = _load_stamps(path)
+        merged.update(entries)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(merged, f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+
+def is_up_to_date(filename, settings, stamps):
+    """Like make: the SVG is newer than the CSV and was drawn with the same settings."""
+    svg = os.path.splitext(filename)[0] + '.svg'
+    if not os.path.exists(svg) or os.path.getmtime(svg) < result_store.getmtime(filename):
+        return False
+    return stamps.get(os.path.basename(svg)) == settings
+
+def _render_one(job):
+    filename, energy, electrons, thickness, errors = job
+    try:
+        return filename, visualize_file(filename, energy, electrons, thickness, errors)
+    except Exception as e:
+        print(f"Error rendering {filename}: {e}")
+        return filename, None
+
+def visualize_batch(files, energy=None, electrons=None, thickness=None, workers=None, force=False,
+                    errors=False):
+    """Render many CSVs across a process pool, skipping up-to-date SVGs."""
+    start = time.time()
+    stamps, fresh = {}, {}
+    jobs, settings, skipped = [], {}, 0
+
+    for filename in files:
+        stamp_path = _stamp_path(filename)
+        if stamp_path not in stamps:
+            stamps[stamp_path] = _load_stamps(stamp_path)
+        settings[filename] = render_settings(filename, energy, electrons, thickness, errors)
+        if not force and is_up_to_date(filename, settings[filename], stamps[stamp_path]):
+            skipped += 1
+            continue
+        jobs.append((filename, energy, electrons, thickness, errors))
+
+    rendered, failed = 0, 0
+    if len(jobs) == 1 or workers == 1:
+        results = map(_render_one, jobs)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        results = pool.map(_render_one, jobs, chunksize=max(1, len(jobs) // (4 * (os.cpu_count() or 1))))
+    try:
+        for filename, output in results:
+            if output:
+                rendered += 1
+                fresh.setdefault(_stamp_path(filename), {})[os.path.basename(output)] = settings[filename]
+            else:
+                failed += 1
+    finally:
+        if pool:
+            pool.shutdown()
+
+    for stamp_path, entries in fresh.items():
+        _save_stamps(stamp_path, entries)
+
+    elapsed = time.time() - start
+    rate = rendered / elapsed if elapsed > 0 else 0.0
+    print(f"📊 {rendered} rendered, {skipped} up to date, {failed} failed "
+          f"in {elapsed:.1f} s ({rate:.1f} files/s)")
+    return rendered, skipped, failed
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Visualize Geant4 Simulation Results')
-    parser.add_argument('file', help='Path to CSV file')
+    parser.add_argument('files', nargs='+', help='CSV files, directories or globs')
     parser.add_argument('--energy', help='Beam Energy')
     parser.add_argument('--electrons', help='Number of Electrons')
     parser.add_argument('--thickness', help='Lead Thickness')
+    parser.add_argument('--workers', type=int, default=None, help='Render processes (default: all cores)')
+    parser.add_argument('--force', action='store_true', help='Re-render even if the SVG is up to date')
+    parser.add_argument('--errors', action='store_true',
+                        help="Overlay bootstrap errors (from the run's event stream, else Poisson)")
     
     args = parser.parse_args()
-    
-    visualize_file(args.file, args.energy, args.electrons, args.thickness)
+
+    if not sns_available:
+        print("Tip: Install seaborn for prettier plots (`pip install seaborn`)")
+    visualize_batch(collect_files(args.files), args.energy, args.electrons, args.thickness,
+                    workers=args.workers, force=args.force, errors=args.errors)